@@ -1,31 +1,84 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
+from pymongo.errors import PyMongoError, WaitQueueTimeoutError
 from config import Config
-from db import mongo
+from db import init_mongo, mongo
+from repositories import store
+from utils import live, metrics, migrations, revisions, vaccinations
+from utils.hashing import hasher
+from utils.jobs import runner
+from utils.serialization import MongoJSONProvider
+
+def pool_exhausted(error):
+    # Every pooled connection stayed busy for MONGO_WAIT_QUEUE_TIMEOUT_MS
+    response = jsonify(msg="Server is busy, please retry shortly")
+    response.headers["Retry-After"] = "1"
+    return response, 503
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
-    mongo.init_app(app)
+    # Every command is timed and attributed to the request that issued it; pools are tracked per server
+    init_mongo(app, event_listeners=[metrics.command_metrics, metrics.pool_stats])
+    # After init_app, which installs flask_pymongo's own (json_util-based) provider
+    app.json = MongoJSONProvider(app)
+    store.init_app(app)
+    use_mongo = app.config["STORAGE_BACKEND"] == "mongo"
+    migrations.init_app(app, mongo)
+    if use_mongo and app.config["MONGO_AUTO_MIGRATE"]:
+        try:
+            # Never wait on another process's claim: a worker blocked in create_app would be killed by its timeout
+            migrations.apply_migrations(mongo.db, wait_seconds=0)
+        except (PyMongoError, migrations.MigrationInProgress) as e:
+            app.logger.warning("Skipping startup migrations: %s", e)
+    metrics.init_app(app)
+    revisions.init_app(app)
+    live.broadcaster.init_app(app)
     JWTManager(app)
-    CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
+    hasher.init_app(app)
+    runner.init_app(app)
+    if use_mongo:
+        # The job queue lives in Mongo; other backends have no background jobs
+        runner.every("complete_past_drives", app.config["DRIVE_COMPLETION_INTERVAL"], vaccinations.complete_past_drives)
+        runner.every("purge_jobs", 3600, runner.purge)
+    app.register_error_handler(WaitQueueTimeoutError, pool_exhausted)
+    CORS(app, resources={r"/*": {"origins": app.config["CORS_ORIGINS"]}},
+         expose_headers=app.config["CORS_EXPOSE_HEADERS"])
 
     # Import and register routes
     from routes.auth import auth_bp
     from routes.admin_routes import admin_bp
     from routes.drives import drive_bp
     from routes.dashboard import dashboard_bp
+    from routes.reports import reports_bp
+    from routes.jobs import jobs_bp
+    from routes.metrics import metrics_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(drive_bp)
     app.register_blueprint(dashboard_bp)
+    app.register_blueprint(reports_bp)
+    if use_mongo:
+        app.register_blueprint(jobs_bp)
+    app.register_blueprint(metrics_bp)
+
+    # Job handlers are registered by the route modules above. Only a process that serves requests
+    # starts polling, on its first one: CLI commands, seed and benchmarks build the app too
+    if use_mongo and app.config["JOB_RUNNER_ENABLED"]:
+        app.before_request(runner.start)
     return app
 
-app = create_app()
+def __getattr__(name):
+    # `app:app` (gunicorn, flask run) and `from app import app` build the app on first access;
+    # importing create_app alone (tests, benchmarks, seed) doesn't pay for it
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
 
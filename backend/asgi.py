@@ -0,0 +1,283 @@
+"""
+Async (ASGI) entry point:
+
+    pip install -r requirements-async.txt
+    uvicorn asgi:app --workers 4
+
+The high-traffic read routes (student list, drive lists, analytics) run natively
+on the event loop over pymongo's AsyncMongoClient, so one process can keep
+hundreds of requests in flight while they wait on Mongo. Every other route is
+served by the regular Flask app through a WSGI bridge, so both modes expose the
+same API. Query parsing, role checks, analytics shaping and JSON encoding are
+shared with the Flask blueprints. With STORAGE_BACKEND other than mongo every
+route goes to the Flask app.
+"""
+import asyncio
+import contextlib
+import time
+from functools import wraps
+import jwt
+from a2wsgi import WSGIMiddleware
+from flask_jwt_extended.exceptions import JWTExtendedException, NoAuthorizationError
+from pymongo import AsyncMongoClient
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from app import app as flask_app
+from db import client_options, read_preference
+from routes.admin_routes import STUDENT_PROJECTION
+from routes.drives import DRIVE_PROJECTION
+from utils import analytics, revisions, stats
+from utils.decorators import cached_identity, verified_claims
+from utils.jobs import runner
+from utils.metrics import command_metrics, observe_request
+from utils.pagination import (QueryError, keyset_query, parse_cursor, parse_limit,
+                              projection_from_args, split_page, student_filter)
+from utils.serialization import dumps, dumps_bytes
+
+config = flask_app.config
+
+
+def json_response(data, status_code=200, headers=None):
+    return Response(dumps_bytes(data), status_code=status_code, media_type="application/json", headers=headers)
+
+
+def authorize(request, required_role):
+    """Return an error response, or None when the bearer token carries the required role."""
+    try:
+        claims = verified_claims(flask_app, request.headers.items())
+    except NoAuthorizationError as e:
+        return json_response({"msg": str(e)}, 401)
+    except jwt.ExpiredSignatureError:
+        return json_response({"msg": "Token has expired"}, 401)
+    except (jwt.InvalidTokenError, JWTExtendedException) as e:
+        return json_response({"msg": str(e)}, 422)
+    try:
+        identity = cached_identity(claims, config["JWT_ACCESS_TOKEN_EXPIRES"])
+    except (ValueError, KeyError, TypeError):
+        return json_response({"msg": "Invalid token structure"}, 400)
+    if required_role and identity["role"] != required_role:
+        return json_response({"msg": "Access forbidden: Role mismatch"}, 403)
+    return None
+
+
+def timed(endpoint, handler):
+    """
+    Record a native route in the request metrics under the Flask endpoint it replaces,
+    as utils.metrics does for requests served by the Flask app.
+    """
+    blueprint = endpoint.partition(".")[0] if "." in endpoint else "app"
+
+    @wraps(handler)
+    async def wrapper(request):
+        started = time.perf_counter()
+        command_metrics.begin_request()
+        status, size = 500, 0
+        try:
+            response = await handler(request)
+            status = response.status_code
+            size = None if isinstance(response, StreamingResponse) else len(response.body)
+            return response
+        finally:
+            observe_request(time.perf_counter() - started, blueprint, endpoint, request.method, status, size)
+    return wrapper
+
+
+def native_route(path, handler):
+    endpoint, _ = flask_app.url_map.bind("").match(path, "GET")
+    return Route(path, timed(endpoint, handler), methods=["GET"])
+
+
+def role_required(required_role):
+    """
+    The async counterpart of jwt_required() + utils.decorators.role_required. It also
+    adds the CORS headers flask_cors would; preflights fall through to the Flask app.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            response = authorize(request, required_role) or await handler(request)
+            origin = request.headers.get("origin")
+            if origin and origin in config["CORS_ORIGINS"]:
+                response.headers["Access-Control-Allow-Origin"] = origin
+                response.headers["Access-Control-Expose-Headers"] = ", ".join(config["CORS_EXPOSE_HEADERS"])
+                response.headers.add_vary_header("Origin")
+            return response
+        return wrapper
+    return decorator
+
+
+@role_required("admin")
+async def list_students(request):
+    db = request.app.state.analytics_db
+    stream = request.query_params.get("format") == "ndjson"
+    try:
+        projection = projection_from_args(request.query_params, STUDENT_PROJECTION)
+        query = student_filter(request.query_params)
+        after = parse_cursor(request.query_params.get("after"))
+        if stream:
+            limit = parse_limit(request.query_params.get("limit"), default=None, maximum=None)
+        else:
+            limit = parse_limit(request.query_params.get("limit"))
+    except QueryError as e:
+        return json_response({"msg": str(e)}, 400)
+
+    if stream:
+        cursor = db.students.find(keyset_query(query, after), projection).sort("_id", 1).batch_size(500)
+        if limit:
+            cursor = cursor.limit(limit)
+
+        async def generate():
+            async for student in cursor:
+                yield dumps(student) + "\n"
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    cursor = db.students.find(keyset_query(query, after), projection).sort("_id", 1).limit(limit + 1)
+    students, next_cursor = split_page(await cursor.to_list(), limit)
+    return json_response(students, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+
+def accepts_gzip(accept_encoding):
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        if coding.strip() in ("gzip", "*"):
+            name, _, quality = params.partition("=")
+            try:
+                return name.strip() != "q" or float(quality) > 0
+            except ValueError:
+                return True
+    return False
+
+
+def conditional(collection):
+    """The async counterpart of utils.revisions.conditional, sharing its revisions and body cache."""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            # The revision is usually known in-process; only a stale one costs a (threaded) lookup
+            revision = revisions.cached_revision(collection) or await asyncio.to_thread(revisions.current, collection)
+            key = revisions.request_key(f"asgi.{handler.__name__}", None, request.query_params.multi_items())
+            use_gzip = accepts_gzip(request.headers.get("accept-encoding", ""))
+            tag = revisions.etag(revision, key, "gzip" if use_gzip else None)
+            headers = revisions.validator_headers(tag)
+            if revisions.matches(request.headers.get("if-none-match"), tag):
+                return Response(status_code=304, headers=headers)
+
+            entry = revisions.response_cache.get((revision, key))
+            if entry is None:
+                response = await handler(request)
+                if response.status_code != 200:
+                    return response
+                entry = revisions.representation(response.body, response.media_type)
+                revisions.response_cache.set((revision, key), entry)
+            if use_gzip:
+                headers["Content-Encoding"] = "gzip"
+            return Response(entry["gzip"] if use_gzip else entry["body"], media_type=entry["mimetype"], headers=headers)
+        return wrapper
+    return decorator
+
+
+@role_required(None)
+@conditional(revisions.DRIVES)
+async def list_drives(request):
+    try:
+        projection = projection_from_args(request.query_params, DRIVE_PROJECTION)
+    except QueryError as e:
+        return json_response({"msg": str(e)}, 400)
+    drives = await request.app.state.db.vaccination_drives.find({}, projection).to_list()
+    return json_response(drives)
+
+
+@role_required("admin")
+@conditional(revisions.DRIVES)
+async def get_vaccination_drives(request):
+    cursor = await request.app.state.db.vaccination_drives.aggregate([
+        {"$project": {"vaccine_name": 1, "date": 1, "is_completed": {"$ifNull": ["$is_completed", False]}}}
+    ])
+    return json_response(await cursor.to_list())
+
+
+@role_required("admin")
+@conditional(revisions.DRIVES)
+async def get_drives_by_class(request):
+    class_grade = request.query_params.get("class_grade")
+    if not class_grade:
+        return json_response({"msg": "Class grade is required"}, 400)
+    drives = await request.app.state.db.vaccination_drives.find({"classes": class_grade}, DRIVE_PROJECTION).to_list()
+    return json_response(drives)
+
+
+async def get_summary(db):
+    """analytics.get_summary() over the async client, sharing the same cache."""
+    key, today = analytics.cache_key()
+    summary = analytics.analytics_cache.get(key)
+    if summary is None:
+        cursor = await db.vaccination_drives.aggregate(analytics.drives_pipeline())
+        raw = await cursor.next()
+        raw["upcoming_drives"] = await db.vaccination_drives.find(
+            analytics.upcoming_query(today), DRIVE_PROJECTION
+        ).sort("date", 1).to_list()
+        doc = await db.stats.find_one({"_id": stats.STUDENTS})
+        # A missing counters document is rebuilt once by the sync code path
+        counters = stats.shape(doc) if doc else await asyncio.to_thread(stats.read)
+        summary = analytics.shape_summary(counters, raw)
+        analytics.analytics_cache.set(key, summary, config.get("ANALYTICS_CACHE_TTL"))
+    return summary
+
+
+@role_required("admin")
+async def get_analytics(request):
+    return json_response(analytics.admin_view(await get_summary(request.app.state.analytics_db)))
+
+
+@role_required("admin")
+async def dashboard_data(request):
+    return json_response(analytics.dashboard_view(await get_summary(request.app.state.analytics_db)))
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    if not NATIVE_ROUTES:
+        yield
+        return
+    if config["JOB_RUNNER_ENABLED"]:
+        runner.start()  # Native routes bypass the Flask app, whose first request would start it
+    # Timeouts, read/write concerns and compressors as for the sync client; the pool is sized separately
+    client = AsyncMongoClient(
+        config["MONGO_URI"],
+        maxPoolSize=config["ASYNC_MONGO_MAX_POOL_SIZE"],
+        minPoolSize=config["ASYNC_MONGO_MIN_POOL_SIZE"],
+        maxConnecting=config["ASYNC_MONGO_MAX_CONNECTING"],
+        event_listeners=[command_metrics],
+        **client_options(config, pool=False)
+    )
+    app.state.db = client.get_default_database()
+    # Analytics and the student list may read from secondaries, as in the Flask routes
+    app.state.analytics_db = app.state.db.with_options(read_preference=read_preference(
+        config["MONGO_ANALYTICS_READ_PREFERENCE"], config["MONGO_ANALYTICS_MAX_STALENESS"]
+    ))
+    try:
+        yield
+    finally:
+        await client.close()
+
+
+# The native routes talk to Mongo directly
+NATIVE_ROUTES = [
+    native_route("/students", list_students),
+    native_route("/drives/", list_drives),
+    native_route("/drives/vaccination_drives", get_vaccination_drives),
+    native_route("/drives/by-class", get_drives_by_class),
+    native_route("/analytics", get_analytics),
+    native_route("/analytics/analytics", dashboard_data),
+] if config["STORAGE_BACKEND"] == "mongo" else []
+
+app = Starlette(
+    routes=[
+        *NATIVE_ROUTES,
+        # Writes and everything else go to the Flask blueprints
+        Mount("/", WSGIMiddleware(flask_app))
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,48 @@
+"""
+Benchmark and stress scripts. Run them from the backend directory, e.g.
+
+    python -m bench.stress_vaccinate --students 500 --doses 300
+
+They target MONGO_URI (a throwaway local mongod) unless --mongomock is given;
+bench.run can also target a scratch SQLite file with --storage sqlite.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def make_app(use_mongomock=False, database="vaccination_portal_bench", storage="mongo"):
+    """Build the app against a scratch database so benchmarks never touch real data."""
+    os.environ.setdefault("MONGO_AUTO_MIGRATE", "false")
+    os.environ.setdefault("JOB_RUNNER_ENABLED", "false")
+    from app import create_app
+    from config import Config
+    from db import mongo
+    from utils.jobs import runner
+    from utils.migrations import apply_migrations
+
+    Config.STORAGE_BACKEND = storage
+    if storage == "sqlite":
+        Config.SQLITE_PATH = os.path.join(tempfile.gettempdir(), f"{database}.db")
+        return create_app()
+    app = create_app()
+    if use_mongomock:
+        import mongomock
+        mongo.cx = mongomock.MongoClient()
+    mongo.db = mongo.cx[database]
+    if not use_mongomock:
+        apply_migrations(mongo.db)
+    runner.start()  # Only now, so it polls the scratch database
+    return app
+
+
+def admin_headers(app):
+    from routes.auth import create_token
+
+    with app.app_context():
+        token = create_token({"username": "bench-admin", "role": "admin"})
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,109 @@
+"""
+Synthetic data for benchmarks: N students across M classes, K drives and a few users,
+bulk-loaded through the storage backend (store.import_rows) into the bench database.
+
+    python -m bench.datagen --students 100000 --classes 48 --drives 24
+
+Data is deterministic for a given --seed, so runs are comparable.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from bench import make_app
+
+FIRST = ["aarav", "aditi", "arjun", "diya", "ishaan", "kavya", "meera", "nikhil", "priya", "rohan",
+         "saanvi", "tara", "vihaan", "zara", "john", "joanna", "jonas", "maria", "omar", "yuki"]
+LAST = ["sharma", "patel", "iyer", "khan", "singh", "das", "reddy", "smith", "garcia", "tanaka"]
+VACCINES = ["Covaxin", "Covishield", "MMR", "Polio", "Hepatitis B"]
+BENCH_PASSWORD = "bench-password"
+
+
+def class_names(count):
+    sections = "ABCD"
+    return [f"{index // len(sections) + 1}{sections[index % len(sections)]}" for index in range(count)]
+
+
+def generate_students(count, classes, vaccinated_ratio=0.6, seed=7):
+    from utils.schema import search_name
+
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    for index in range(count):
+        username = f"{rng.choice(FIRST).title()} {rng.choice(LAST).title()} {index}"
+        vaccinated = rng.random() < vaccinated_ratio
+        yield {
+            "username": username,
+            "username_lower": search_name(username),
+            "class_grade": rng.choice(classes),
+            "student_id": f"S{index:07d}",
+            "is_vaccinated": vaccinated,
+            "vaccine_name": rng.choice(VACCINES) if vaccinated else None,
+            "date_of_vaccination": start + timedelta(days=rng.randrange(365)) if vaccinated else None,
+        }
+
+
+def generate_drives(count, classes, students, seed=7):
+    """About a third of the drives are past and completed; the rest are open and 30-180 days out."""
+    rng = random.Random(seed)
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    doses = max(students // max(count, 1), 50)
+    for index in range(count):
+        past = index % 3 == 0
+        date = today - timedelta(days=rng.randrange(30, 365)) if past else today + timedelta(days=rng.randrange(30, 180))
+        yield {
+            "vaccine_name": VACCINES[index % len(VACCINES)],
+            "date": date,
+            "available_doses": rng.randrange(doses, doses * 2),
+            "classes": rng.sample(classes, min(len(classes), rng.randrange(1, 6))),
+            "is_completed": past,
+            "registered_students": [],
+        }
+
+
+def load(students=10000, classes=48, drives=24, vaccinated_ratio=0.6, seed=7, reset=True):
+    """Replace the bench data and return load timings; needs an app context for the SQLite backend."""
+    from werkzeug.security import generate_password_hash
+    from repositories import store
+    from utils import revisions
+
+    names = class_names(classes)
+    if reset:
+        store.reset()
+    timings = {}
+
+    started = time.perf_counter()
+    store.import_rows("students", generate_students(students, names, vaccinated_ratio, seed), dict)
+    timings["students_seconds"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    store.import_rows("vaccination_drives", generate_drives(drives, names, students, seed), dict)
+    password = generate_password_hash(BENCH_PASSWORD)
+    store.import_rows("users", [
+        {"username": "bench-admin", "password": password, "role": "admin"},
+        {"username": "bench-user", "password": password, "role": "user"},
+    ], dict)
+    timings["drives_users_seconds"] = round(time.perf_counter() - started, 3)
+    # Servers already running on this database must not keep serving cached drive listings and rosters
+    revisions.bump(revisions.STUDENTS)
+    revisions.bump(revisions.DRIVES)
+    return {"students": students, "classes": classes, "drives": drives, **timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--classes", type=int, default=48)
+    parser.add_argument("--drives", type=int, default=24)
+    parser.add_argument("--vaccinated-ratio", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--mongomock", action="store_true")
+    parser.add_argument("--storage", choices=["mongo", "sqlite"], default="mongo")
+    args = parser.parse_args()
+
+    with make_app(args.mongomock, storage=args.storage).app_context():
+        print(load(args.students, args.classes, args.drives, args.vaccinated_ratio, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Microbenchmark for role_required: the previous implementation (json.loads of the
+identity string on every request) against the claims-based decorator with the
+jti-keyed identity cache. jwt_required's own verification runs once up front and
+is excluded, so the numbers are the decorator's overhead alone.
+"""
+import argparse
+import json
+import timeit
+from functools import wraps
+from flask import jsonify
+from flask_jwt_extended import create_access_token, get_jwt_identity, verify_jwt_in_request
+from bench import make_app
+
+
+def legacy_role_required(required_role):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            identity = get_jwt_identity()
+            try:
+                identity_dict = json.loads(identity)
+                if identity_dict['role'] != required_role:
+                    return jsonify(msg="Access forbidden: Role mismatch"), 403
+            except (json.JSONDecodeError, KeyError):
+                return jsonify(msg="Invalid token structure"), 400
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def view():
+    return None
+
+
+def measure(app, token, decorated, number):
+    with app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+        verify_jwt_in_request()
+        decorated()  # warm the identity cache
+        seconds = min(timeit.repeat(decorated, number=number, repeat=5))
+    return seconds / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    app = make_app(use_mongomock=True)
+    from utils.decorators import role_required
+
+    with app.app_context():
+        legacy_token = create_access_token(identity=json.dumps({"username": "bench-admin", "role": "admin"}))
+        claims_token = create_access_token(identity="bench-admin", additional_claims={"role": "admin"})
+
+    before = measure(app, legacy_token, legacy_role_required("admin")(view), args.number)
+    after = measure(app, claims_token, role_required("admin")(view), args.number)
+    print(f"before (json.loads per request): {before:.2f} us/call")
+    print(f"after  (claims + identity cache): {after:.2f} us/call")
+    print(f"speedup: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Cold-start budget: time `import app` with `python -X importtime` in fresh interpreters,
+plus create_app(), and fail when the median exceeds the budget.
+
+    python -m bench.import_time --budget-ms 400
+    python -m bench.import_time --module asgi --budget-ms 600 --top 20
+
+It measures the shipped defaults. create_app() opens no connection: the Mongo client
+connects lazily, migrations are a deploy step and the job runner starts on the first request.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from bench import BACKEND_DIR
+
+CREATE_SNIPPET = (
+    "import time; started = time.perf_counter(); import app; imported = time.perf_counter(); "
+    "app.create_app(); print(imported - started, time.perf_counter() - imported)"
+)
+
+
+def run(args):
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, cwd=BACKEND_DIR,
+                          check=True)
+
+
+def parse_importtime(stderr):
+    """[(name, depth, self_us, cumulative_us)] from the -X importtime report."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return entries
+
+
+def measure_import(module):
+    entries = parse_importtime(run(["-X", "importtime", "-c", f"import {module}"]).stderr)
+    total = next(cumulative for name, depth, _, cumulative in entries if name == module and depth == 0)
+    return total / 1000, entries
+
+
+def heaviest(entries, module, top):
+    """The packages `module` pulled in directly, by cumulative time."""
+    children, inside = [], False
+    # -X importtime prints children before their parent, so walk backwards from the module
+    for name, depth, _, cumulative in reversed(entries):
+        if name == module and depth == 0:
+            inside = True
+        elif inside and depth == 0:
+            break
+        elif inside and depth == 1:
+            children.append((cumulative / 1000, name))
+    return sorted(children, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app", help="entry point to import (app or asgi)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=400, help="median import time allowed")
+    parser.add_argument("--create-budget-ms", type=float, default=100, help="median create_app() time allowed")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    imports, entries = [], []
+    for _ in range(args.runs):
+        milliseconds, entries = measure_import(args.module)
+        imports.append(milliseconds)
+    creates = [float(run(["-c", CREATE_SNIPPET]).stdout.split()[1]) * 1000 for _ in range(args.runs)]
+    import_ms, create_ms = statistics.median(imports), statistics.median(creates)
+
+    print(f"import {args.module}: median {import_ms:.1f} ms (budget {args.budget_ms:.0f} ms), "
+          f"min {min(imports):.1f} ms over {args.runs} runs")
+    print(f"create_app(): median {create_ms:.1f} ms (budget {args.create_budget_ms:.0f} ms)")
+    print(f"heaviest imports of {args.module} (last run):")
+    for milliseconds, name in heaviest(entries, args.module, args.top):
+        print(f"  {milliseconds:8.1f} ms  {name}")
+
+    over = import_ms > args.budget_ms or create_ms > args.create_budget_ms
+    if over:
+        print("OVER BUDGET", file=sys.stderr)
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Load test comparing the sync (Flask/WSGI) and async (ASGI) entry points over real HTTP.
+
+Start both against the same local mongod, e.g.
+
+    gunicorn -w 4 -b :5000 app:app
+    uvicorn asgi:app --workers 4 --port 8000
+
+then run
+
+    python -m bench.load_compare --sync http://localhost:5000 --async http://localhost:8000 --concurrency 200
+
+Each mode gets the same mix of dashboard and drive-list requests for the same duration.
+"""
+import argparse
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from bench import admin_headers, make_app
+
+PATHS = [
+    "/analytics/analytics",
+    "/analytics",
+    "/drives/",
+    "/drives/vaccination_drives",
+    "/students?limit=50",
+]
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run(base_url, headers, concurrency, duration):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(offset):
+        nonlocal errors
+        index = offset
+        while time.perf_counter() < deadline:
+            request = urllib.request.Request(base_url + PATHS[index % len(PATHS)], headers=headers)
+            index += 1
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / duration, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sync", dest="sync_url", default="http://localhost:5000")
+    parser.add_argument("--async", dest="async_url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args()
+
+    headers = admin_headers(make_app(use_mongomock=True))
+    for label, url in (("sync", args.sync_url), ("async", args.async_url)):
+        print(label, run(url, headers, args.concurrency, args.duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Run every route scenario (bench/scenarios.py) and record latency percentiles and throughput.
+
+In-process through Flask's test client, against a local mongod or mongomock:
+
+    python -m bench.run --students 20000 --iterations 200 --output results/baseline.json
+    python -m bench.run --mongomock --students 2000 --iterations 50
+
+The same scenarios against the SQLite storage backend (a scratch file in the temp directory),
+then compared with the Mongo run:
+
+    python -m bench.run --storage sqlite --students 20000 --iterations 200 --output results/sqlite.json
+    python -m bench.run --compare results/baseline.json results/sqlite.json
+
+Over real HTTP against a running server that uses the bench database
+(MONGO_URI=mongodb://localhost:27017/vaccination_portal_bench):
+
+    python -m bench.run --http http://localhost:5000 --concurrency 16 --output results/http.json
+
+Compare two result files; exits 1 when any scenario's p95 or throughput regressed by
+more than --threshold:
+
+    python -m bench.run --compare results/baseline.json results/candidate.json --threshold 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from bench import admin_headers, datagen, make_app
+from bench.scenarios import SCENARIOS, Context, Skip
+
+
+class ClientTransport:
+    """Flask's test client: no sockets, so results isolate the app and database cost."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def send(self, method, path, headers, json_body=None, files=None):
+        data = None
+        if files:
+            data = {field: (stream, filename) for field, (filename, stream) in files.items()}
+        response = self.client.open(path, method=method, headers=headers, json=json_body, data=data)
+        return response.status_code, len(response.get_data())
+
+
+class HttpTransport:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def send(self, method, path, headers, json_body=None, files=None):
+        headers = dict(headers)
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif files:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for field, (filename, stream) in files.items():
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                             f"Content-Type: text/csv\r\n\r\n".encode() + stream.read() + b"\r\n")
+            body = b"".join(parts) + f"--{boundary}--\r\n".encode()
+            headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run_scenario(transport, ctx, headers, builder, expected, iterations, concurrency):
+    latencies, statuses, sizes, skipped = [], {}, 0, 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal sizes, skipped
+        with lock:
+            # Builders share the context's random state and pools
+            try:
+                method, path, options = builder(ctx)
+            except Skip:
+                skipped += 1
+                return
+        request_headers = headers if options.get("auth", True) else {}
+        started = time.perf_counter()
+        status, size = transport.send(method, path, request_headers, options.get("json"), options.get("files"))
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+            sizes += size
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(one, range(iterations)))
+    else:
+        for index in range(iterations):
+            one(index)
+    wall = time.perf_counter() - started
+
+    result = {
+        "requests": len(latencies),
+        "skipped": skipped,
+        "errors": sum(count for status, count in statuses.items() if status not in expected),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+    if latencies:
+        ordered = sorted(latencies)
+        result.update(
+            p50_ms=round(percentile(ordered, 0.50) * 1000, 3),
+            p95_ms=round(percentile(ordered, 0.95) * 1000, 3),
+            p99_ms=round(percentile(ordered, 0.99) * 1000, 3),
+            mean_ms=round(sum(ordered) / len(ordered) * 1000, 3),
+            throughput_rps=round(len(latencies) / wall, 1),
+            mean_bytes=round(sizes / len(latencies)),
+        )
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    app = make_app(args.mongomock, storage=args.storage)
+    # The SQLite backend's engine belongs to the app; requests push their own contexts on top
+    app.app_context().push()
+    if not args.no_load:
+        print("loading", datagen.load(args.students, args.classes, args.drives), file=sys.stderr)
+    headers = admin_headers(app)
+    transport = HttpTransport(args.http) if args.http else ClientTransport(app)
+    ctx = Context()
+
+    results = {}
+    for name, builder, expected, scale in SCENARIOS:
+        if args.only and not any(name.startswith(prefix) for prefix in args.only):
+            continue
+        iterations = max(int(args.iterations * scale), 1)
+        results[name] = run_scenario(transport, ctx, headers, builder, expected, iterations, args.concurrency)
+        summary = results[name]
+        print(f"{name:36} p50={summary.get('p50_ms')}ms p95={summary.get('p95_ms')}ms "
+              f"p99={summary.get('p99_ms')}ms rps={summary.get('throughput_rps')} errors={summary['errors']}",
+              file=sys.stderr)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "transport": "http" if args.http else "test_client",
+            "base_url": args.http,
+            "database": "sqlite" if args.storage == "sqlite" else "mongomock" if args.mongomock else "mongod",
+            "students": args.students,
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+def compare(baseline_path, candidate_path, threshold):
+    """Print per-scenario deltas and return the number of regressions."""
+    with open(baseline_path) as file:
+        baseline = json.load(file)["results"]
+    with open(candidate_path) as file:
+        candidate = json.load(file)["results"]
+    regressions = 0
+    print(f"{'scenario':36} {'p95 before':>11} {'p95 after':>10} {'change':>8} {'rps change':>10}")
+    for name in sorted(set(baseline) & set(candidate)):
+        before, after = baseline[name], candidate[name]
+        if "p95_ms" not in before or "p95_ms" not in after:
+            continue
+        p95_change = after["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rps_change = after["throughput_rps"] / before["throughput_rps"] - 1 if before["throughput_rps"] else 0.0
+        regressed = p95_change > threshold or rps_change < -threshold or after["errors"] > before["errors"]
+        regressions += regressed
+        print(f"{name:36} {before['p95_ms']:>11.2f} {after['p95_ms']:>10.2f} {p95_change:>+8.1%} {rps_change:>+10.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    for name in sorted(set(baseline) ^ set(candidate)):
+        print(f"{name:36} only in {'baseline' if name in baseline else 'candidate'}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--classes", type=int, default=48)
+    parser.add_argument("--drives", type=int, default=24)
+    parser.add_argument("--iterations", type=int, default=100, help="requests per scenario (scaled per scenario)")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--only", nargs="*", help="scenario name prefixes, e.g. drive. admin.list")
+    parser.add_argument("--http", help="base URL of a running server instead of the test client")
+    parser.add_argument("--mongomock", action="store_true")
+    parser.add_argument("--storage", choices=["mongo", "sqlite"], default="mongo",
+                        help="storage backend of the in-process app (sqlite uses a scratch file)")
+    parser.add_argument("--no-load", action="store_true", help="reuse the data already in the bench database")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"))
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative regression (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        print(f"{regressions} regressions" if regressions else "No regressions")
+        sys.exit(1 if regressions else 0)
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+One scenario per route of the auth, admin, drive and dashboard blueprints.
+
+A scenario builds a fresh request for every iteration (unique IDs for inserts, an
+unvaccinated student for vaccinations, ...). Building may query the storage backend
+through `store`, so the same scenarios run on Mongo and SQLite; only sending the
+request is timed.
+"""
+import io
+import itertools
+import random
+from datetime import datetime, timedelta
+from bench.datagen import BENCH_PASSWORD, FIRST
+from db import mongo
+from repositories import store
+
+
+class Skip(Exception):
+    """The data a scenario needs has run out (e.g. no unvaccinated students left), or the database can't serve it."""
+
+
+class Context:
+    def __init__(self, seed=11):
+        self.rng = random.Random(seed)
+        self.run_id = f"{datetime.utcnow():%H%M%S}{self.rng.randrange(1000):03d}"
+        self._counter = itertools.count()
+        classes, self.student_ids = set(), []
+        # Students each vaccination scenario may still use, by class; every one is used once
+        self.unvaccinated_by_class, unvaccinated = {}, 0
+        for doc in store.iter_students({}, {"_id": 1, "class_grade": 1, "is_vaccinated": 1}):
+            classes.add(doc["class_grade"])
+            if len(self.student_ids) < 5000:
+                self.student_ids.append(doc["_id"])
+            if not doc.get("is_vaccinated") and unvaccinated < 20000:
+                self.unvaccinated_by_class.setdefault(doc["class_grade"], []).append(doc["_id"])
+                unvaccinated += 1
+        self.classes = sorted(classes) or ["5B"]
+
+    def unique(self, prefix):
+        return f"{prefix}-{self.run_id}-{next(self._counter)}"
+
+    def student_id(self):
+        if not self.student_ids:
+            raise Skip("no students")
+        return str(self.rng.choice(self.student_ids))
+
+    def unvaccinated(self, classes=None):
+        for class_grade in classes or list(self.unvaccinated_by_class):
+            if self.unvaccinated_by_class.get(class_grade):
+                return self.unvaccinated_by_class[class_grade].pop()
+        raise Skip("no unvaccinated students")
+
+    def open_drives(self):
+        drives = store.list_drives({"_id": 1, "vaccine_name": 1, "date": 1, "available_doses": 1, "classes": 1,
+                                    "is_completed": 1})
+        return [drive for drive in drives if not drive.get("is_completed")]
+
+    def open_drive(self):
+        drives = [drive for drive in self.open_drives() if drive["available_doses"] > 0]
+        if not drives:
+            raise Skip("no open drives")
+        return max(drives, key=lambda drive: drive["available_doses"])
+
+
+def future_date(days=60):
+    return (datetime.now() + timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def csv_upload(ctx, rows=100):
+    lines = ["username,class_grade,student_id"]
+    lines += [f"Bulk {index},{ctx.rng.choice(ctx.classes)},{ctx.unique('B')}" for index in range(rows)]
+    return ("students.csv", io.BytesIO("\n".join(lines).encode()))
+
+
+def delete_drive(ctx):
+    drive_id = store.insert_drive({
+        "vaccine_name": "Bench", "date": datetime.now() + timedelta(days=60), "available_doses": 1,
+        "classes": [ctx.rng.choice(ctx.classes)], "is_completed": False, "registered_students": []
+    })
+    return "DELETE", f"/drives/{drive_id}", {}
+
+
+def vaccinate_from_drive(ctx):
+    drive = ctx.open_drive()
+    student_id = ctx.unvaccinated(drive["classes"])
+    return "POST", f"/drives/{drive['_id']}/vaccinate", {"json": {"student_id": str(student_id)}}
+
+
+def record_vaccinations(ctx, size=25):
+    drive = ctx.open_drive()
+    students = []
+    for _ in range(size):
+        try:
+            students.append(str(ctx.unvaccinated(drive["classes"])))
+        except Skip:
+            break
+    if not students:
+        raise Skip("no unvaccinated students")
+    return "POST", f"/drives/{drive['_id']}/vaccinations", {"json": {"students": students, "batch_key": ctx.unique("batch")}}
+
+
+def vaccinate_class(ctx):
+    drive = ctx.open_drive()
+    return "POST", f"/drives/{drive['_id']}/vaccinate/class", {"json": {"class_grade": ctx.rng.choice(drive["classes"])}}
+
+
+def update_drive(ctx):
+    drives = ctx.open_drives()
+    if not drives:
+        raise Skip("no open drives")
+    drive = drives[0]
+    body = {"vaccine_name": drive["vaccine_name"], "date": drive["date"].strftime("%Y-%m-%d"),
+            "available_doses": drive["available_doses"], "classes": drive["classes"]}
+    return "PUT", f"/drives/{drive['_id']}", {"json": body}
+
+
+def roster(ctx, path=""):
+    if store.name == "mongo" and type(mongo.cx).__module__.startswith("mongomock"):
+        raise Skip("mongomock has no $lookup sub-pipelines")
+    drives = ctx.open_drives()
+    if not drives:
+        raise Skip("no open drives")
+    return "GET", f"/drives/{ctx.rng.choice(drives)['_id']}/roster{path}", {}
+
+
+# (name, builder, expected statuses, iterations scale)
+SCENARIOS = [
+    ("auth.login", lambda ctx: ("POST", "/login", {"json": {"username": "bench-admin", "password": BENCH_PASSWORD},
+                                                   "auth": False}), {200}, 0.2),
+    ("auth.register", lambda ctx: ("POST", "/register", {"json": {"username": ctx.unique("user"), "password": "pw",
+                                                                  "role": "user"}, "auth": False}), {201}, 0.2),
+    ("admin.admin_dashboard", lambda ctx: ("GET", "/admin/dashboard", {}), {200}, 1),
+    ("admin.list_students", lambda ctx: ("GET", "/students?limit=100", {}), {200}, 1),
+    ("admin.list_students[class_grade]",
+     lambda ctx: ("GET", f"/students?limit=100&class_grade={ctx.rng.choice(ctx.classes)}", {}), {200}, 1),
+    ("admin.list_students[ndjson]", lambda ctx: ("GET", "/students?format=ndjson&limit=1000", {}), {200}, 0.5),
+    ("admin.search_students", lambda ctx: ("GET", f"/students/search?q={ctx.rng.choice(FIRST)[:3]}", {}), {200}, 1),
+    ("admin.add_student", lambda ctx: ("POST", "/students", {"json": {"username": "Bench Student",
+                                                                      "class_grade": ctx.rng.choice(ctx.classes),
+                                                                      "student_id": ctx.unique("A")}}), {201}, 1),
+    ("admin.upload_csv", lambda ctx: ("POST", "/students/bulk", {"files": {"file": csv_upload(ctx)}}), {200}, 0.2),
+    ("admin.update_student", lambda ctx: ("PUT", f"/students/{ctx.student_id()}",
+                                          {"json": {"class_grade": ctx.rng.choice(ctx.classes)}}), {200}, 1),
+    ("admin.vaccinate_student", lambda ctx: ("PUT", f"/students/{ctx.unvaccinated()}/vaccinate",
+                                             {"json": {"vaccine_name": "Bench", "date_of_vaccination": "2024-06-01"}}),
+     {200}, 1),
+    ("admin.get_analytics", lambda ctx: ("GET", "/analytics", {}), {200}, 1),
+    ("dashboard.dashboard_data", lambda ctx: ("GET", "/analytics/analytics", {}), {200}, 1),
+    ("dashboard.cache_stats", lambda ctx: ("GET", "/analytics/cache", {}), {200}, 1),
+    ("drive.list_drives", lambda ctx: ("GET", "/drives/", {}), {200}, 1),
+    ("drive.get_vaccination_drives", lambda ctx: ("GET", "/drives/vaccination_drives", {}), {200}, 1),
+    ("drive.get_drives_by_class", lambda ctx: ("GET", f"/drives/by-class?class_grade={ctx.rng.choice(ctx.classes)}", {}),
+     {200}, 1),
+    ("drive.get_roster", lambda ctx: roster(ctx, "?limit=100&is_vaccinated=false"), {200}, 1),
+    ("drive.get_roster_summary", lambda ctx: roster(ctx, "/summary"), {200}, 1),
+    ("drive.get_drive_for_student", lambda ctx: ("GET", f"/drives/student/{ctx.student_id()}", {}), {200, 404}, 1),
+    ("drive.create_drive", lambda ctx: ("POST", "/drives", {"json": {"vaccine_name": "Bench", "date": future_date(),
+                                                                     "available_doses": 100,
+                                                                     "classes": [ctx.rng.choice(ctx.classes)]}}),
+     {201}, 1),
+    ("drive.update_drive", update_drive, {200}, 1),
+    ("drive.delete_drive", delete_drive, {200}, 1),
+    ("drive.vaccinate_from_drive", vaccinate_from_drive, {200}, 1),
+    ("drive.record_vaccinations", record_vaccinations, {200}, 0.2),
+    ("drive.vaccinate_class", vaccinate_class, {200}, 0.05),
+]
@@ -0,0 +1,84 @@
+"""
+Latency of GET /students/search over a large synthetic roster.
+
+    python -m bench.search_latency --students 500000 --rounds 200
+
+Loads the students with bench.datagen (skipped when the bench database already holds that many),
+then times each query mix through the Flask test client and prints p50/p95/p99 in ms
+plus, on a real mongod, the keys/documents each query examined.
+"""
+import argparse
+import random
+import string
+import time
+from urllib.parse import urlencode
+from bench import admin_headers, datagen, make_app
+from bench.datagen import FIRST, LAST, class_names
+
+CLASSES = class_names(48)
+
+QUERIES = [
+    ("prefix_short", lambda count: {"q": random.choice(FIRST)[:2]}),
+    ("prefix_full", lambda count: {"q": f"{random.choice(FIRST)} {random.choice(LAST)[:2]}"}),
+    ("prefix_class", lambda count: {"q": random.choice(FIRST)[:3], "class_grade": random.choice(CLASSES)}),
+    ("prefix_vaccinated", lambda count: {"q": random.choice(FIRST)[:3], "is_vaccinated": "true"}),
+    ("student_id", lambda count: {"student_id": f"S{random.randrange(count):07d}"}),
+    ("class_date_range", lambda count: {"class_grade": random.choice(CLASSES), "vaccinated_from": "2024-03-01",
+                                        "vaccinated_to": "2024-03-31"}),
+    ("no_match", lambda count: {"q": "".join(random.choices(string.ascii_lowercase, k=6))}),
+]
+
+
+def load(db, count):
+    if db.students.estimated_document_count() == count:
+        return None
+    return datagen.load(students=count, classes=len(CLASSES))
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def examined(db, params):
+    from utils.search import SEARCH_SORT, search_filter
+
+    plan = db.students.find(search_filter(params)).sort(SEARCH_SORT).limit(21).explain()
+    execution = plan.get("executionStats", {})
+    return execution.get("totalKeysExamined"), execution.get("totalDocsExamined")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=500000)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+
+    from db import mongo
+
+    app = make_app(use_mongomock=args.mongomock)
+    headers = admin_headers(app)
+    loaded = load(mongo.db, args.students)
+    if loaded:
+        print("loaded", loaded)
+    client = app.test_client()
+    random.seed(11)
+    for label, make_params in QUERIES:
+        latencies = []
+        for _ in range(args.rounds):
+            params = make_params(args.students)
+            started = time.perf_counter()
+            response = client.get("/students/search?" + urlencode(params), headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.get_json()
+        line = (f"{label:18} p50={percentile(latencies, 0.50):7.2f}ms p95={percentile(latencies, 0.95):7.2f}ms "
+                f"p99={percentile(latencies, 0.99):7.2f}ms")
+        if not args.mongomock:
+            keys, docs = examined(mongo.db, params)
+            line += f" keys={keys} docs={docs}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
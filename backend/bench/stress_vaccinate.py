@@ -0,0 +1,72 @@
+"""
+Concurrency stress test for POST /drives/<id>/vaccinate.
+
+Many threads try to vaccinate the same pool of students from one drive at once.
+Afterwards the drive's remaining doses, its registered_students list and the
+students' flags must all agree: no student vaccinated twice, no dose oversubscribed.
+"""
+import argparse
+import random
+from concurrent.futures import ThreadPoolExecutor
+from bench import admin_headers, make_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--doses", type=int, default=150)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+
+    app = make_app(args.mongomock)
+    from db import mongo
+
+    db = mongo.db
+    for name in ("students", "vaccination_drives", "stats"):
+        db[name].delete_many({})
+    student_ids = db.students.insert_many([
+        {"username": f"Stress {i}", "class_grade": "5B", "student_id": f"STRESS{i:05}", "is_vaccinated": False}
+        for i in range(args.students)
+    ]).inserted_ids
+    drive_id = db.vaccination_drives.insert_one({
+        "vaccine_name": "Stress", "date": "2099-01-01", "available_doses": args.doses,
+        "classes": ["5B"], "is_completed": False, "registered_students": []
+    }).inserted_id
+
+    headers = admin_headers(app)
+    client = app.test_client()
+
+    def attempt(_):
+        student_id = str(random.choice(student_ids))
+        return client.post(f"/drives/{drive_id}/vaccinate", headers=headers, json={"student_id": student_id}).status_code
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        statuses = list(pool.map(attempt, range(args.requests)))
+
+    drive = db.vaccination_drives.find_one({"_id": drive_id})
+    vaccinated = db.students.count_documents({"is_vaccinated": True})
+    registered = drive["registered_students"]
+    expected = min(args.students, args.doses)
+    print({status: statuses.count(status) for status in sorted(set(statuses))})
+    print(f"vaccinated={vaccinated} registered={len(registered)} remaining_doses={drive['available_doses']}")
+
+    failures = []
+    if len(registered) != len(set(registered)):
+        failures.append("a student is registered twice")
+    if vaccinated != len(registered):
+        failures.append("vaccinated students and registrations disagree")
+    if drive["available_doses"] != args.doses - vaccinated or drive["available_doses"] < 0:
+        failures.append("doses were oversubscribed or leaked")
+    if statuses.count(200) != vaccinated:
+        failures.append("successful responses don't match vaccinated students")
+    if args.requests >= 5 * args.students and vaccinated != expected:
+        failures.append(f"expected {expected} vaccinations")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
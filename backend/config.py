@@ -1,8 +1,76 @@
 import os
+import tempfile
+
+
+def optional_int(name):
+    value = os.getenv(name, "")
+    return int(value) if value else None
+
 
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "supersecret")
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "jwtsecret")
+    # Where the data lives, see repositories/: "mongo" or "sqlite" (pip install -r requirements-sqlite.txt)
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").lower()
+    SQLITE_PATH = os.getenv("SQLITE_PATH", "")  # default: instance/school_vaccine.db
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # how long a writer waits for the lock
+    SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))  # page cache per connection
     MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/vaccination_portal")
+    # MongoClient settings, see db.py; unset values keep the driver defaults
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))  # per process and server
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_TIME_MS = optional_int("MONGO_MAX_IDLE_TIME_MS")
+    MONGO_MAX_CONNECTING = optional_int("MONGO_MAX_CONNECTING")
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = optional_int("MONGO_WAIT_QUEUE_TIMEOUT_MS")  # pool exhausted for this long = 503
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    MONGO_SOCKET_TIMEOUT_MS = optional_int("MONGO_SOCKET_TIMEOUT_MS")
+    MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "")  # e.g. primaryPreferred
+    MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "")  # e.g. majority or 1
+    MONGO_JOURNAL = {"true": True, "false": False}.get(os.getenv("MONGO_JOURNAL", "").lower())
+    MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")  # e.g. zstd,snappy,zlib
+    MONGO_APP_NAME = os.getenv("MONGO_APP_NAME", "vaccination-portal")
+    # Analytics, listings, search and reports can read from secondaries, e.g. secondaryPreferred
+    MONGO_ANALYTICS_READ_PREFERENCE = os.getenv("MONGO_ANALYTICS_READ_PREFERENCE", "primary")
+    MONGO_ANALYTICS_MAX_STALENESS = optional_int("MONGO_ANALYTICS_MAX_STALENESS")  # seconds, at least 90
     JWT_ACCESS_TOKEN_EXPIRES = 3600  # 1 hour
-    
\ No newline at end of file
+    CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
+    # Response headers the frontend reads (pagination cursors, revalidation, retries, job locations)
+    CORS_EXPOSE_HEADERS = ["X-Next-Cursor", "ETag", "Retry-After", "Location", "Idempotent-Replayed"]
+    # Migrations are a deploy step (`flask migrate`); opting in runs them at startup without waiting on other processes
+    MONGO_AUTO_MIGRATE = os.getenv("MONGO_AUTO_MIGRATE", "false").lower() == "true"
+    ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "30"))  # seconds
+    # /analytics/stream: seconds between keep-alives (and re-reads of the summary), see utils/live.py
+    ANALYTICS_STREAM_HEARTBEAT = float(os.getenv("ANALYTICS_STREAM_HEARTBEAT", "15"))
+    ANALYTICS_CHANGE_STREAM = os.getenv("ANALYTICS_CHANGE_STREAM", "true").lower() == "true"  # needs a replica set
+    # Seconds a process serves drive listings' ETags from the revision it last saw before re-reading it
+    REVISION_CHECK_INTERVAL = float(os.getenv("REVISION_CHECK_INTERVAL", "1"))
+    SEARCH_MAX_TIME_MS = int(os.getenv("SEARCH_MAX_TIME_MS", "2000"))  # server-side cap per search query
+    # werkzeug hash method, e.g. "scrypt" or "pbkdf2:sha256:600000"; changing it rehashes on next login
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+    HASH_WORKERS = int(os.getenv("HASH_WORKERS", "0"))  # 0 = one per CPU
+    HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "16"))
+    HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", "1"))  # seconds
+    # Background jobs (exports, CSV imports, scheduled tasks), see utils/jobs.py
+    JOB_RUNNER_ENABLED = os.getenv("JOB_RUNNER_ENABLED", "true").lower() == "true"
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))  # seconds
+    JOB_FLUSH_SECONDS = float(os.getenv("JOB_FLUSH_SECONDS", "1"))  # progress writes (and cancel checks) per job
+    JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "60"))  # no heartbeat for this long = worker lost
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    DRIVE_COMPLETION_INTERVAL = int(os.getenv("DRIVE_COMPLETION_INTERVAL", "3600"))  # seconds
+    JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", "168"))  # finished jobs and their files, then purged
+    # Uploads and exports; a job may be retried or downloaded on any host, so with more than one
+    # host this must be storage they all mount (NFS, EFS, ...). The default only suits one host.
+    JOB_DIR = os.getenv("JOB_DIR", os.path.join(tempfile.gettempdir(), "vaccination_portal_jobs"))
+    REPORT_INLINE_ROWS = int(os.getenv("REPORT_INLINE_ROWS", "20000"))  # larger XLSX/PDF exports run as jobs
+    # Instrumentation, see utils/metrics.py and GET /metrics
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # when set, /metrics requires "Authorization: Bearer <token>"
+    SLOW_QUERY_MS = int(os.getenv("SLOW_QUERY_MS", "100"))
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # e.g. 0.01 profiles 1% of requests
+    PROFILE_SLOW_MS = int(os.getenv("PROFILE_SLOW_MS", "500"))  # only sampled requests slower than this are kept
+    PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "vaccination_portal_profiles"))
+    # Connection pool of the async (ASGI) entry point, see asgi.py
+    ASYNC_MONGO_MAX_POOL_SIZE = int(os.getenv("ASYNC_MONGO_MAX_POOL_SIZE", "200"))
+    ASYNC_MONGO_MIN_POOL_SIZE = int(os.getenv("ASYNC_MONGO_MIN_POOL_SIZE", "10"))
+    ASYNC_MONGO_MAX_CONNECTING = int(os.getenv("ASYNC_MONGO_MAX_CONNECTING", "4"))
@@ -1,4 +1,98 @@
+import os
 from flask_pymongo import PyMongo
+from pymongo import MongoClient, read_preferences
+from pymongo.errors import ConfigurationError
 
 # Initialize PyMongo
 mongo = PyMongo()
+
+READ_PREFERENCES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+# Config key -> MongoClient keyword; unset (None) keys keep the driver default
+CLIENT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_MAX_CONNECTING": "maxConnecting",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "MONGO_READ_PREFERENCE": "readPreference",
+    "MONGO_WRITE_CONCERN": "w",
+    "MONGO_JOURNAL": "journal",
+    "MONGO_COMPRESSORS": "compressors",
+    "MONGO_APP_NAME": "appname",
+}
+POOL_OPTIONS = ("maxPoolSize", "minPoolSize", "maxIdleTimeMS", "maxConnecting", "waitQueueTimeoutMS")
+
+_analytics_read_preference = read_preferences.Primary()
+
+
+def client_options(config, pool=True):
+    """MongoClient keyword arguments from the MONGO_* settings (pool settings optional, e.g. for the async client)."""
+    options = {}
+    for key, option in CLIENT_OPTIONS.items():
+        value = config.get(key)
+        if value is None or value == "" or (not pool and option in POOL_OPTIONS):
+            continue
+        if option == "w" and str(value).isdigit():
+            value = int(value)
+        options[option] = value
+    return options
+
+
+def read_preference(name, max_staleness=None):
+    if name not in READ_PREFERENCES:
+        raise ConfigurationError(f"Unknown read preference {name!r}")
+    if name == "primary":
+        return read_preferences.Primary()
+    return READ_PREFERENCES[name](max_staleness=max_staleness or -1)
+
+
+def init_mongo(app, event_listeners=()):
+    """
+    Configure the shared client from app.config. It is created with connect=False, so
+    no sockets are opened until the first operation, and every forked worker
+    (gunicorn --preload) replaces it with a client of its own.
+    """
+    global _analytics_read_preference
+    _analytics_read_preference = read_preference(
+        app.config["MONGO_ANALYTICS_READ_PREFERENCE"], app.config["MONGO_ANALYTICS_MAX_STALENESS"]
+    )
+    options = {**client_options(app.config), "connect": False, "event_listeners": list(event_listeners)}
+    mongo.init_app(app, **options)
+
+    def reopen_after_fork():
+        # A client's sockets, locks and monitor threads must not be shared with a forked child
+        database = mongo.db.name
+        mongo.cx = MongoClient(app.config["MONGO_URI"], **options)
+        mongo.db = mongo.cx[database]
+
+    if not getattr(mongo, "_fork_hook", False):
+        os.register_at_fork(after_in_child=reopen_after_fork)
+        mongo._fork_hook = True
+
+
+def analytics_db():
+    """
+    The database handle for heavy reads (analytics, listings, search, reports), routed by
+    MONGO_ANALYTICS_READ_PREFERENCE, e.g. to secondaries. Writes must keep using mongo.db.
+    """
+    return mongo.db.with_options(read_preference=_analytics_read_preference)
+
+
+def __getattr__(name):
+    # Flask-SQLAlchemy is only needed by the SQLite storage backend (requirements-sqlite.txt),
+    # so `from db import db` (models/) imports it on first use rather than at startup
+    if name == "db":
+        from flask_sqlalchemy import SQLAlchemy
+        globals()["db"] = SQLAlchemy()
+        return globals()["db"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,6 @@
+from db import db
+
+class Revisions(db.Model):
+    """Current revision of each collection, for the ETags of utils/revisions.py."""
+    collection = db.Column(db.String(50), primary_key=True)
+    revision = db.Column(db.String(24), nullable=False)
@@ -2,17 +2,25 @@ from db import db
 
 class Students(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(120), nullable=False)
-    class_grade = db.Column(db.String(10), nullable=False)
-    student_id = db.Column(db.string(50), unique=True, nullable=False)
-    is_vaccinated = db.Column(db.Boolean, default=False)
+    username = db.Column(db.String(120), nullable=False, index=True)
+    username_lower = db.Column(db.String(120), nullable=False)  # search key, see utils.schema.search_name
+    class_grade = db.Column(db.String(10), nullable=False, index=True)
+    student_id = db.Column(db.String(50), unique=True, nullable=False)
+    is_vaccinated = db.Column(db.Boolean, default=False, nullable=False)
     vaccine_name = db.Column(db.String(120), nullable=True)
     date_of_vaccination = db.Column(db.DateTime, nullable=True)
+    drive_id = db.Column(db.Integer, nullable=True)  # the drive whose dose the student got
+
+    # The same access paths as the Mongo indexes in utils/indexes.py; the rowid (id) ends every index
+    __table_args__ = (
+        db.Index("ix_students_username_lower", "username_lower"),
+        db.Index("ix_students_class_grade_username_lower", "class_grade", "username_lower"),
+    )
 
     def serialize(self):
         return {
             "id": self.id,
-            "name": self.name,
+            "username": self.username,
             "class_grade": self.class_grade,
             "student_id": self.student_id,
             "is_vaccinated": self.is_vaccinated,
@@ -4,7 +4,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 class Users(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)  # scrypt hashes are ~160 characters
     role = db.Column(db.String(10), nullable=False)  # 'admin' or 'student'
 
     def set_password(self, password):
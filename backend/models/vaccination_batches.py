@@ -0,0 +1,10 @@
+from db import db
+
+class VaccinationBatches(db.Model):
+    """Claimed batch keys of POST /drives/<id>/vaccinations, with the response to replay."""
+    id = db.Column(db.String(200), primary_key=True)  # "<drive id>:<batch key>"
+    fingerprint = db.Column(db.String(40), nullable=False)
+    status = db.Column(db.String(10), nullable=False)  # 'running' or 'done'
+    response = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
@@ -3,10 +3,14 @@ from db import db
 class VaccinationDrives(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     vaccine_name = db.Column(db.String(120), nullable=False)
-    date = db.Column(db.DateTime, nullable=False)
+    date = db.Column(db.DateTime, nullable=False, index=True)
     available_doses = db.Column(db.Integer, nullable=False)
     classes = db.Column(db.String(120))  # e.g., "5,6,7"
-    is_completed = db.Column(db.Boolean, default=False)  # Boolean to track completion status
+    is_completed = db.Column(db.Boolean, default=False, nullable=False)  # Boolean to track completion status
+
+    __table_args__ = (
+        db.Index("ix_vaccination_drives_is_completed_date", "is_completed", "date"),
+    )
 
     def serialize(self):
         return {
@@ -14,6 +18,16 @@ class VaccinationDrives(db.Model):
             "vaccine_name": self.vaccine_name,
             "date": self.date.strftime('%Y-%m-%d'),
             "available_doses": self.available_doses,
-            "classes": self.classes.split(","),
+            "classes": self.classes.split(",") if self.classes else [],
             "is_completed": self.is_completed
         }
+
+class DriveClasses(db.Model):
+    """One row per class a drive covers, so drives are looked up by class through an index."""
+    drive_id = db.Column(db.Integer, db.ForeignKey("vaccination_drives.id", ondelete="CASCADE"), primary_key=True)
+    class_grade = db.Column(db.String(10), primary_key=True, index=True)
+
+class DriveRegistrations(db.Model):
+    """The students a drive handed a dose to (registered_students in Mongo)."""
+    drive_id = db.Column(db.Integer, db.ForeignKey("vaccination_drives.id", ondelete="CASCADE"), primary_key=True)
+    student_id = db.Column(db.Integer, primary_key=True, index=True)
@@ -0,0 +1,51 @@
+"""
+Storage backends. Routes and utils go through `store` rather than a database client,
+and STORAGE_BACKEND picks the implementation when the app starts:
+
+- mongo (default): repositories/mongo.py, over flask_pymongo's mongo.db
+- sqlite: repositories/sqlite.py, over the SQLAlchemy models in models/
+  (pip install -r requirements-sqlite.txt)
+
+Both take and return documents shaped like the Mongo ones (`_id`, lists of classes,
+datetimes), and build their filters from the same utils.pagination/utils.search
+query-string parsing, so the routes don't know which one they run on.
+"""
+from importlib import import_module
+
+BACKENDS = {
+    "mongo": "repositories.mongo:MongoRepository",
+    "sqlite": "repositories.sqlite:SQLiteRepository",
+}
+
+
+class QueryTimeout(Exception):
+    """A read ran past its server-side time limit (e.g. SEARCH_MAX_TIME_MS)."""
+
+
+class DuplicateKey(Exception):
+    """A write would give a second user the same username, or a second student the same student_id."""
+
+
+class Store:
+    """Forwards every call to the repository chosen by init_app."""
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        name = app.config["STORAGE_BACKEND"]
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown STORAGE_BACKEND {name!r}, expected one of: {', '.join(BACKENDS)}")
+        # Only the chosen backend is imported, so Mongo deployments never load SQLAlchemy
+        module, _, cls = BACKENDS[name].partition(":")
+        self.backend = getattr(import_module(module), cls)()
+        self.backend.init_app(app)
+
+    def __getattr__(self, name):
+        backend = self.__dict__.get("backend")
+        if backend is None:
+            raise RuntimeError("store.init_app() has not been called")
+        return getattr(backend, name)
+
+
+store = Store()
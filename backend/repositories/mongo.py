@@ -0,0 +1,190 @@
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError, ExecutionTimeout
+from db import analytics_db, mongo
+from repositories import DuplicateKey, QueryTimeout
+from utils import analytics, roster, search, stats, vaccinations
+from utils.importer import import_rows
+from utils.indexes import ensure_indexes
+from utils.pagination import keyset_page, keyset_query, parse_cursor, student_filter
+from utils.schema import DRIVE_PROJECTION
+
+UNIQUE_KEYS = {"students": "student_id", "users": "username"}
+
+
+class MongoRepository:
+    """
+    The original storage: writes go to mongo.db, heavy reads to analytics_db(), and
+    student writes keep the materialized counters of utils.stats in step.
+    """
+    name = "mongo"
+    background_jobs = True  # utils.jobs keeps its queue in Mongo
+
+    def init_app(self, app):
+        pass  # db.init_mongo has configured the client
+
+    def parse_id(self, value):
+        return ObjectId(value)
+
+    ### Users
+    def find_user(self, username):
+        return mongo.db.users.find_one({"username": username})
+
+    def insert_user(self, user):
+        try:
+            mongo.db.users.insert_one(user)
+        except DuplicateKeyError:
+            raise DuplicateKey()
+
+    def set_password(self, user, password):
+        mongo.db.users.update_one({"_id": user["_id"]}, {"$set": {"password": password}})
+
+    ### Students
+    def get_student(self, student_id, projection=None):
+        return mongo.db.students.find_one({"_id": self.parse_id(student_id)}, projection)
+
+    def student_id_taken(self, code):
+        return mongo.db.students.find_one({"student_id": code}, {"_id": 1}) is not None
+
+    def insert_student(self, student):
+        try:
+            mongo.db.students.insert_one(student)
+        except DuplicateKeyError:
+            raise DuplicateKey()
+        stats.record_change(None, student)
+
+    def update_student(self, student_id, changes):
+        """Apply `changes` and return the student as it was before, or None if there is no such student."""
+        try:
+            before = mongo.db.students.find_one_and_update({"_id": self.parse_id(student_id)}, {"$set": changes})
+        except DuplicateKeyError:
+            raise DuplicateKey()
+        if before:
+            stats.record_change(before, {**before, **changes})
+        return before
+
+    def vaccinate_student(self, student_id, changes):
+        # Only an unvaccinated student matches, so concurrent requests can't both succeed
+        before = mongo.db.students.find_one_and_update(
+            {"_id": self.parse_id(student_id), "is_vaccinated": {"$ne": True}},
+            {"$set": changes}
+        )
+        if before:
+            stats.record_change(before, {**before, **changes})
+        return before
+
+    def student_page(self, args, projection, limit):
+        """One page of the students matching the list filters in `args`, and the next cursor."""
+        query = student_filter(args)
+        return keyset_page(analytics_db().students, query, projection, limit, parse_cursor(args.get("after")))
+
+    def iter_students(self, args, projection, limit=None, batch_size=500):
+        """
+        Every student matching the filters in `args`, in `_id` order, fetched in batches.
+        The filters are checked before this returns, so a QueryError never surfaces mid-stream.
+        """
+        query = keyset_query(student_filter(args), parse_cursor(args.get("after")))
+        cursor = analytics_db().students.find(query, projection).sort("_id", 1).batch_size(batch_size)
+        return cursor.limit(limit) if limit else cursor
+
+    def count_students(self, args):
+        return analytics_db().students.count_documents(student_filter(args))
+
+    def search_students(self, args, projection, max_time_ms=None):
+        try:
+            return search.search_students(analytics_db().students, args, projection, max_time_ms)
+        except ExecutionTimeout:
+            raise QueryTimeout()
+
+    def unvaccinated_in_class(self, class_grade, projection, limit=0):
+        return list(mongo.db.students.find(
+            {"class_grade": class_grade, "is_vaccinated": {"$ne": True}}, projection, limit=limit
+        ))
+
+    def import_rows(self, collection, rows, prepare, progress=None):
+        """Bulk-load users, students or vaccination_drives with utils.importer; returns its ImportReport."""
+        on_insert = stats.record_inserted if collection == "students" else None
+        return import_rows(mongo.db[collection], rows, prepare, unique_key=UNIQUE_KEYS.get(collection),
+                           on_insert=on_insert, progress=progress)
+
+    ### Vaccination drives
+    def insert_drive(self, drive):
+        return mongo.db.vaccination_drives.insert_one(drive).inserted_id
+
+    def list_drives(self, projection):
+        return list(mongo.db.vaccination_drives.find({}, projection))
+
+    def drive_summaries(self):
+        return list(mongo.db.vaccination_drives.aggregate([
+            {"$project": {
+                "vaccine_name": 1,
+                "date": 1,
+                "is_completed": {"$ifNull": ["$is_completed", False]}  # Default to False if missing
+            }}
+        ]))
+
+    def drives_for_class(self, class_grade, projection):
+        # classes is an array, so this matches drives that include the class
+        return list(mongo.db.vaccination_drives.find({"classes": class_grade}, projection))
+
+    def drive_for_student(self, student_id):
+        return mongo.db.vaccination_drives.find_one({"registered_students": student_id}, {"vaccine_name": 1})
+
+    def update_drive(self, drive_id, drive):
+        mongo.db.vaccination_drives.update_one({"_id": drive_id}, {"$set": drive})
+
+    def delete_drive(self, drive_id):
+        return mongo.db.vaccination_drives.delete_one({"_id": drive_id}).deleted_count > 0
+
+    def complete_past_drives(self):
+        return vaccinations.complete_past_drives()
+
+    def drive_roster(self, drive_id, args=None, limit=None):
+        """
+        The drive's roster (utils.roster) from one aggregation, or None if there is no such drive.
+        With `args`, it includes a page of the students matching the list filters.
+        """
+        query = None
+        if args is not None:
+            query = keyset_query(student_filter(args), parse_cursor(args.get("after")))
+        # The primary, not analytics_db(): rosters are cached per revision, so they must not lag behind it
+        drive = next(mongo.db.vaccination_drives.aggregate(roster.roster_pipeline(drive_id, query, limit)), None)
+        if drive is None:
+            return None
+        return roster.shape_roster(drive, drive.pop("by_class"), drive.pop("students", None), limit)
+
+    ### Vaccinations
+    def vaccinate_with_drive(self, drive_id, student, date_of_vaccination=None):
+        return vaccinations.vaccinate_with_drive(drive_id, student, date_of_vaccination)
+
+    def vaccinate_batch(self, drive_id, refs, date_of_vaccination=None):
+        return vaccinations.vaccinate_batch(drive_id, refs, date_of_vaccination)
+
+    def claim_batch(self, drive_id, batch_key, fingerprint):
+        return vaccinations.claim_batch(drive_id, batch_key, fingerprint)
+
+    def finish_batch(self, drive_id, batch_key, response):
+        vaccinations.finish_batch(drive_id, batch_key, response)
+
+    def abandon_batch(self, drive_id, batch_key):
+        vaccinations.abandon_batch(drive_id, batch_key)
+
+    ### Analytics and revisions
+    def summary(self, today):
+        drives = analytics_db().vaccination_drives
+        raw = next(drives.aggregate(analytics.drives_pipeline()))
+        raw["upcoming_drives"] = list(drives.find(analytics.upcoming_query(today), DRIVE_PROJECTION).sort("date", 1))
+        return analytics.shape_summary(stats.read(), raw)
+
+    def read_revision(self, collection):
+        doc = mongo.db.revisions.find_one({"_id": collection})
+        return doc["revision"] if doc else None
+
+    def write_revision(self, collection, revision):
+        mongo.db.revisions.update_one({"_id": collection}, {"$set": {"revision": revision}}, upsert=True)
+
+    def reset(self):
+        """Empty every collection the app writes, keeping the indexes (benchmarks start from scratch)."""
+        for collection in ("students", "vaccination_drives", "users", "stats", "jobs", "revisions",
+                           "vaccination_batches"):
+            mongo.db[collection].delete_many({})
+        ensure_indexes(mongo.db)
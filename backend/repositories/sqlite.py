@@ -0,0 +1,655 @@
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from bson.errors import InvalidId
+from sqlalchemy import and_, bindparam, delete, event, func, insert, or_, select, true, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+from db import db
+from models.revisions import Revisions
+from models.students import Students
+from models.users import Users
+from models.vaccination_batches import VaccinationBatches
+from models.vaccination_drives import DriveClasses, DriveRegistrations, VaccinationDrives
+from repositories import DuplicateKey, QueryTimeout
+from utils import analytics, revisions, roster, search, stats
+from utils.importer import DEFAULT_CHUNK_SIZE, ImportReport, RowError, chunked
+from utils.pagination import keyset_query, parse_cursor, split_page, student_filter
+from utils.schema import DRIVE_PROJECTION, parse_date, search_name
+from utils.vaccinations import (STALE_BATCH_SECONDS, VaccinationError, batch_results, check_eligibility,
+                                match_refs)
+
+students = Students.__table__
+users = Users.__table__
+drives = VaccinationDrives.__table__
+drive_classes = DriveClasses.__table__
+registrations = DriveRegistrations.__table__
+batches = VaccinationBatches.__table__
+revision_table = Revisions.__table__
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # readers never block the writer, nor it them
+    "PRAGMA synchronous=NORMAL",  # safe with WAL; commits skip the fsync until a checkpoint
+    "PRAGMA foreign_keys=ON",  # deleting a drive removes its classes and registrations
+    "PRAGMA temp_store=MEMORY",
+)
+# Claimed batch keys are kept as long as the TTL index in utils/indexes.py keeps them in Mongo
+BATCH_RETENTION = timedelta(days=1)
+# Document field -> column where the names differ
+COLUMN_NAMES = {"_id": "id", "password": "password_hash"}
+STUDENT_FIELDS = ("username", "username_lower", "class_grade", "student_id", "is_vaccinated", "vaccine_name",
+                  "date_of_vaccination", "drive_id")
+UPPER_BOUND = "\U0010ffff"  # sorts after every character, so [prefix, prefix + UPPER_BOUND) is a prefix range
+
+
+def prefix_range(column, pattern):
+    # The filters only ever hold anchored prefixes, "^" + re.escape(prefix); a range keeps
+    # them case-sensitive (LIKE isn't) and lets SQLite use the column's index
+    if not pattern.startswith("^"):
+        raise ValueError(f"Unsupported pattern {pattern!r}")
+    prefix = re.sub(r"\\(.)", r"\1", pattern[1:], flags=re.DOTALL)
+    return and_(column >= prefix, column < prefix + UPPER_BOUND)
+
+
+OPERATORS = {
+    "$gt": lambda column, value: column > value,
+    "$gte": lambda column, value: column >= value,
+    "$lt": lambda column, value: column < value,
+    "$lte": lambda column, value: column <= value,
+    "$ne": lambda column, value: column.is_distinct_from(value),
+    "$in": lambda column, values: column.in_(values),
+    "$regex": prefix_range,
+}
+
+
+def condition(table, query):
+    """
+    Translate a filter built by utils.pagination or utils.search into a WHERE clause, so both
+    backends apply the same query-string rules. Only the operators those builders use are known.
+    """
+    clauses = []
+    for field, value in query.items():
+        if field in ("$and", "$or"):
+            combine = and_ if field == "$and" else or_
+            clauses.append(combine(*(condition(table, part) for part in value)))
+        elif isinstance(value, dict):
+            column = table.c[COLUMN_NAMES.get(field, field)]
+            clauses.extend(OPERATORS[operator](column, operand) for operator, operand in value.items())
+        else:
+            clauses.append(table.c[COLUMN_NAMES.get(field, field)] == value)
+    return and_(true(), *clauses)
+
+
+def columns(table, projection):
+    """The columns of a Mongo-style projection; `_id` is included unless it is set to 0."""
+    if not projection:
+        return list(table.c)
+    selected = [table.c.id] if projection.get("_id", 1) else []
+    selected += [table.c[COLUMN_NAMES.get(field, field)]
+                 for field, include in projection.items() if include and field != "_id"]
+    return selected
+
+
+def document(row):
+    """A row in the shape of the Mongo document routes expect: `_id`, a list of classes, `password`."""
+    doc = {}
+    for key, value in row._mapping.items():
+        if key == "id":
+            key = "_id"
+        elif key == "password_hash":
+            key = "password"
+        elif key == "classes":
+            value = value.split(",") if value else []
+        doc[key] = value
+    return doc
+
+
+def student_row(doc):
+    row = {field: doc.get(field) for field in STUDENT_FIELDS}
+    row["username_lower"] = row["username_lower"] or search_name(doc["username"])
+    row["is_vaccinated"] = bool(row["is_vaccinated"])
+    return row
+
+
+def user_row(doc):
+    return {"username": doc["username"], "password_hash": doc["password"], "role": doc["role"]}
+
+
+def drive_row(doc):
+    return {
+        "vaccine_name": doc["vaccine_name"],
+        "date": doc["date"],
+        "available_doses": doc["available_doses"],
+        "classes": ",".join(doc["classes"]),
+        "is_completed": bool(doc.get("is_completed", False)),
+    }
+
+
+# collection -> (table, row builder, unique key)
+IMPORTS = {
+    "students": (students, student_row, "student_id"),
+    "users": (users, user_row, "username"),
+    "vaccination_drives": (drives, drive_row, None),
+}
+
+
+def configure_engine(engine, cache_size_kb):
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, _):
+        # pysqlite would issue its own deferred BEGIN before writes; the begin hook below does it instead
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in PRAGMAS + (f"PRAGMA cache_size=-{cache_size_kb}",):
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        # Writers take the lock up front: a deferred transaction that read first fails with
+        # "database is locked" if another writer committed in between, instead of waiting
+        immediate = connection.get_execution_options().get("immediate")
+        connection.exec_driver_sql("BEGIN IMMEDIATE" if immediate else "BEGIN")
+
+    # A pooled connection must not be shared with a forked worker (gunicorn --preload)
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+
+def timed_rows(connection, statement, max_time_ms=None):
+    """Fetch every row as a document, interrupting the statement after `max_time_ms`."""
+    if not max_time_ms:
+        return [document(row) for row in connection.execute(statement)]
+    raw = connection.connection.driver_connection
+    deadline = time.monotonic() + max_time_ms / 1000
+    # Called every 10k VM instructions; a true return aborts the statement with "interrupted"
+    raw.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+    try:
+        return [document(row) for row in connection.execute(statement)]
+    except OperationalError as e:
+        if "interrupted" in str(e.orig):
+            raise QueryTimeout()
+        raise
+    finally:
+        raw.set_progress_handler(None, 0)
+
+
+class SQLiteRepository:
+    """
+    A single-file SQLite database (SQLITE_PATH) over the models in models/, for small
+    deployments without a Mongo server. The file runs in WAL mode, so any number of
+    readers work alongside the one writer; statements are compiled once by SQLAlchemy
+    and kept prepared per connection by sqlite3, and bulk writes go through executemany.
+    """
+    name = "sqlite"
+    background_jobs = False  # utils.jobs keeps its queue in Mongo
+
+    def init_app(self, app):
+        path = os.path.abspath(app.config["SQLITE_PATH"] or os.path.join(app.instance_path, "school_vaccine.db"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        app.config.setdefault("SQLALCHEMY_DATABASE_URI", f"sqlite:///{path}")
+        app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {"connect_args": {
+            "timeout": app.config["SQLITE_BUSY_TIMEOUT_MS"] / 1000,  # how long a writer waits for the lock
+            "check_same_thread": False,  # pooled connections move between request threads
+            "cached_statements": 256,
+        }})
+        db.init_app(app)
+        with app.app_context():
+            configure_engine(db.engine, app.config["SQLITE_CACHE_SIZE_KB"])
+            db.create_all()
+
+    def parse_id(self, value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise InvalidId(f"{value!r} is not a valid id")
+
+    def _read(self):
+        return db.engine.connect()
+
+    def _write(self):
+        return db.engine.execution_options(immediate=True).begin()
+
+    ### Users
+    def find_user(self, username):
+        with self._read() as connection:
+            row = connection.execute(select(users).where(users.c.username == username)).first()
+        return document(row) if row else None
+
+    def insert_user(self, user):
+        try:
+            with self._write() as connection:
+                connection.execute(insert(users).values(user_row(user)))
+        except IntegrityError:
+            raise DuplicateKey()
+
+    def set_password(self, user, password):
+        with self._write() as connection:
+            connection.execute(update(users).where(users.c.id == user["_id"]).values(password_hash=password))
+
+    ### Students
+    def get_student(self, student_id, projection=None):
+        statement = select(*columns(students, projection)).where(students.c.id == self.parse_id(student_id))
+        with self._read() as connection:
+            row = connection.execute(statement).first()
+        return document(row) if row else None
+
+    def student_id_taken(self, code):
+        with self._read() as connection:
+            return connection.execute(select(students.c.id).where(students.c.student_id == code)).first() is not None
+
+    def insert_student(self, student):
+        try:
+            with self._write() as connection:
+                connection.execute(insert(students).values(student_row(student)))
+        except IntegrityError:
+            raise DuplicateKey()
+
+    def update_student(self, student_id, changes):
+        # Fields that aren't columns have nowhere to go; Mongo would store them, nothing reads them
+        values = {field: value for field, value in changes.items() if field in STUDENT_FIELDS}
+        where = students.c.id == self.parse_id(student_id)
+        try:
+            with self._write() as connection:
+                before = connection.execute(select(students).where(where)).first()
+                if before and values:
+                    connection.execute(update(students).where(where).values(values))
+        except IntegrityError:
+            raise DuplicateKey()
+        return document(before) if before else None
+
+    def vaccinate_student(self, student_id, changes):
+        where = and_(students.c.id == self.parse_id(student_id), students.c.is_vaccinated.is_not(True))
+        with self._write() as connection:
+            before = connection.execute(select(students).where(where)).first()
+            if before:
+                connection.execute(update(students).where(where).values(changes))
+        return document(before) if before else None
+
+    def _student_query(self, args, projection):
+        query = keyset_query(student_filter(args), parse_cursor(args.get("after"), self.parse_id))
+        return select(*columns(students, projection)).where(condition(students, query)).order_by(students.c.id)
+
+    def student_page(self, args, projection, limit):
+        statement = self._student_query(args, projection).limit(limit + 1)
+        with self._read() as connection:
+            docs = [document(row) for row in connection.execute(statement)]
+        return split_page(docs, limit)
+
+    def iter_students(self, args, projection, limit=None, batch_size=500):
+        statement = self._student_query(args, projection)
+        if limit:
+            statement = statement.limit(limit)
+        return self._stream(statement, batch_size)
+
+    def _stream(self, statement, batch_size):
+        with self._read() as connection:
+            for row in connection.execution_options(yield_per=batch_size).execute(statement):
+                yield document(row)
+
+    def count_students(self, args):
+        statement = select(func.count()).select_from(students).where(condition(students, student_filter(args)))
+        with self._read() as connection:
+            return connection.execute(statement).scalar()
+
+    def search_students(self, args, projection, max_time_ms=None):
+        query, limit = search.search_query(args, self.parse_id)
+        statement = (
+            select(*columns(students, projection), students.c.username_lower)
+            .where(condition(students, query))
+            .order_by(students.c.username_lower, students.c.id)
+            .limit(limit + 1)
+        )
+        with self._read() as connection:
+            docs = timed_rows(connection, statement, max_time_ms)
+        return search.rank_page(docs, args, limit)
+
+    def unvaccinated_in_class(self, class_grade, projection, limit=0):
+        statement = (
+            select(*columns(students, projection))
+            .where(students.c.class_grade == class_grade, students.c.is_vaccinated.is_not(True))
+            .order_by(students.c.id)
+        )
+        if limit:
+            statement = statement.limit(limit)
+        with self._read() as connection:
+            return [document(row) for row in connection.execute(statement)]
+
+    def import_rows(self, collection, rows, prepare, progress=None):
+        """
+        Validate `rows` in chunks with `prepare` and write each chunk with one executemany
+        in its own transaction. Duplicates of the unique key, in the table or earlier in the
+        file, are rejected with one IN query per chunk, as utils.importer does for Mongo.
+        """
+        table, to_row, unique_key = IMPORTS[collection]
+        report = ImportReport()
+        for chunk in chunked(enumerate(rows, start=1), DEFAULT_CHUNK_SIZE):
+            report.rows += len(chunk)
+            prepared = []
+            for row_number, row in chunk:
+                try:
+                    prepared.append((row_number, prepare(row)))
+                except RowError as e:
+                    report.reject(row_number, str(e))
+
+            with self._write() as connection:
+                if unique_key and prepared:
+                    column = table.c[unique_key]
+                    keys = [doc[unique_key] for _, doc in prepared]
+                    existing = set(connection.execute(select(column).where(column.in_(keys))).scalars())
+                    unique = []
+                    for row_number, doc in prepared:
+                        if doc[unique_key] in existing:
+                            report.reject(row_number, f"Duplicate {unique_key} {doc[unique_key]}")
+                            continue
+                        existing.add(doc[unique_key])
+                        unique.append((row_number, doc))
+                    prepared = unique
+                if prepared:
+                    docs = [doc for _, doc in prepared]
+                    if table is drives:
+                        self._insert_drives(connection, docs)
+                    else:
+                        connection.execute(insert(table), [to_row(doc) for doc in docs])
+            report.inserted += len(prepared)
+            if progress:
+                progress(report.rows)
+        return report
+
+    ### Vaccination drives
+    def _insert_drives(self, connection, docs):
+        # executemany with RETURNING, in parameter order, so the class rows can follow in one more batch
+        ids = connection.execute(
+            insert(drives).returning(drives.c.id, sort_by_parameter_order=True), [drive_row(doc) for doc in docs]
+        ).scalars().all()
+        class_rows = [{"drive_id": drive_id, "class_grade": class_grade}
+                      for drive_id, doc in zip(ids, docs) for class_grade in doc["classes"]]
+        if class_rows:
+            connection.execute(insert(drive_classes), class_rows)
+        return ids
+
+    def insert_drive(self, drive):
+        with self._write() as connection:
+            return self._insert_drives(connection, [drive])[0]
+
+    def list_drives(self, projection):
+        with self._read() as connection:
+            return [document(row) for row in connection.execute(
+                select(*columns(drives, projection)).order_by(drives.c.id)
+            )]
+
+    def drive_summaries(self):
+        statement = select(drives.c.id, drives.c.vaccine_name, drives.c.date, drives.c.is_completed).order_by(drives.c.id)
+        with self._read() as connection:
+            return [document(row) for row in connection.execute(statement)]
+
+    def drives_for_class(self, class_grade, projection):
+        covering = select(drive_classes.c.drive_id).where(drive_classes.c.class_grade == class_grade)
+        statement = select(*columns(drives, projection)).where(drives.c.id.in_(covering)).order_by(drives.c.id)
+        with self._read() as connection:
+            return [document(row) for row in connection.execute(statement)]
+
+    def drive_for_student(self, student_id):
+        try:
+            student_id = self.parse_id(student_id)
+        except InvalidId:
+            return None
+        statement = (
+            select(drives.c.id, drives.c.vaccine_name)
+            .join(registrations, registrations.c.drive_id == drives.c.id)
+            .where(registrations.c.student_id == student_id)
+            .limit(1)
+        )
+        with self._read() as connection:
+            row = connection.execute(statement).first()
+        return document(row) if row else None
+
+    def update_drive(self, drive_id, drive):
+        values = drive_row(drive)
+        if "is_completed" not in drive:
+            del values["is_completed"]  # Left as it is, like Mongo's $set
+        with self._write() as connection:
+            result = connection.execute(update(drives).where(drives.c.id == drive_id).values(values))
+            if result.rowcount:
+                connection.execute(delete(drive_classes).where(drive_classes.c.drive_id == drive_id))
+                connection.execute(insert(drive_classes), [{"drive_id": drive_id, "class_grade": class_grade}
+                                                           for class_grade in drive["classes"]])
+
+    def delete_drive(self, drive_id):
+        with self._write() as connection:
+            return connection.execute(delete(drives).where(drives.c.id == drive_id)).rowcount > 0
+
+    def complete_past_drives(self):
+        today = parse_date(datetime.now())
+        with self._write() as connection:
+            completed = connection.execute(
+                update(drives).where(drives.c.is_completed.is_not(True), drives.c.date < today).values(is_completed=True)
+            ).rowcount
+        if completed:
+            analytics.invalidate()
+            revisions.bump(revisions.DRIVES)
+        return completed
+
+    def drive_roster(self, drive_id, args=None, limit=None):
+        """The drive's roster (utils.roster) from joins on drive_classes, read in one transaction."""
+        covered = and_(drive_classes.c.drive_id == drive_id, drive_classes.c.class_grade == students.c.class_grade)
+        grouped = (
+            select(students.c.class_grade.label("_id"), func.count().label("eligible"),
+                   func.count().filter(students.c.is_vaccinated.is_(True)).label("vaccinated"),
+                   func.count().filter(students.c.drive_id == drive_id).label("vaccinated_in_drive"))
+            .join(drive_classes, covered)
+            .group_by(students.c.class_grade)
+        )
+        with self._read() as connection:
+            row = connection.execute(
+                select(*columns(drives, roster.ROSTER_DRIVE_PROJECTION)).where(drives.c.id == drive_id)
+            ).first()
+            if row is None:
+                return None
+            groups = [dict(group._mapping) for group in connection.execute(grouped)]
+            page = None
+            if args is not None:
+                query = keyset_query(student_filter(args), parse_cursor(args.get("after"), self.parse_id))
+                statement = (
+                    select(*columns(students, roster.ROSTER_PROJECTION))
+                    .join(drive_classes, covered)
+                    .where(condition(students, query))
+                    .order_by(students.c.id)
+                    .limit(limit + 1)
+                )
+                page = [document(student) for student in connection.execute(statement)]
+        return roster.shape_roster(document(row), groups, page, limit)
+
+    ### Vaccinations
+    def _explain_rejection(self, connection, drive_id, student):
+        drive = connection.execute(select(drives).where(drives.c.id == drive_id)).first()
+        if not drive:
+            return VaccinationError("Drive not found", 404, "not_found")
+        if drive.is_completed:
+            return VaccinationError("Drive is already completed")
+        if student["class_grade"] not in document(drive)["classes"]:
+            return VaccinationError("Student's class is not covered by this drive")
+        registered = connection.execute(select(registrations.c.student_id).where(
+            registrations.c.drive_id == drive_id, registrations.c.student_id == student["_id"]
+        )).first()
+        if registered:
+            return VaccinationError("Student is already registered for this drive", outcome="already_vaccinated")
+        return VaccinationError("No doses left for this drive", 409, "no_doses")
+
+    def vaccinate_with_drive(self, drive_id, student, date_of_vaccination=None):
+        """
+        The SQLite side of utils.vaccinations.vaccinate_with_drive: the dose, the registration and
+        the student change commit together, so there is nothing to hand back when one of them fails.
+        """
+        if student.get("is_vaccinated"):
+            raise VaccinationError("Already vaccinated", outcome="already_vaccinated")
+        with self._write() as connection:
+            drive = connection.execute(
+                update(drives)
+                .where(
+                    drives.c.id == drive_id,
+                    drives.c.is_completed.is_not(True),
+                    drives.c.available_doses > 0,
+                    select(drive_classes.c.drive_id).where(drive_classes.c.drive_id == drive_id,
+                                                           drive_classes.c.class_grade == student["class_grade"]).exists(),
+                    ~select(registrations.c.drive_id).where(registrations.c.drive_id == drive_id,
+                                                            registrations.c.student_id == student["_id"]).exists(),
+                )
+                .values(available_doses=drives.c.available_doses - 1)
+                .returning(drives.c.id, drives.c.vaccine_name, drives.c.available_doses)
+            ).first()
+            if not drive:
+                raise self._explain_rejection(connection, drive_id, student)
+            connection.execute(insert(registrations).values(drive_id=drive_id, student_id=student["_id"]))
+            changes = {
+                "is_vaccinated": True,
+                "vaccine_name": drive.vaccine_name,
+                "date_of_vaccination": date_of_vaccination or parse_date(datetime.now()),
+                "drive_id": drive_id
+            }
+            result = connection.execute(
+                update(students)
+                .where(students.c.id == student["_id"], students.c.is_vaccinated.is_not(True))
+                .values(changes)
+            )
+            if result.rowcount == 0:
+                # Raising rolls the dose and registration back with the transaction
+                raise VaccinationError("Already vaccinated", outcome="already_vaccinated")
+        analytics.invalidate()
+        revisions.bump(revisions.DRIVES)
+        return document(drive)
+
+    def vaccinate_batch(self, drive_id, refs, date_of_vaccination=None):
+        """
+        The SQLite side of utils.vaccinations.vaccinate_batch. The whole batch runs in one write
+        transaction, so nobody else can take doses or vaccinate its students in the meantime:
+        one query resolves the students, one UPDATE takes the doses, and two executemany
+        statements record the registrations and the vaccinations.
+        """
+        # Numeric refs may be student_id codes as well as row ids; match_refs settles each one
+        ids = [int(ref) for ref in refs if ref.isdigit()]
+        resolve = (
+            select(students.c.id, students.c.student_id, students.c.class_grade, students.c.is_vaccinated,
+                   students.c.vaccine_name)
+            .where(or_(students.c.id.in_(ids), students.c.student_id.in_(list(refs))))
+        )
+        vaccinated = []
+        with self._write() as connection:
+            drive = connection.execute(select(drives).where(drives.c.id == drive_id)).first()
+            if not drive:
+                raise VaccinationError("Drive not found", 404, "not_found")
+            drive = document(drive)
+            resolved = match_refs(refs, [document(row) for row in connection.execute(resolve)])
+            outcomes, candidates = check_eligibility(resolved, drive)
+
+            registered = set()
+            if candidates:
+                registered = {str(student_id) for student_id in connection.execute(
+                    select(registrations.c.student_id).where(registrations.c.drive_id == drive_id,
+                                                             registrations.c.student_id.in_([int(key) for key in candidates]))
+                ).scalars()}
+            for key in registered:
+                outcomes[key] = ("already_vaccinated", "Student is already registered for this drive")
+            wanted = [key for key in candidates if key not in registered]
+            taken = wanted[:max(drive["available_doses"], 0)]
+            for key in wanted[len(taken):]:
+                outcomes[key] = ("no_doses", "No doses left for this drive")
+
+            if taken:
+                changes = {
+                    "is_vaccinated": True,
+                    "vaccine_name": drive["vaccine_name"],
+                    "date_of_vaccination": date_of_vaccination or parse_date(datetime.now()),
+                    "drive_id": drive_id
+                }
+                connection.execute(update(drives).where(drives.c.id == drive_id)
+                                   .values(available_doses=drives.c.available_doses - len(taken)))
+                connection.execute(insert(registrations), [{"drive_id": drive_id, "student_id": int(key)}
+                                                           for key in taken])
+                connection.execute(update(students).where(students.c.id == bindparam("student")).values(changes),
+                                   [{"student": int(key)} for key in taken])
+                by_id = {str(student["_id"]): student for student in resolved.values()}
+                for key in taken:
+                    outcomes[key] = ("vaccinated", None)
+                    vaccinated.append(by_id[key])
+        if vaccinated:
+            analytics.invalidate()
+            revisions.bump(revisions.DRIVES)
+        return batch_results(refs, resolved, outcomes), len(vaccinated)
+
+    def claim_batch(self, drive_id, batch_key, fingerprint):
+        """The SQLite side of utils.vaccinations.claim_batch."""
+        batch_id = f"{drive_id}:{batch_key}"
+        now = datetime.utcnow()
+        with self._write() as connection:
+            # What the TTL index does for Mongo
+            connection.execute(delete(batches).where(batches.c.created_at < now - BATCH_RETENTION))
+            batch = connection.execute(select(batches).where(batches.c.id == batch_id)).first()
+            if batch is None:
+                connection.execute(insert(batches).values(id=batch_id, fingerprint=fingerprint, status="running",
+                                                          created_at=now))
+                return None
+            if batch.fingerprint != fingerprint:
+                raise VaccinationError("Batch key was already used for a different list of students", 409,
+                                       "batch_conflict")
+            if batch.status == "done":
+                return batch.response
+            if batch.created_at >= now - timedelta(seconds=STALE_BATCH_SECONDS):
+                raise VaccinationError("This batch is still being processed", 409, "batch_in_progress")
+            connection.execute(update(batches).where(batches.c.id == batch_id).values(created_at=now))
+        return None
+
+    def finish_batch(self, drive_id, batch_key, response):
+        with self._write() as connection:
+            connection.execute(update(batches).where(batches.c.id == f"{drive_id}:{batch_key}")
+                               .values(status="done", response=response, finished_at=datetime.utcnow()))
+
+    def abandon_batch(self, drive_id, batch_key):
+        with self._write() as connection:
+            connection.execute(delete(batches).where(batches.c.id == f"{drive_id}:{batch_key}",
+                                                     batches.c.status == "running"))
+
+    ### Analytics and revisions
+    def summary(self, today):
+        """
+        Count the students with one GROUP BY instead of the counters Mongo maintains; the
+        analytics cache keeps this off the request path most of the time.
+        """
+        grouped = select(students.c.class_grade, students.c.vaccine_name, students.c.is_vaccinated,
+                         func.count().label("count")).group_by(students.c.class_grade, students.c.vaccine_name,
+                                                                students.c.is_vaccinated)
+        with self._read() as connection:
+            counts = stats.count_groups(
+                ({"class_grade": row.class_grade, "vaccine_name": row.vaccine_name, "is_vaccinated": row.is_vaccinated},
+                 row.count)
+                for row in connection.execute(grouped)
+            )
+            all_drives = [document(row) for row in connection.execute(select(drives).order_by(drives.c.id))]
+        open_drives = [drive for drive in all_drives if not drive["is_completed"]]
+        raw = {
+            "open_drives": [{"_id": None, "total": len(open_drives),
+                             "available_doses": sum(drive["available_doses"] for drive in open_drives)}]
+            if open_drives else [],
+            "drives": [{key: drive[key] for key in ("_id", "is_completed", "available_doses")} for drive in all_drives],
+            "upcoming_drives": [{key: drive[key] for key in DRIVE_PROJECTION}
+                                for drive in sorted(all_drives, key=lambda drive: drive["date"])
+                                if drive["date"] >= today],
+        }
+        return analytics.shape_summary(stats.shape(stats.nest(counts)), raw)
+
+    def read_revision(self, collection):
+        with self._read() as connection:
+            return connection.execute(
+                select(revision_table.c.revision).where(revision_table.c.collection == collection)
+            ).scalar()
+
+    def write_revision(self, collection, revision):
+        statement = sqlite_insert(revision_table).values(collection=collection, revision=revision)
+        with self._write() as connection:
+            connection.execute(statement.on_conflict_do_update(index_elements=[revision_table.c.collection],
+                                                               set_={"revision": revision}))
+
+    def reset(self):
+        """Empty every table (benchmarks start from scratch)."""
+        with self._write() as connection:
+            for table in (registrations, drive_classes, batches, revision_table, students, drives, users):
+                connection.execute(delete(table))
@@ -1,10 +1,15 @@
-from flask import Blueprint, request, jsonify
+import os
+import uuid
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from db import mongo
+from repositories import DuplicateKey, QueryTimeout, store
+from routes.jobs import job_view
+from utils import analytics, revisions
 from utils.decorators import role_required
-from bson.objectid import ObjectId
-import csv
-from io import StringIO
+from utils.importer import RowError, iter_csv_rows
+from utils.jobs import runner
+from utils.pagination import QueryError, parse_bool, parse_limit, projection_from_args
+from utils.schema import SchemaError, parse_date, search_name
 
 admin_bp = Blueprint("admin", __name__)
 
@@ -17,23 +22,64 @@ def admin_dashboard():
     return jsonify(msg="Welcome Admin!"), 200
 
 ### List All Students
+STUDENT_PROJECTION = {
+    "_id": 1,
+    "username": 1,  # Ensure the name field is included
+    "class_grade": 1,
+    "student_id": 1,
+    "is_vaccinated": 1,
+    "vaccine_name": 1,
+    "date_of_vaccination": 1
+}
+
 @admin_bp.route('/students', methods=['GET'])
 @jwt_required()
 @role_required('admin')
 def list_students():
-    students = list(mongo.db.students.find({}, {
-        "_id": 1,
-        "username": 1,  # Ensure the name field is included
-        "class_grade": 1,
-        "student_id": 1,
-        "is_vaccinated": 1,
-        "vaccine_name": 1,
-        "date_of_vaccination": 1
-    }))
-    # Convert ObjectId to string for the frontend
-    for student in students:
-        student["_id"] = str(student["_id"])
-    return jsonify(students), 200
+    stream = request.args.get("format") == "ndjson"
+    try:
+        projection = projection_from_args(request.args, STUDENT_PROJECTION)
+        # Streaming mode is unbounded unless the client asks for a limit
+        if stream:
+            limit = parse_limit(request.args.get("limit"), default=None, maximum=None)
+            students = store.iter_students(request.args, projection, limit)
+        else:
+            limit = parse_limit(request.args.get("limit"))
+            students, next_cursor = store.student_page(request.args, projection, limit)
+    except QueryError as e:
+        return jsonify(msg=str(e)), 400
+
+    if stream:
+        # Stream documents as the cursor yields them instead of building the whole list
+        def generate():
+            for student in students:
+                yield current_app.json.dumps(student) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    response = jsonify(students)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
+
+### Search Students
+@admin_bp.route('/students/search', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def search_students():
+    try:
+        projection = projection_from_args(request.args, STUDENT_PROJECTION)
+        students, next_cursor = store.search_students(
+            request.args, projection, current_app.config["SEARCH_MAX_TIME_MS"]
+        )
+    except QueryError as e:
+        return jsonify(msg=str(e)), 400
+    except QueryTimeout:
+        return jsonify(msg="Search took too long, narrow it down"), 503
+    response = jsonify(students)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
 
 ### Add a Student
 @admin_bp.route('/students', methods=['POST'])
@@ -44,18 +90,58 @@ def add_student():
     # Validate student_id
     if not data.get("student_id"):
         return jsonify(msg="Student ID is required"), 400
-    if mongo.db.students.find_one({"student_id": data["student_id"]}):
+    if store.student_id_taken(data["student_id"]):
         return jsonify(msg="Student with this ID already exists"), 400
     student = {
         "username": data["username"],
+        "username_lower": search_name(data["username"]),
         "class_grade": data["class_grade"],
         "student_id": data["student_id"],  # Ensure student_id is included
         "is_vaccinated": False
     }
-    mongo.db.students.insert_one(student)
+    try:
+        store.insert_student(student)
+    except DuplicateKey:
+        # A concurrent request added the same student_id after the check above
+        return jsonify(msg="Student with this ID already exists"), 400
+    analytics.invalidate()
+    revisions.bump(revisions.STUDENTS)
     return jsonify(msg="Student added"), 201
 
 ### Bulk Upload Students via CSV
+def student_from_row(row):
+    if not row.get('username') or not row.get('class_grade') or not row.get('student_id'):
+        raise RowError("username, class_grade and student_id are required")
+    return {
+        "username": row["username"],
+        "username_lower": search_name(row["username"]),
+        "class_grade": row["class_grade"],
+        "student_id": row["student_id"],  # Ensure student_id is included
+        "is_vaccinated": False
+    }
+
+def remove_upload(params):
+    try:
+        os.remove(params["path"])
+    except FileNotFoundError:
+        pass
+
+@runner.handler("import_students", cleanup=remove_upload)
+def import_students(job):
+    """Background CSV import; the upload was saved under JOB_DIR so a retry can read it again."""
+    path = job.params["path"]
+    try:
+        with open(path, "rb") as file:
+            report = store.import_rows("students", iter_csv_rows(file), student_from_row, progress=job.set_progress)
+    except FileNotFoundError:
+        raise ValueError("Upload not found; JOB_DIR must be shared by every host running jobs")
+    except UnicodeDecodeError:
+        raise ValueError("File must be UTF-8 encoded CSV")
+    finally:
+        analytics.invalidate()  # A cancelled or failed import may still have written some chunks
+        revisions.bump(revisions.STUDENTS)
+    return report.as_dict()
+
 @admin_bp.route('/students/bulk', methods=['POST'])
 @jwt_required()
 @role_required('admin')
@@ -64,22 +150,29 @@ def upload_csv():
     if not file:
         return jsonify(msg="No file uploaded"), 400
 
-    stream = StringIO(file.stream.read().decode("UTF8"), newline=None)
-    reader = csv.DictReader(stream)
-    added = 0
-    for row in reader:
-        if not row.get('username') or not row.get('class_grade') or not row.get('student_id'):
-            continue
-        if mongo.db.students.find_one({"student_id": row["student_id"]}):
-            continue
-        mongo.db.students.insert_one({
-            "username": row["username"],
-            "class_grade": row["class_grade"],
-            "student_id": row["student_id"],  # Ensure student_id is included
-            "is_vaccinated": False
-        })
-        added += 1
-    return jsonify(msg=f"{added} students added"), 200
+    try:
+        background = parse_bool(request.args.get("background"))
+    except QueryError as e:
+        return jsonify(msg=str(e)), 400
+    if background and not store.background_jobs:
+        return jsonify(msg="Background imports need the Mongo storage backend"), 400
+    if background:
+        path = os.path.join(runner.directory, f"upload-{uuid.uuid4().hex}.csv")
+        file.save(path)
+        job = runner.submit("import_students", {"path": path})
+        response = jsonify(job_view(job))
+        response.headers["Location"] = url_for("jobs.get_job", job_id=job["_id"])
+        return response, 202
+
+    try:
+        report = store.import_rows("students", iter_csv_rows(file.stream), student_from_row)
+    except UnicodeDecodeError:
+        return jsonify(msg="File must be UTF-8 encoded CSV"), 400
+    if report.inserted:
+        analytics.invalidate()
+        revisions.bump(revisions.STUDENTS)
+    result = report.as_dict()
+    return jsonify(msg=f"{result['inserted']} students added", **result), 200
 
 ### Vaccinate a Student
 @admin_bp.route('/students/<student_id>/vaccinate', methods=['PUT'])
@@ -87,19 +180,21 @@ def upload_csv():
 @role_required('admin')
 def vaccinate_student(student_id):
     data = request.json
-    student = mongo.db.students.find_one({"_id": ObjectId(student_id)})
-    if not student:
-        return jsonify(msg="Student not found"), 404
-    if student.get("is_vaccinated"):
-        return jsonify(msg="Already vaccinated"), 400
-    mongo.db.students.update_one(
-        {"_id": ObjectId(student_id)},
-        {"$set": {
+    try:
+        changes = {
             "is_vaccinated": True,
             "vaccine_name": data["vaccine_name"],
-            "date_of_vaccination": data["date_of_vaccination"]
-        }}
-    )
+            "date_of_vaccination": parse_date(data["date_of_vaccination"])
+        }
+    except SchemaError as e:
+        return jsonify(msg=str(e)), 400
+    # Only an unvaccinated student matches, so concurrent requests can't both succeed
+    if not store.vaccinate_student(student_id, changes):
+        if not store.get_student(student_id, {"_id": 1}):
+            return jsonify(msg="Student not found"), 404
+        return jsonify(msg="Already vaccinated"), 400
+    analytics.invalidate()
+    revisions.bump(revisions.STUDENTS)
     return jsonify(msg="Student vaccinated"), 200
 
 ### Update Student Details
@@ -117,7 +212,23 @@ def update_student(student_id):
     if "_id" in data:
         data.pop("_id")
 
-    mongo.db.students.update_one({"_id": ObjectId(student_id)}, {"$set": data})
+    # Keep the search key in step with the name
+    data.pop("username_lower", None)
+    if data.get("username"):
+        data["username_lower"] = search_name(data["username"])
+
+    if data.get("date_of_vaccination"):
+        try:
+            data["date_of_vaccination"] = parse_date(data["date_of_vaccination"])
+        except SchemaError as e:
+            return jsonify(msg=str(e)), 400
+
+    try:
+        store.update_student(student_id, data)
+    except DuplicateKey:
+        return jsonify(msg="Student with this ID already exists"), 400
+    analytics.invalidate()
+    revisions.bump(revisions.STUDENTS)
     return jsonify({"msg": "Student details updated successfully!"}), 200
 
 ### Analytics
@@ -126,25 +237,6 @@ def update_student(student_id):
 @role_required('admin')
 def get_analytics():
     try:
-        # Total number of students
-        total_students = mongo.db.students.count_documents({})
-
-        # Number of vaccinated students
-        vaccinated_students = mongo.db.students.count_documents({"is_vaccinated": True})
-
-         # Fetch all drives and include the `is_completed` property
-        drives = list(mongo.db.vaccination_drives.find({}, {"_id": 1, "is_completed": 1, "available_doses": 1}))
-        non_completed_drives = [drive for drive in drives if not drive.get("is_completed", False)]
-        
-        total_drives = len(non_completed_drives)
-        available_doses = sum(drive["available_doses"] for drive in non_completed_drives)
-
-        return jsonify({
-            "total_students": total_students,
-            "vaccinated_students": vaccinated_students,
-            "vaccination_drives": drives,
-            "total_drives": total_drives,
-            "available_doses": available_doses
-        }), 200
+        return jsonify(analytics.admin_view(analytics.get_summary())), 200
     except Exception as e:
         return jsonify({"msg": f"Error fetching analytics: {str(e)}"}), 500
@@ -1,8 +1,7 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token
-from werkzeug.security import generate_password_hash, check_password_hash
-from db import mongo
-import json
+from repositories import DuplicateKey, store
+from utils.hashing import HashingBusy, hasher
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -14,12 +13,15 @@ def register():
         return jsonify(msg="Username, password, and role are required"), 400
 
     # Check if user exists
-    existing = mongo.db.users.find_one({"username": data["username"]})
+    existing = store.find_user(data["username"])
     if existing:
         return jsonify(msg="Username already exists"), 400
 
     # Hash password
-    hashed_pw = generate_password_hash(data["password"])
+    try:
+        hashed_pw = hasher.hash(data["password"])
+    except HashingBusy as e:
+        return busy_response(e)
     
     # Create user
     user = {
@@ -28,7 +30,11 @@ def register():
         "role": data["role"]
     }
 
-    mongo.db.users.insert_one(user)
+    try:
+        store.insert_user(user)
+    except DuplicateKey:
+        # Registered concurrently after the check above; the unique index on username decides
+        return jsonify(msg="Username already exists"), 400
     return jsonify(msg="User registered successfully"), 201
 
 # 🔑 Login and get JWT
@@ -38,10 +44,27 @@ def login():
     if not data.get("username") or not data.get("password"):
         return jsonify(msg="Username and password required"), 400
 
-    user = mongo.db.users.find_one({"username": data["username"]})
-    if not user or not check_password_hash(user["password"], data["password"]):
-        return jsonify(msg="Invalid username or password"), 401
+    user = store.find_user(data["username"])
+    try:
+        if not user or not hasher.verify(user["password"], data["password"]):
+            return jsonify(msg="Invalid username or password"), 401
+    except HashingBusy as e:
+        return busy_response(e)
+
+    # Upgrade hashes made with older parameters while the plaintext is at hand
+    if hasher.needs_rehash(user["password"]):
+        try:
+            store.set_password(user, hasher.hash(data["password"]))
+        except HashingBusy:
+            pass  # Try again on a later login rather than failing this one
+
+    return jsonify(access_token=create_token(user)), 200
+
+def busy_response(error):
+    response = jsonify(msg="Server is busy, please retry shortly")
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 503
 
-    # Generate JWT token
-    token = create_access_token(identity=json.dumps({"username": user["username"], "role": user["role"]}))
-    return jsonify(access_token=token), 200
+def create_token(user):
+    """Issue the access token for a user document, with the role as a structured claim."""
+    return create_access_token(identity=user["username"], additional_claims={"role": user["role"]})
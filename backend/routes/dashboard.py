@@ -1,8 +1,7 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify, request
 from flask_jwt_extended import jwt_required
+from utils import analytics, live
 from utils.decorators import role_required
-from db import mongo
-from datetime import datetime
 
 dashboard_bp = Blueprint("dashboard", __name__, url_prefix="/analytics")
 
@@ -10,16 +9,20 @@ dashboard_bp = Blueprint("dashboard", __name__, url_prefix="/analytics")
 @jwt_required()
 @role_required('admin')
 def dashboard_data():
-    total = mongo.db.students.count_documents({})
-    vaccinated = mongo.db.students.count_documents({"is_vaccinated": True})
-    drives = list(mongo.db.vaccination_drives.find({
-        "date": {"$gte": datetime.now().strftime("%Y-%m-%d")}
-    }))
-    for d in drives:
-        d["_id"] = str(d["_id"])
-    return jsonify({
-        "total_students": total,
-        "vaccinated_students": vaccinated,
-        "percent_vaccinated": round((vaccinated / total) * 100, 2) if total else 0,
-        "upcoming_drives": drives
-    })
+    return jsonify(analytics.dashboard_view(analytics.get_summary()))
+
+@dashboard_bp.route('/cache', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def cache_stats():
+    return jsonify(analytics.analytics_cache.stats()), 200
+
+@dashboard_bp.route('/stream', methods=['GET'])
+# EventSource can't send headers, so browsers pass the token as ?jwt=<token>
+@jwt_required(locations=["headers", "query_string"])
+@role_required('admin')
+def stream():
+    # Browsers resend the id of the last event they saw when they reconnect
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    return Response(live.broadcaster.stream(last_event_id), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
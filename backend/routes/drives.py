@@ -1,9 +1,12 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
+from utils import analytics, revisions
 from utils.decorators import role_required
-from db import mongo
-from datetime import datetime, timedelta
-from bson.objectid import ObjectId
+from utils.pagination import QueryError, parse_limit, projection_from_args
+from utils.schema import DRIVE_PROJECTION, SchemaError, normalize_drive, parse_date
+from utils.vaccinations import MAX_BATCH_SIZE, VaccinationError, batch_fingerprint
+from repositories import store
+from datetime import datetime
 from bson.errors import InvalidId
 
 drive_bp = Blueprint("drive", __name__, url_prefix="/drives")
@@ -19,71 +22,65 @@ def create_drive():
         return jsonify(msg="All fields are required"), 400
 
     try:
-        date_obj = datetime.strptime(data["date"], "%Y-%m-%d")
-        current_date = datetime.now()
-
-        # Validation: If the drive date is in the future, ensure it is more than 15 days ahead
-        if date_obj > current_date:
-            date_difference = (date_obj - current_date).days
-            if date_difference <= 15:
-                return jsonify(msg="Drive must be at least 15 days ahead"), 400
+        # Canonical form: BSON date, trimmed class list, integer doses
+        drive = normalize_drive(data)
+    except SchemaError as e:
+        return jsonify(msg=str(e)), 400
+    if not drive["classes"]:
+        return jsonify(msg="All fields are required"), 400
+    drive.setdefault("is_completed", False)  # Default to False if not provided
 
-        # Validation: If the drive date is in the past, ensure "is_completed" is True
-        if date_obj < current_date and not data.get("is_completed", False):
-            return jsonify(msg="For past dates, the drive must be marked as completed"), 400
+    date_obj = drive["date"]
+    current_date = datetime.now()
 
-        # Prepare the drive data for insertion
-        drive = {
-            "vaccine_name": data["vaccine_name"],
-            "date": data["date"],
-            "available_doses": int(data["available_doses"]),
-            "classes": data["classes"].split(","),  # Convert comma-separated string to list
-            "is_completed": data.get("is_completed", False)  # Default to False if not provided
-        }
+    # Validation: If the drive date is in the future, ensure it is more than 15 days ahead
+    if date_obj > current_date:
+        date_difference = (date_obj - current_date).days
+        if date_difference <= 15:
+            return jsonify(msg="Drive must be at least 15 days ahead"), 400
 
-        # Insert the drive into the database
-        mongo.db.vaccination_drives.insert_one(drive)
-        return jsonify(msg="Drive created successfully"), 201
+    # Validation: If the drive date is in the past, ensure "is_completed" is True
+    if date_obj < current_date and not drive["is_completed"]:
+        return jsonify(msg="For past dates, the drive must be marked as completed"), 400
 
-    except ValueError:
-        return jsonify(msg="Invalid date format. Use YYYY-MM-DD"), 400
+    # Insert the drive into the database
+    store.insert_drive(drive)
+    analytics.invalidate()
+    revisions.bump(revisions.DRIVES)
+    return jsonify(msg="Drive created successfully"), 201
 
 @drive_bp.route('/', methods=['GET'])
 @jwt_required()
+@revisions.conditional(revisions.DRIVES)
 def list_drives():
-    drives = mongo.db.vaccination_drives.find()
-    formatted_drives = []
-    for drive in drives:
-        drive["_id"] = str(drive["_id"])  # Convert ObjectId to string
-        if isinstance(drive["date"], str):
-            drive["date"] = drive["date"]  # Keep it as is
-        else:
-            drive["date"] = drive["date"].isoformat()  # Convert datetime to ISO string
-        formatted_drives.append(drive)
-
-    return jsonify(formatted_drives)
+    try:
+        projection = projection_from_args(request.args, DRIVE_PROJECTION)
+    except QueryError as e:
+        return jsonify(msg=str(e)), 400
+    # The JSON provider encodes ObjectId and dates, so documents go out as the store returns them
+    return jsonify(store.list_drives(projection))
 
 @drive_bp.route('/<id>', methods=['PUT'])
 @jwt_required()
 @role_required('admin')
 def update_drive(id):
     try:
-        # Validate the ObjectId
-        object_id = ObjectId(id)
+        # Validate the ID
+        drive_id = store.parse_id(id)
     except InvalidId:
         return jsonify(msg="Invalid drive ID"), 400
 
     data = request.json
     try:
-        mongo.db.vaccination_drives.update_one(
-            {"_id": object_id},
-            {"$set": {
-                "vaccine_name": data["vaccine_name"],
-                "date": data["date"],
-                "available_doses": int(data["available_doses"]),
-                "classes": data["classes"].split(",")  # Convert comma-separated string to list
-            }}
-        )
+        drive = normalize_drive(data)
+    except KeyError:
+        return jsonify(msg="All fields are required"), 400
+    except SchemaError as e:
+        return jsonify(msg=str(e)), 400
+    try:
+        store.update_drive(drive_id, drive)
+        analytics.invalidate()
+        revisions.bump(revisions.DRIVES)
         return jsonify(msg="Drive updated successfully"), 200
     except Exception as e:
         print(f"Error updating drive: {e}")
@@ -94,22 +91,158 @@ def update_drive(id):
 @role_required('admin')
 def delete_drive(id):
     try:
-        # Validate the ObjectId
-        object_id = ObjectId(id)
+        # Validate the ID
+        drive_id = store.parse_id(id)
     except InvalidId:
         return jsonify(msg="Invalid drive ID"), 400
 
     # Attempt to delete the drive
-    result = mongo.db.vaccination_drives.delete_one({"_id": object_id})
-    if result.deleted_count == 0:
+    if not store.delete_drive(drive_id):
         return jsonify(msg="Drive not found"), 404
+    analytics.invalidate()
+    revisions.bump(revisions.DRIVES)
     return jsonify(msg="Drive deleted successfully"), 200
 
+VACCINATION_PROJECTION = {"_id": 1, "student_id": 1, "class_grade": 1, "is_vaccinated": 1, "vaccine_name": 1}
+
+@drive_bp.route('/<id>/vaccinate', methods=['POST'])
+@jwt_required()
+@role_required('admin')
+def vaccinate_from_drive(id):
+    data = request.json or {}
+    if not data.get("student_id"):
+        return jsonify(msg="Student ID is required"), 400
+    try:
+        drive_id = store.parse_id(id)
+        student_id = store.parse_id(data["student_id"])
+    except (InvalidId, TypeError):
+        return jsonify(msg="Invalid drive or student ID"), 400
+
+    try:
+        date_of_vaccination = parse_date(data["date_of_vaccination"]) if data.get("date_of_vaccination") else None
+    except SchemaError as e:
+        return jsonify(msg=str(e)), 400
+
+    student = store.get_student(student_id, VACCINATION_PROJECTION)
+    if not student:
+        return jsonify(msg="Student not found"), 404
+    try:
+        drive = store.vaccinate_with_drive(drive_id, student, date_of_vaccination)
+    except VaccinationError as e:
+        return jsonify(msg=e.msg), e.status
+    return jsonify(msg="Student vaccinated", available_doses=drive["available_doses"]), 200
+
+@drive_bp.route('/<id>/vaccinate/class', methods=['POST'])
+@jwt_required()
+@role_required('admin')
+def vaccinate_class(id):
+    try:
+        drive_id = store.parse_id(id)
+    except InvalidId:
+        return jsonify(msg="Invalid drive ID"), 400
+    data = request.json or {}
+    if not data.get("class_grade"):
+        return jsonify(msg="Class grade is required"), 400
+    try:
+        date_of_vaccination = parse_date(data["date_of_vaccination"]) if data.get("date_of_vaccination") else None
+    except SchemaError as e:
+        return jsonify(msg=str(e)), 400
+
+    # The class goes through the batch path: one dose reservation and one write, at most MAX_BATCH_SIZE students
+    students = store.unvaccinated_in_class(data["class_grade"], {"_id": 1, "student_id": 1},
+                                           limit=MAX_BATCH_SIZE + 1)
+    if len(students) > MAX_BATCH_SIZE:
+        return jsonify(msg=f"Class has more than {MAX_BATCH_SIZE} unvaccinated students; "
+                           f"vaccinate it in batches with POST /drives/{id}/vaccinations"), 400
+    try:
+        # By student_id code, which a ref resolves to before any internal id
+        refs = [student.get("student_id") or str(student["_id"]) for student in students]
+        results, vaccinated = store.vaccinate_batch(drive_id, refs, date_of_vaccination)
+    except VaccinationError as e:
+        return jsonify(msg=e.msg), e.status
+    return jsonify(msg=f"{vaccinated} students vaccinated", vaccinated=vaccinated, results=results), 200
+
+@drive_bp.route('/<id>/vaccinations', methods=['POST'])
+@jwt_required()
+@role_required('admin')
+def record_vaccinations(id):
+    try:
+        drive_id = store.parse_id(id)
+    except InvalidId:
+        return jsonify(msg="Invalid drive ID"), 400
+    data = request.json or {}
+    refs = data.get("students")
+    if not isinstance(refs, list) or not refs or not all(isinstance(ref, str) and ref for ref in refs):
+        return jsonify(msg="students must be a non-empty list of student IDs"), 400
+    if len(refs) > MAX_BATCH_SIZE:
+        return jsonify(msg=f"At most {MAX_BATCH_SIZE} students per batch"), 400
+    batch_key = data.get("batch_key")
+    if batch_key is not None and (not isinstance(batch_key, str) or not batch_key or len(batch_key) > 128):
+        return jsonify(msg="batch_key must be a string of at most 128 characters"), 400
+    try:
+        date_of_vaccination = parse_date(data["date_of_vaccination"]) if data.get("date_of_vaccination") else None
+    except SchemaError as e:
+        return jsonify(msg=str(e)), 400
+
+    try:
+        if batch_key:
+            # A retry of a finished batch gets the original answer instead of a second run
+            replay = store.claim_batch(drive_id, batch_key, batch_fingerprint(refs, date_of_vaccination))
+            if replay is not None:
+                response = jsonify(replay)
+                response.headers["Idempotent-Replayed"] = "true"
+                return response, 200
+        try:
+            results, vaccinated = store.vaccinate_batch(drive_id, refs, date_of_vaccination)
+        except Exception:
+            if batch_key:
+                store.abandon_batch(drive_id, batch_key)
+            raise
+    except VaccinationError as e:
+        return jsonify(msg=e.msg), e.status
+
+    body = {"msg": f"{vaccinated} students vaccinated", "vaccinated": vaccinated, "results": results}
+    if batch_key:
+        store.finish_batch(drive_id, batch_key, body)
+    return jsonify(body), 200
+
+@drive_bp.route('/<id>/roster', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+@revisions.conditional(revisions.DRIVES, revisions.STUDENTS)
+def get_roster(id):
+    try:
+        drive_id = store.parse_id(id)
+    except InvalidId:
+        return jsonify(msg="Invalid drive ID"), 400
+    try:
+        # Same filters as GET /students (class_grade, is_vaccinated, vaccine_name, name, after)
+        roster = store.drive_roster(drive_id, request.args, parse_limit(request.args.get("limit")))
+    except QueryError as e:
+        return jsonify(msg=str(e)), 400
+    if roster is None:
+        return jsonify(msg="Drive not found"), 404
+    return jsonify(roster), 200
+
+@drive_bp.route('/<id>/roster/summary', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+@revisions.conditional(revisions.DRIVES, revisions.STUDENTS)
+def get_roster_summary(id):
+    try:
+        drive_id = store.parse_id(id)
+    except InvalidId:
+        return jsonify(msg="Invalid drive ID"), 400
+    roster = store.drive_roster(drive_id)
+    if roster is None:
+        return jsonify(msg="Drive not found"), 404
+    return jsonify(roster), 200
+
 @drive_bp.route('/student/<student_id>', methods=['GET'])
 @jwt_required()
 @role_required('admin')
 def get_drive_for_student(student_id):
-    drive = mongo.db.vaccination_drives.find_one({"registered_students": student_id})
+    drive = store.drive_for_student(student_id)
     if not drive:
         return jsonify(msg="No vaccination drive found for this student"), 404
     return jsonify({
@@ -119,31 +252,22 @@ def get_drive_for_student(student_id):
 @drive_bp.route('/vaccination_drives', methods=['GET'])
 @jwt_required()
 @role_required('admin')
+@revisions.conditional(revisions.DRIVES)
 def get_vaccination_drives():
-    drives = mongo.db.vaccination_drives.find()
-    drives_list = []
-    for drive in drives:
-        drives_list.append({
-            "_id": str(drive["_id"]),  # Convert ObjectId to string
-            "vaccine_name": drive["vaccine_name"],
-            "date": drive["date"],
-            "is_completed": drive.get("is_completed", False)  # Default to False if missing
-        })
-    return jsonify(drives_list), 200
+    return jsonify(store.drive_summaries()), 200
 
 @drive_bp.route('/by-class', methods=['GET'])
 @jwt_required()
 @role_required('admin')
+@revisions.conditional(revisions.DRIVES)
 def get_drives_by_class():
     class_grade = request.args.get("class_grade")
     if not class_grade:
         return jsonify(msg="Class grade is required"), 400
 
     try:
-        # Query drives where the class_grade is included in the classes array
-        drives = list(mongo.db.vaccination_drives.find({"classes": class_grade}))
-        for drive in drives:
-            drive["_id"] = str(drive["_id"])  # Convert ObjectId to string
+        # Drives whose classes include the class_grade
+        drives = store.drives_for_class(class_grade, DRIVE_PROJECTION)
         return jsonify(drives), 200
     except Exception as e:
         print(f"Error fetching drives: {e}")
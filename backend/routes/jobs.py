@@ -0,0 +1,67 @@
+import os
+from flask import Blueprint, jsonify, request, send_file, url_for
+from flask_jwt_extended import jwt_required
+from utils.decorators import role_required
+from utils.jobs import runner
+from utils.pagination import QueryError, parse_limit
+
+jobs_bp = Blueprint("jobs", __name__, url_prefix="/jobs")
+
+
+def job_view(job):
+    view = {key: value for key, value in job.items() if key not in ("params", "file", "owner")}
+    view["id"] = view.pop("_id")
+    if job["status"] == "completed" and job.get("file"):
+        view["download_url"] = url_for("jobs.download_job", job_id=job["_id"])
+    return view
+
+
+### List Jobs
+@jobs_bp.route('', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def list_jobs():
+    try:
+        limit = parse_limit(request.args.get("limit"), default=50, maximum=500)
+    except QueryError as e:
+        return jsonify(msg=str(e)), 400
+    jobs = runner.recent(request.args.get("status"), request.args.get("kind"), limit)
+    return jsonify([job_view(job) for job in jobs]), 200
+
+### Job Status
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def get_job(job_id):
+    job = runner.get(job_id)
+    if not job or job["kind"] == "schedule":
+        return jsonify(msg="Job not found"), 404
+    return jsonify(job_view(job)), 200
+
+### Cancel a Job
+@jobs_bp.route('/<job_id>/cancel', methods=['POST'])
+@jwt_required()
+@role_required('admin')
+def cancel_job(job_id):
+    job = runner.cancel(job_id)
+    if not job or job["kind"] == "schedule":
+        return jsonify(msg="Job not found"), 404
+    if job["status"] in ("completed", "failed"):
+        return jsonify(msg=f"Job already {job['status']}"), 409
+    return jsonify(job_view(job)), 202 if job["status"] == "running" else 200
+
+### Download a Job's Result
+@jobs_bp.route('/<job_id>/download', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def download_job(job_id):
+    job = runner.get(job_id)
+    if not job or not job.get("file"):
+        return jsonify(msg="Job not found"), 404
+    if job["status"] != "completed":
+        return jsonify(msg=f"Job is {job['status']}"), 409
+    if not os.path.exists(job["file"]):
+        return jsonify(msg="Result is not available on this server; JOB_DIR must be shared by every host"), 410
+    result = job.get("result") or {}
+    return send_file(job["file"], mimetype=result.get("mimetype"), as_attachment=True,
+                     download_name=result.get("download_name") or os.path.basename(job["file"]))
@@ -0,0 +1,29 @@
+from flask import Blueprint, Response, current_app, jsonify, request
+from utils import analytics, live, metrics, revisions
+from utils.decorators import identity_cache
+from utils.hashing import hasher
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+def pool_gauges():
+    hashing = hasher.stats()
+    streams = live.broadcaster.stats()
+    caches = {"analytics": analytics.analytics_cache.stats(), "identity": identity_cache.stats(),
+              "responses": revisions.response_cache.stats()}
+    return [
+        ("password_hash_workers", "Password hashing threads", [("", hashing["workers"])]),
+        ("password_hash_in_flight", "Hashes running or waiting for a thread", [("", hashing["in_flight"])]),
+        ("password_hash_queued", "Hashes waiting for a thread", [("", hashing["queued"])]),
+        ("analytics_stream_subscribers", "Open /analytics/stream connections", [("", streams["subscribers"])]),
+        ("cache_entries", "Entries currently cached",
+         [(f'{{cache="{name}"}}', stats["entries"]) for name, stats in caches.items()]),
+    ]
+
+### Prometheus Metrics
+@metrics_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    token = current_app.config["METRICS_TOKEN"]
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return jsonify(msg="Invalid metrics token"), 401
+    return Response(metrics.render(pool_gauges() + metrics.pool_stats.gauges()), mimetype="text/plain; version=0.0.4")
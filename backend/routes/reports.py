@@ -0,0 +1,70 @@
+import tempfile
+from datetime import date
+from flask import Blueprint, Response, current_app, jsonify, request, send_file, stream_with_context, url_for
+from flask_jwt_extended import jwt_required
+from repositories import store
+from routes.jobs import job_view
+from utils import reports
+from utils.decorators import role_required
+from utils.jobs import runner
+from utils.pagination import QueryError, parse_bool
+
+reports_bp = Blueprint("reports", __name__, url_prefix="/reports")
+
+def download_name(extension):
+    return f"vaccination-report-{date.today().isoformat()}.{extension}"
+
+
+REPORT_FILTERS = ("class_grade", "is_vaccinated", "vaccine_name", "name")
+
+
+@runner.handler("export_report")
+def export_report(job):
+    """Background export: write the report to the job's output file."""
+    fmt = job.params["format"]
+    writer, _, extension = reports.FORMATS[fmt]
+    filters = job.params["filters"]
+    total = store.count_students(filters)
+    with open(job.output_path(extension), "wb") as fileobj:
+        writer(reports.report_rows(filters), fileobj, lambda count: job.set_progress(count, total))
+    return {"format": fmt, "rows": job.progress, "download_name": download_name(extension),
+            "mimetype": reports.FORMATS[fmt][1]}
+
+
+### Vaccination Report (CSV / XLSX / PDF)
+@reports_bp.route('/vaccinations', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def vaccination_report():
+    fmt = request.args.get("format", "csv").lower()
+    try:
+        reports.check_format(fmt)
+        filters = {key: request.args[key] for key in REPORT_FILTERS if request.args.get(key)}
+        students = reports.report_rows(filters)  # Checks the filters before anything is sent
+        background = parse_bool(request.args.get("background"))
+    except (QueryError, reports.ReportError) as e:
+        return jsonify(msg=str(e)), 400
+
+    if background and not store.background_jobs:
+        return jsonify(msg="Background exports need the Mongo storage backend"), 400
+    # CSV streams in constant memory; the file formats move to a job once they get large
+    if background is None and fmt != "csv" and store.background_jobs:
+        background = store.count_students(filters) > current_app.config["REPORT_INLINE_ROWS"]
+    if background:
+        # Filters rather than the query go into the job, so it can be re-run after a restart
+        job = runner.submit("export_report", {"format": fmt, "filters": filters})
+        response = jsonify(job_view(job))
+        response.headers["Location"] = url_for("jobs.get_job", job_id=job["_id"])
+        return response, 202
+
+    writer, mimetype, extension = reports.FORMATS[fmt]
+    headers = {"Content-Disposition": f"attachment; filename={download_name(extension)}"}
+    if fmt == "csv":
+        chunks = reports.iter_csv(students)
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+    # Small workbooks/PDFs stay in memory; anything bigger spills to a temp file
+    output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    writer(students, output)
+    output.seek(0)
+    return send_file(output, mimetype=mimetype, as_attachment=True, download_name=download_name(extension))
@@ -1,91 +1,117 @@
+import argparse
 import csv
-from db import mongo
+from db import init_mongo, mongo
 from flask import Flask
-from werkzeug.security import generate_password_hash
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from config import Config
+from repositories import store
+from utils import revisions, schema
+from utils.hashing import with_hashed_passwords
+from utils.importer import RowError
+from utils.migrations import apply_migrations
 
-app = Flask(__name__)
-app.config["MONGO_URI"] = "mongodb://localhost:27017/vaccination_portal"
-mongo.init_app(app)
+def create_app():
+    """A bare app for the storage backend; nothing loads until main() runs."""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_mongo(app)
+    store.init_app(app)
+    return app
+
+def print_report(label, csv_file, report):
+    result = report.as_dict()
+    for reject in result["rejects"]:
+        print(f"Skipped {label} row {reject['row']}: {reject['reason']}")
+    print(f"{result['inserted']} {label} from {csv_file} uploaded successfully "
+          f"({result['rows_per_second']} rows/s).")
+
+def parse_date(value):
+    """
+    Parse an optional YYYY-MM-DD column, rejecting the row if it is malformed.
+    """
+    if not value or not value.strip():  # Check if the field is not empty
+        return None
+    try:
+        return schema.parse_date(value)
+    except schema.SchemaError:
+        raise RowError(f"Invalid date format: {value}")
+
+def user_from_row(row):
+    return {
+        "username": row["username"],
+        "password": row["password"],  # Already hashed by with_hashed_passwords
+        "role": row["role"],  # e.g., "admin" or "user"
+    }
+
+def student_from_row(row):
+    return {
+        "username": row["username"],
+        "username_lower": schema.search_name(row["username"]),
+        "class_grade": row["class_grade"],  # e.g., "1A", "CS101"
+        "student_id": row["student_id"],  # Unique 6-character ID
+        "is_vaccinated": row["is_vaccinated"].lower() == "true",  # Convert to boolean
+        "vaccine_name": row["vaccine_name"] if row["vaccine_name"] else None,
+        "date_of_vaccination": parse_date(row["date_of_vaccination"]),  # Parsed date or None
+    }
+
+def drive_from_row(row):
+    if not row["date"].strip():
+        raise RowError("Drive date is required")
+    try:
+        drive = schema.normalize_drive(row)  # e.g. classes "[5B,6B,7B]" -> ["5B", "6B", "7B"]
+    except schema.SchemaError as e:
+        raise RowError(str(e))
+    drive.setdefault("is_completed", False)
+    return drive
 
 def bulk_upload_users(csv_file):
     """
     Upload users from a CSV file to the database.
     """
-    with open(csv_file, 'r') as file:
-        reader = csv.DictReader(file)
-        users = mongo.db.users
-        for row in reader:
-            users.insert_one({
-                "username": row["username"],
-                "password": generate_password_hash(row["password"]),
-                "role": row["role"],  # e.g., "admin" or "user"
-            })
-        print(f"Users from {csv_file} uploaded successfully.")
+    with open(csv_file, 'r', newline='') as file, ProcessPoolExecutor() as pool:
+        rows = with_hashed_passwords(csv.DictReader(file), pool, method=Config.PASSWORD_HASH_METHOD)
+        report = store.import_rows("users", rows, user_from_row)
+    print_report("users", csv_file, report)
 
 def bulk_upload_students(csv_file):
     """
     Upload students from a CSV file to the database.
     """
-    with open(csv_file, 'r') as file:
-        reader = csv.DictReader(file)
-        students = mongo.db.students
-        for row in reader:
-            # Handle empty or invalid date_of_vaccination
-            date_of_vaccination = None
-            if row["date_of_vaccination"].strip():  # Check if the field is not empty
-                try:
-                    date_of_vaccination = datetime.strptime(row["date_of_vaccination"], '%Y-%m-%d')
-                except ValueError:
-                    print(f"Invalid date format for student {row['username']}: {row['date_of_vaccination']}")
-                    continue  # Skip this record if the date is invalid
-
-            students.insert_one({
-                "username": row["username"],
-                "class_grade": row["class_grade"],  # e.g., "1A", "CS101"
-                "student_id": row["student_id"],  # Unique 6-character ID
-                "is_vaccinated": row["is_vaccinated"].lower() == "true",  # Convert to boolean
-                "vaccine_name": row["vaccine_name"] if row["vaccine_name"] else None,
-                "date_of_vaccination": date_of_vaccination,  # Parsed date or None
-            })
-        print(f"Students from {csv_file} uploaded successfully.")
+    with open(csv_file, 'r', newline='') as file:
+        report = store.import_rows("students", csv.DictReader(file), student_from_row)
+    revisions.bump(revisions.STUDENTS)
+    print_report("students", csv_file, report)
 
 def bulk_upload_vaccination_drives(csv_file):
     """
     Upload vaccination drives from a CSV file to the database.
     """
-    with open(csv_file, 'r') as file:
-        reader = csv.DictReader(file)
-        drives = mongo.db.vaccination_drives
-        for row in reader:
-            # Handle empty or invalid date
-            drive_date = None
-            if row["date"].strip():  # Check if the field is not empty
-                try:
-                    drive_date = datetime.strptime(row["date"], '%Y-%m-%d')
-                except ValueError:
-                    print(f"Invalid date format for drive {row['vaccine_name']}: {row['date']}")
-                    continue  # Skip this record if the date is invalid
-
-            # Handle missing or invalid is_completed field
-            is_completed = str(row.get("is_completed", "false")).lower() == "true"
+    with open(csv_file, 'r', newline='') as file:
+        report = store.import_rows("vaccination_drives", csv.DictReader(file), drive_from_row)
+    revisions.bump(revisions.DRIVES)
+    print_report("vaccination drives", csv_file, report)
 
-            # Parse the date field from the CSV
-            drive_date = datetime.strptime(row["date"], '%Y-%m-%d') if row["date"].strip() else None
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load users, students and vaccination drives from CSV files.")
+    parser.add_argument("--users", default="users.csv", help="users CSV (passwords in plain text, hashed on load)")
+    parser.add_argument("--students", default="students.csv")
+    parser.add_argument("--drives", default="vaccination_drives.csv")
+    parser.add_argument("--only", nargs="+", choices=["users", "students", "drives"], help="load just these files")
+    parser.add_argument("--skip-migrations", action="store_true")
+    args = parser.parse_args(argv)
+    only = set(args.only or ["users", "students", "drives"])
 
-            drives.insert_one({
-                "vaccine_name": row["vaccine_name"],
-                "date": drive_date,
-                "available_doses": int(row["available_doses"]),
-                "classes": row["classes"].strip("[]").split(",") if row["classes"] else [],
-                "is_completed": str(row.get("is_completed", "false")).lower() == "true"
-            })
-        print(f"Vaccination drives from {csv_file} uploaded successfully.")
+    with create_app().app_context():
+        if store.name == "mongo" and not args.skip_migrations:
+            apply_migrations(mongo.db)
+        print("Starting data upload...")
+        if "users" in only:
+            bulk_upload_users(args.users)
+        if "students" in only:
+            bulk_upload_students(args.students)
+        if "drives" in only:
+            bulk_upload_vaccination_drives(args.drives)
+        print("All CSV files uploaded successfully.")
 
-with app.app_context():
-    # Upload CSV files
-    print("Starting data upload...")
-    bulk_upload_users("users.csv")
-    bulk_upload_students("students.csv")
-    bulk_upload_vaccination_drives("vaccination_drives.csv")
-    print("All CSV files uploaded successfully.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from datetime import datetime
+from flask import current_app
+from repositories import store
+from utils.cache import TTLCache
+from utils.schema import parse_date
+
+analytics_cache = TTLCache("analytics", ttl=30)
+# Called after every invalidation, e.g. by utils.live to push the change to open streams
+listeners = []
+
+
+def drives_pipeline():
+    """
+    Every drive counter in a single $facet over vaccination_drives. The leading $match and
+    $project let the planner answer it from the is_completed_doses_id index alone (a covered
+    scan), since every drive has a boolean is_completed.
+    """
+    return [
+        {"$match": {"is_completed": {"$in": [True, False]}}},
+        {"$project": {"_id": 1, "is_completed": 1, "available_doses": 1}},
+        {"$facet": {
+            "open_drives": [
+                {"$match": {"is_completed": False}},
+                {"$group": {"_id": None, "total": {"$sum": 1}, "available_doses": {"$sum": "$available_doses"}}}
+            ],
+            "drives": [
+                {"$sort": {"_id": 1}}
+            ]
+        }}
+    ]
+
+
+def upcoming_query(today):
+    """Drives from today on, read through the date index (sort by date)."""
+    return {"date": {"$gte": today}}
+
+
+def shape_summary(students, raw):
+    """
+    Combine the materialized student counters with the drive $facet output and the
+    upcoming drives into the response fields shared by /analytics and /analytics/analytics.
+    """
+    open_drives = raw["open_drives"][0] if raw["open_drives"] else {"total": 0, "available_doses": 0}
+    total, vaccinated = students["total"], students["vaccinated"]
+    return {
+        "total_students": total,
+        "vaccinated_students": vaccinated,
+        "percent_vaccinated": round((vaccinated / total) * 100, 2) if total else 0,
+        "by_class": students["by_class"],
+        "by_vaccine": students["by_vaccine"],
+        "total_drives": open_drives["total"],
+        "available_doses": open_drives["available_doses"],
+        "vaccination_drives": raw["drives"],
+        "upcoming_drives": raw["upcoming_drives"],
+    }
+
+
+def admin_view(summary):
+    """Fields returned by /analytics."""
+    return {
+        "total_students": summary["total_students"],
+        "vaccinated_students": summary["vaccinated_students"],
+        "vaccination_drives": summary["vaccination_drives"],
+        "total_drives": summary["total_drives"],
+        "available_doses": summary["available_doses"],
+        "by_class": summary["by_class"],
+        "by_vaccine": summary["by_vaccine"]
+    }
+
+
+def dashboard_view(summary):
+    """Fields returned by /analytics/analytics."""
+    return {
+        "total_students": summary["total_students"],
+        "vaccinated_students": summary["vaccinated_students"],
+        "percent_vaccinated": summary["percent_vaccinated"],
+        "upcoming_drives": summary["upcoming_drives"],
+        "by_class": summary["by_class"],
+        "by_vaccine": summary["by_vaccine"]
+    }
+
+
+def compute_summary(today):
+    return store.summary(today)
+
+
+def cache_key():
+    today = parse_date(datetime.now())
+    return ("summary", today), today
+
+
+def get_summary():
+    """Return the cached analytics summary, recomputing it once the TTL lapses."""
+    key, today = cache_key()
+    return analytics_cache.get_or_compute(
+        key,
+        lambda: compute_summary(today),
+        ttl=current_app.config.get("ANALYTICS_CACHE_TTL")
+    )
+
+
+def invalidate():
+    """Called by every route that changes students or drives."""
+    analytics_cache.invalidate()
+    for listener in listeners:
+        listener()
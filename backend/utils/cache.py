@@ -0,0 +1,103 @@
+from collections import OrderedDict
+import threading
+import time
+from utils import metrics
+
+
+class TTLCache:
+    """A small thread-safe in-process cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, name, ttl=30, maxsize=256):
+        self.name = name  # the `cache` label of cache_hits_total/cache_misses_total
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                metrics.CACHE_HITS.inc(self.name)
+                return entry[1]
+            self._data.pop(key, None)
+            self.misses += 1
+            metrics.CACHE_MISSES.inc(self.name)
+            return None
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                # Drop the entry closest to expiry to make room
+                oldest = min(self._data, key=lambda k: self._data[k][0])
+                del self._data[oldest]
+            self._data[key] = (expires, value)
+
+    def get_or_compute(self, key, compute, ttl=None):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "entries": len(self._data),
+                "ttl": self.ttl,
+            }
+
+
+class LRUCache:
+    """A bounded least-recently-used map whose entries carry an absolute expiry (epoch seconds)."""
+
+    def __init__(self, name, maxsize=1024):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                metrics.CACHE_HITS.inc(self.name)
+                return entry[1]
+            self._data.pop(key, None)
+            self.misses += 1
+            metrics.CACHE_MISSES.inc(self.name)
+            return None
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._data), "maxsize": self.maxsize}
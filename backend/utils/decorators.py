@@ -1,20 +1,57 @@
 import json
-from flask_jwt_extended import get_jwt_identity
+import time
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
 from functools import wraps
-from flask import jsonify
+from flask import current_app, jsonify
+from utils.cache import LRUCache
+
+# Verified token jti -> identity dict; entries expire with the token itself
+identity_cache = LRUCache("identity", maxsize=4096)
+
+def identity_from_claims(claims):
+    if "role" in claims:
+        return {"username": claims["sub"], "role": claims["role"]}
+    # Tokens issued before roles moved into claims carry a JSON identity string
+    identity = json.loads(claims["sub"])
+    return {"username": identity["username"], "role": identity["role"]}
+
+def cached_identity(claims, default_ttl):
+    """
+    The identity for a set of already-verified claims, parsed once per token and
+    then served from the process-local cache.
+    """
+    jti = claims.get("jti")
+    identity = identity_cache.get(jti) if jti else None
+    if identity is None:
+        identity = identity_from_claims(claims)
+        if jti:
+            identity_cache.set(jti, identity, claims.get("exp") or time.time() + default_ttl)
+    return identity
+
+def verified_claims(app, headers):
+    """
+    The claims of the access token in a set of request headers, checked outside a Flask
+    request (the native ASGI routes) by the same code and JWT_* settings as jwt_required():
+    header name and type, algorithms, key, leeway, audience, issuer and token type.
+    """
+    with app.test_request_context(headers=headers):
+        verify_jwt_in_request()
+        return get_jwt()
+
+def current_identity():
+    """The identity of the token verified by jwt_required for this request."""
+    return cached_identity(get_jwt(), current_app.config["JWT_ACCESS_TOKEN_EXPIRES"])
 
 def role_required(required_role):
     def decorator(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            identity = get_jwt_identity()
             try:
-                # Parse the identity string into a dictionary
-                identity_dict = json.loads(identity)
-                if identity_dict['role'] != required_role:
-                    return jsonify(msg="Access forbidden: Role mismatch"), 403
-            except (json.JSONDecodeError, KeyError):
+                identity = current_identity()
+            except (json.JSONDecodeError, KeyError, TypeError):
                 return jsonify(msg="Invalid token structure"), 400
+            if identity['role'] != required_role:
+                return jsonify(msg="Access forbidden: Role mismatch"), 403
             return fn(*args, **kwargs)
         return wrapper
     return decorator
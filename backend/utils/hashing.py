@@ -0,0 +1,102 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from werkzeug.security import check_password_hash, generate_password_hash
+from utils import metrics
+
+
+class HashingBusy(Exception):
+    """Raised instead of queueing when every hashing slot is taken."""
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing is saturated")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    Runs the deliberately slow KDF calls on a small dedicated pool so they can't
+    tie up every request worker. hashlib releases the GIL while hashing, so the
+    threads run in parallel; when the pool and its queue are full, callers fail fast.
+    """
+
+    def __init__(self):
+        self.method = "scrypt"
+        self.retry_after = 1
+        self.workers = 0
+        self.capacity = 0
+        self.in_flight = 0
+        self.rejected = 0
+        self._prefix = None
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.method = app.config["PASSWORD_HASH_METHOD"]
+        self.retry_after = app.config["HASH_RETRY_AFTER"]
+        self.workers = app.config["HASH_WORKERS"] or os.cpu_count() or 2
+        self.capacity = self.workers + app.config["HASH_QUEUE_SIZE"]
+        self._prefix = None
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hash")
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            metrics.HASH_REJECTED.inc()
+            raise HashingBusy(self.retry_after)
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(partial(generate_password_hash, method=self.method), password)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash was made with different parameters than the configured ones."""
+        if self._prefix is None:
+            # Parameters of the configured method, e.g. "scrypt:32768:8:1"; computed on first use
+            # rather than in init_app, where the throwaway hash dominated app startup
+            self._prefix = generate_password_hash("", method=self.method).split("$", 1)[0]
+        return password_hash.split("$", 1)[0] != self._prefix
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "queued": max(self.in_flight - self.workers, 0),
+                "rejected": self.rejected,
+            }
+
+
+hasher = PasswordHasher()
+
+
+def with_hashed_passwords(rows, executor, method="scrypt", chunk_size=256):
+    """
+    Hash the `password` column of CSV rows on a process pool, chunk by chunk,
+    so bulk user imports use every core.
+    """
+    hash_one = partial(generate_password_hash, method=method)
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        hashes = executor.map(hash_one, [row["password"] for row in chunk], chunksize=16)
+        for row, password_hash in zip(chunk, hashes):
+            yield {**row, "password": password_hash}
@@ -0,0 +1,114 @@
+import codecs
+import csv
+import time
+from itertools import islice
+from pymongo.errors import BulkWriteError
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_REJECTS = 1000
+DUPLICATE_KEY_ERROR = 11000
+
+
+class RowError(ValueError):
+    """Raised by a row preparer when a CSV row cannot be imported."""
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.rejects = []
+        self.started = time.perf_counter()
+
+    def reject(self, row_number, reason):
+        self.rejected += 1
+        # Keep the response bounded even when every row of a huge file is bad
+        if len(self.rejects) < MAX_REPORTED_REJECTS:
+            self.rejects.append({"row": row_number, "reason": reason})
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "rejected": self.rejected,
+            "rejects": sorted(self.rejects, key=lambda reject: reject["row"]),
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed > 0 else None,
+        }
+
+
+def iter_csv_rows(binary_stream, encoding="utf-8-sig"):
+    """Decode an uploaded file line by line instead of reading it into memory first."""
+    return csv.DictReader(codecs.iterdecode(binary_stream, encoding))
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_rows(collection, rows, prepare, unique_key=None, chunk_size=DEFAULT_CHUNK_SIZE, report=None,
+                on_insert=None, progress=None):
+    """
+    Validate `rows` in chunks with `prepare` and insert them with unordered `insert_many`.
+    Rows whose `unique_key` already exists (in the collection or earlier in the file)
+    are rejected using a single `$in` query per chunk; the unique index from
+    utils.indexes catches anything that slips in concurrently. `on_insert` is called
+    with the documents of each chunk that were actually written, and `progress`
+    with the number of rows processed so far.
+    """
+    report = report or ImportReport()
+
+    for chunk in chunked(enumerate(rows, start=1), chunk_size):
+        report.rows += len(chunk)
+        prepared = []
+        for row_number, row in chunk:
+            try:
+                prepared.append((row_number, prepare(row)))
+            except RowError as e:
+                report.reject(row_number, str(e))
+
+        if unique_key and prepared:
+            keys = [doc[unique_key] for _, doc in prepared]
+            existing = {
+                doc[unique_key]
+                for doc in collection.find({unique_key: {"$in": keys}}, {unique_key: 1, "_id": 0})
+            }
+            unique = []
+            for row_number, doc in prepared:
+                if doc[unique_key] in existing:
+                    report.reject(row_number, f"Duplicate {unique_key} {doc[unique_key]}")
+                    continue
+                existing.add(doc[unique_key])
+                unique.append((row_number, doc))
+            prepared = unique
+
+        if not prepared:
+            if progress:
+                progress(report.rows)
+            continue
+        failed = set()
+        try:
+            collection.insert_many([doc for _, doc in prepared], ordered=False)
+        except BulkWriteError as e:
+            # Unordered inserts carry on past failures; map each error back to its row
+            for error in e.details.get("writeErrors", []):
+                failed.add(error["index"])
+                row_number, doc = prepared[error["index"]]
+                if error.get("code") == DUPLICATE_KEY_ERROR and unique_key:
+                    report.reject(row_number, f"Duplicate {unique_key} {doc[unique_key]}")
+                else:
+                    report.reject(row_number, error.get("errmsg", "Write failed"))
+        written = [doc for index, (_, doc) in enumerate(prepared) if index not in failed]
+        report.inserted += len(written)
+        if on_insert and written:
+            on_insert(written)
+        if progress:
+            progress(report.rows)
+    return report
@@ -0,0 +1,116 @@
+from datetime import datetime
+from pymongo import ASCENDING, IndexModel
+from utils import analytics
+
+# Declarative index registry: collection name -> indexes the routes rely on
+INDEXES = {
+    "students": [
+        IndexModel([("student_id", ASCENDING)], name="student_id_unique", unique=True),
+        IndexModel([("class_grade", ASCENDING), ("_id", ASCENDING)], name="class_grade_id"),
+        IndexModel([("username", ASCENDING)], name="username"),
+        # /students/search: name prefix in rank order, optionally within one class
+        IndexModel([("username_lower", ASCENDING), ("_id", ASCENDING)], name="username_lower_id"),
+        IndexModel([("class_grade", ASCENDING), ("username_lower", ASCENDING), ("_id", ASCENDING)],
+                   name="class_grade_username_lower_id"),
+    ],
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ],
+    "jobs": [
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+        IndexModel([("status", ASCENDING), ("heartbeat_at", ASCENDING)], name="status_heartbeat_at"),
+        IndexModel([("finished_at", ASCENDING)], name="finished_at"),  # the hourly purge
+    ],
+    "vaccination_batches": [
+        # Batch keys of POST /drives/<id>/vaccinations can be replayed for a day
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=86400),
+    ],
+    "vaccination_drives": [
+        IndexModel([("classes", ASCENDING)], name="classes"),  # multikey
+        IndexModel([("is_completed", ASCENDING), ("date", ASCENDING)], name="is_completed_date"),
+        # Covers the analytics drive counters (utils.analytics.drives_pipeline): no document is fetched
+        IndexModel([("is_completed", ASCENDING), ("available_doses", ASCENDING), ("_id", ASCENDING)],
+                   name="is_completed_doses_id"),
+        IndexModel([("date", ASCENDING)], name="date"),
+        IndexModel([("registered_students", ASCENDING)], name="registered_students"),
+    ],
+}
+
+
+def ensure_indexes(db, collections=None):
+    """Create every registered index (a no-op for indexes that already exist)."""
+    created = {}
+    for name, indexes in INDEXES.items():
+        if collections and name not in collections:
+            continue
+        created[name] = db[name].create_indexes(indexes)
+    return created
+
+
+def query_shapes():
+    """
+    The filter shapes issued by the routes, as (label, collection, filter, sort).
+    Values are placeholders; only the shape matters to the planner.
+    """
+    today = datetime(2025, 1, 1)
+    return [
+        ("admin.add_student", "students", {"student_id": "STU001"}, None),
+        ("admin.list_students[class_grade]", "students", {"class_grade": "5B"}, [("_id", ASCENDING)]),
+        ("admin.list_students[name]", "students", {"username": {"$regex": "^Jo"}}, None),
+        ("admin.search_students[q]", "students", {"username_lower": {"$regex": "^jo"}},
+         [("username_lower", ASCENDING), ("_id", ASCENDING)]),
+        ("admin.search_students[class_grade,q]", "students", {"class_grade": "5B", "username_lower": {"$regex": "^jo"}},
+         [("username_lower", ASCENDING), ("_id", ASCENDING)]),
+        ("auth.login", "users", {"username": "admin"}, None),
+        ("drive.get_drives_by_class", "vaccination_drives", {"classes": "5B"}, None),
+        ("drive.get_roster", "students", {"class_grade": {"$in": ["5B", "6A"]}}, [("_id", ASCENDING)]),
+        ("drive.get_drive_for_student", "vaccination_drives", {"registered_students": "STU001"}, None),
+        ("analytics.summary[upcoming_drives]", "vaccination_drives", analytics.upcoming_query(today),
+         [("date", ASCENDING)]),
+    ]
+
+
+def pipeline_shapes():
+    """The aggregations issued by the routes, as (label, collection, pipeline)."""
+    return [
+        ("analytics.summary[drives]", "vaccination_drives", analytics.drives_pipeline()),
+    ]
+
+
+def _stages(plan):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+def _winning_plans(explain):
+    # An aggregate's plan sits under its $cursor stage, or at the top once the whole pipeline is pushed down
+    if isinstance(explain, dict):
+        if "winningPlan" in explain:
+            yield explain["winningPlan"]
+        for value in explain.values():
+            yield from _winning_plans(value)
+    elif isinstance(explain, list):
+        for value in explain:
+            yield from _winning_plans(value)
+
+
+def find_collection_scans(db):
+    """Run explain() on every route query shape and pipeline and return the labels that still COLLSCAN."""
+    offenders = []
+    for label, collection, query, sort in query_shapes():
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in set(_stages(plan)):
+            offenders.append(label)
+    for label, collection, pipeline in pipeline_shapes():
+        explain = db.command("explain", {"aggregate": collection, "pipeline": pipeline, "cursor": {}},
+                             verbosity="queryPlanner")
+        if any("COLLSCAN" in set(_stages(plan)) for plan in _winning_plans(explain)):
+            offenders.append(label)
+    return offenders
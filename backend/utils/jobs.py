@@ -0,0 +1,346 @@
+import logging
+import os
+import click
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from db import mongo
+
+logger = logging.getLogger(__name__)
+
+class JobCancelled(Exception):
+    """Raised inside a handler once its job has been cancelled."""
+
+
+class Job:
+    """What a handler sees of its job: parameters, progress reporting and an output file."""
+
+    def __init__(self, runner, doc):
+        self.id = doc["_id"]
+        self.kind = doc["kind"]
+        self.params = doc.get("params") or {}
+        self.progress = doc.get("progress", 0)
+        self.total = doc.get("total")
+        self.file = doc.get("file")
+        self._runner = runner
+        self._flushed = 0.0
+
+    def output_path(self, extension):
+        """Where the job writes its downloadable result (stable across retries)."""
+        self.file = os.path.join(self._runner.directory, f"{self.id}.{extension}")
+        self._runner.collection.update_one({"_id": self.id}, {"$set": {"file": self.file}})
+        return self.file
+
+    def set_progress(self, count, total=None):
+        """Record progress; written to Mongo at most once per JOB_FLUSH_SECONDS, which is also when cancellation is seen."""
+        self.progress = count
+        if total is not None:
+            self.total = total
+        now = time.monotonic()
+        if now - self._flushed < self._runner.flush_seconds:
+            return
+        self._flushed = now
+        doc = self._runner.collection.find_one_and_update(
+            {"_id": self.id},
+            {"$set": {"progress": self.progress, "total": self.total, "heartbeat_at": datetime.utcnow()}},
+            projection={"cancel_requested": 1}
+        )
+        if doc and doc.get("cancel_requested"):
+            raise JobCancelled()
+
+
+class JobRunner:
+    """
+    In-process job queue backed by the `jobs` collection. Every process running the
+    app polls for queued jobs and claims them atomically, runs at most JOB_WORKERS at
+    a time on its own pool (so batch work never borrows a request worker), and keeps
+    a heartbeat on the ones it owns. Jobs whose owner stops heartbeating (a restart
+    or crash) are requeued, up to JOB_MAX_ATTEMPTS runs. The same poller drives
+    periodic tasks, each guarded by a lease so one process runs it per interval.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.cleanups = {}
+        self.schedules = {}
+        self.directory = None
+        self.workers = 1
+        self.poll_interval = 2.0
+        self.flush_seconds = 1.0
+        self.stale_after = timedelta(seconds=60)
+        self.max_attempts = 3
+        self.retention = timedelta(days=7)
+        self.owner = None
+        self._executor = None
+        self._slots = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._fork_hook = False
+
+    @property
+    def collection(self):
+        return mongo.db.jobs
+
+    def init_app(self, app):
+        self.directory = app.config["JOB_DIR"]
+        self.workers = app.config["JOB_WORKERS"]
+        self.poll_interval = app.config["JOB_POLL_INTERVAL"]
+        self.flush_seconds = app.config["JOB_FLUSH_SECONDS"]
+        self.stale_after = timedelta(seconds=app.config["JOB_STALE_SECONDS"])
+        self.max_attempts = app.config["JOB_MAX_ATTEMPTS"]
+        self.retention = timedelta(hours=app.config["JOB_RETENTION_HOURS"])
+        os.makedirs(self.directory, exist_ok=True)
+
+        @app.cli.command("run-jobs")
+        def run_jobs_command():
+            """Run background jobs and scheduled tasks in this process, without serving requests."""
+            if app.config["STORAGE_BACKEND"] != "mongo":
+                raise click.ClickException("Background jobs need the Mongo storage backend")
+            self.start()
+            click.echo(f"Running jobs as {self.owner}, Ctrl+C to stop.")
+            try:
+                while self._thread.is_alive():
+                    self._thread.join(1)
+            except KeyboardInterrupt:
+                self.stop()
+
+    def handler(self, kind, cleanup=None):
+        """
+        Register `fn(job) -> result` as the handler for jobs of `kind`. `cleanup(params)`, if
+        given, runs once the job is finished for good: completed, cancelled, or failed with no
+        retry left.
+        """
+        def decorator(fn):
+            self.handlers[kind] = fn
+            if cleanup:
+                self.cleanups[kind] = cleanup
+            return fn
+        return decorator
+
+    def every(self, name, seconds, fn):
+        """Run `fn()` about every `seconds`, in one process at a time."""
+        self.schedules[name] = (seconds, fn)
+
+    ### Client side
+    def submit(self, kind, params=None):
+        if kind not in self.handlers:
+            raise ValueError(f"No handler for job kind {kind!r}")
+        now = datetime.utcnow()
+        doc = {
+            "_id": uuid.uuid4().hex,
+            "kind": kind,
+            "params": params or {},
+            "status": "queued",
+            "progress": 0,
+            "total": None,
+            "attempts": 0,
+            "cancel_requested": False,
+            "created_at": now,
+        }
+        self.collection.insert_one(doc)
+        self._wake.set()
+        return doc
+
+    def get(self, job_id):
+        return self.collection.find_one({"_id": job_id})
+
+    def recent(self, status=None, kind=None, limit=50):
+        query = {"kind": {"$ne": "schedule"}}
+        if status:
+            query["status"] = status
+        if kind:
+            query["kind"] = kind
+        return list(self.collection.find(query, {"params": 0}).sort("created_at", -1).limit(limit))
+
+    def cancel(self, job_id):
+        """Cancel a queued job outright, or ask a running one to stop at its next progress report."""
+        now = datetime.utcnow()
+        doc = self.collection.find_one_and_update(
+            {"_id": job_id, "status": "queued"},
+            {"$set": {"status": "cancelled", "finished_at": now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc:
+            self._cleanup(doc)
+            return doc
+        return self.collection.find_one_and_update(
+            {"_id": job_id, "status": "running"},
+            {"$set": {"cancel_requested": True}},
+            return_document=ReturnDocument.AFTER
+        ) or self.get(job_id)
+
+    ### Worker side
+    def start(self):
+        """Start polling unless already polling; call once every handler and schedule is registered."""
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            if not self._fork_hook:
+                # Threads don't survive fork (e.g. gunicorn --preload): start afresh in each child
+                os.register_at_fork(after_in_child=self._restart_in_child)
+                self._fork_hook = True
+            self.owner = f"{socket.gethostname()}:{os.getpid()}"
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+            self._slots = threading.BoundedSemaphore(self.workers)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._poll, name="job-poller", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def _restart_in_child(self):
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.start()
+
+    def _poll(self):
+        while not self._stop.is_set():
+            try:
+                self._heartbeat()
+                self._recover_stale()
+                self._run_schedules()
+                self._claim_queued()
+            except PyMongoError as e:
+                logger.warning("Job poller: %s", e)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _heartbeat(self):
+        self.collection.update_many(
+            {"status": "running", "owner": self.owner},
+            {"$set": {"heartbeat_at": datetime.utcnow()}}
+        )
+
+    def _recover_stale(self):
+        cutoff = datetime.utcnow() - self.stale_after
+        stale = {"status": "running", "heartbeat_at": {"$lt": cutoff}}
+        for doc in self.collection.find({**stale, "attempts": {"$gte": self.max_attempts}}, {"kind": 1, "params": 1}):
+            # One update per job, so only the process that marks it failed cleans up after it
+            lost = self.collection.update_one(
+                {"_id": doc["_id"], **stale},
+                {"$set": {"status": "failed", "error": "Worker lost", "finished_at": datetime.utcnow()}}
+            )
+            if lost.modified_count:
+                self._cleanup(doc)
+        requeued = self.collection.update_many(stale, {"$set": {"status": "queued", "owner": None}})
+        if requeued.modified_count:
+            logger.info("Requeued %s jobs from lost workers", requeued.modified_count)
+
+    def _run_schedules(self):
+        now = datetime.utcnow()
+        for name, (seconds, fn) in self.schedules.items():
+            lease_id = f"schedule:{name}"
+            try:
+                self.collection.update_one(
+                    {"_id": lease_id},
+                    {"$setOnInsert": {"kind": "schedule", "status": "scheduled", "next_run_at": now}},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                pass  # Another process created the lease first
+            # Whoever moves next_run_at forward runs the task for this interval
+            claimed = self.collection.find_one_and_update(
+                {"_id": lease_id, "next_run_at": {"$lte": now}},
+                {"$set": {"next_run_at": now + timedelta(seconds=seconds), "last_run_at": now, "owner": self.owner}}
+            )
+            if not claimed:
+                continue
+            try:
+                fn()
+            except Exception:
+                logger.exception("Scheduled task %s failed", name)
+
+    def _claim_queued(self):
+        while self._slots.acquire(blocking=False):
+            doc = self.collection.find_one_and_update(
+                {"status": "queued", "kind": {"$in": list(self.handlers)}},
+                {"$set": {"status": "running", "owner": self.owner, "started_at": datetime.utcnow(),
+                          "heartbeat_at": datetime.utcnow()},
+                 "$inc": {"attempts": 1}},
+                sort=[("created_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if not doc:
+                self._slots.release()
+                return
+            self._executor.submit(self._run, doc)
+
+    def _run(self, doc):
+        job = Job(self, doc)
+        changes = {}
+        try:
+            changes = {"status": "completed", "result": self.handlers[job.kind](job)}
+        except JobCancelled:
+            changes = {"status": "cancelled"}
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job.id, job.kind)
+            changes = {"status": "failed", "error": str(e)}
+        finally:
+            changes.update(progress=job.progress, total=job.total, finished_at=datetime.utcnow())
+            try:
+                # Only the current owner may finish it; a requeued job belongs to someone else now
+                outcome = self.collection.update_one({"_id": job.id, "owner": self.owner}, {"$set": changes})
+                if outcome.modified_count:
+                    self._cleanup(doc)
+            except PyMongoError:
+                logger.exception("Could not record the outcome of job %s", job.id)
+            self._slots.release()
+            self._wake.set()
+
+    def purge(self):
+        """
+        Delete jobs that finished more than JOB_RETENTION_HOURS ago, their files first, then
+        any file in JOB_DIR that is as old and no job refers to (e.g. left by a crash).
+        """
+        cutoff = datetime.utcnow() - self.retention
+        expired = list(self.collection.find({"finished_at": {"$lt": cutoff}}, {"file": 1}))
+        for doc in expired:
+            if doc.get("file"):
+                _remove(doc["file"])
+        if expired:
+            self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in expired]}})
+            logger.info("Purged %s finished jobs", len(expired))
+        referenced = set()
+        for doc in self.collection.find({"kind": {"$ne": "schedule"}}, {"file": 1, "params.path": 1}):
+            for path in (doc.get("file"), (doc.get("params") or {}).get("path")):
+                if path:
+                    referenced.add(os.path.basename(path))
+        oldest = time.time() - self.retention.total_seconds()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name not in referenced and entry.stat().st_mtime < oldest:
+                    _remove(entry.path)
+
+    def _cleanup(self, doc):
+        cleanup = self.cleanups.get(doc["kind"])
+        if not cleanup:
+            return
+        try:
+            cleanup(doc.get("params") or {})
+        except Exception:
+            logger.exception("Cleanup of job %s (%s) failed", doc["_id"], doc["kind"])
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+runner = JobRunner()
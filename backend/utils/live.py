@@ -0,0 +1,267 @@
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from pymongo.errors import PyMongoError
+from db import mongo
+from utils import analytics, metrics
+from utils.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+# Collections whose changes move the dashboard counters
+WATCHED = ("students", "vaccination_drives")
+COALESCE_SECONDS = 0.25  # a burst of writes (a class vaccination, an import) becomes one event
+BACKLOG = 256  # events kept for clients reconnecting with Last-Event-ID
+SUBSCRIBER_QUEUE = 64  # events a slow client may fall behind before it is resynced with a snapshot
+RETRY_MS = 3000  # how long EventSource waits before reconnecting
+STREAM_POLL_MS = 1000  # longest a change stream read blocks before the follower checks for a stop
+
+
+def sse(event, data, event_id=None):
+    """One Server-Sent Events message."""
+    lines = [f"id: {event_id}"] if event_id else []
+    lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+def diff(before, after):
+    """The top-level summary fields whose value changed, with their new values."""
+    return {key: value for key, value in after.items() if before.get(key) != value}
+
+
+class Subscriber:
+    def __init__(self):
+        self.queue = queue.Queue(SUBSCRIBER_QUEUE)
+        self.lagged = False
+
+
+class Broadcaster:
+    """
+    Pushes analytics changes to every open /analytics/stream. A single watcher thread per
+    process recomputes the summary when students or drives change and fans the fields that
+    changed out to all subscribers, so the cost of a change doesn't grow with open tabs.
+
+    Changes are seen through a Mongo change stream when the deployment supports one (a
+    replica set), which also catches writes made by other processes. Otherwise, and always
+    for writes made in this process, analytics.invalidate() wakes the watcher directly, and
+    the summary is re-read once per heartbeat to pick up other processes' writes. With no
+    subscribers the watcher stops and the change stream is closed, so an idle process holds
+    no cursor; the next subscriber recomputes the summary and restarts both.
+
+    Event ids carry a token unique to this broadcaster, so a Last-Event-ID from another
+    process or before a restart is answered with a fresh snapshot rather than a replay.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.heartbeat = 15.0
+        self.change_stream = True
+        self.summary = None
+        self.last_id = None
+        self.published = 0
+        self._epoch = uuid.uuid4().hex[:8]
+        self._sequence = 0
+        self._backlog = deque(maxlen=BACKLOG)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._thread = None
+        self._stream_thread = None
+        self._stream_stop = threading.Event()
+        self._fork_hook = False
+
+    def init_app(self, app):
+        self.app = app
+        self.heartbeat = app.config["ANALYTICS_STREAM_HEARTBEAT"]
+        self.change_stream = app.config["ANALYTICS_CHANGE_STREAM"] and app.config["STORAGE_BACKEND"] == "mongo"
+        if self.notify not in analytics.listeners:
+            analytics.listeners.append(self.notify)
+
+    def notify(self):
+        """Something changed: wake the watcher (cheap, safe to call from any request)."""
+        self._dirty.set()
+
+    ### Subscribers
+    def subscribe(self, last_event_id=None):
+        """
+        Register a subscriber and return it with the messages that bring it up to date:
+        the events it missed when `last_event_id` is still in the backlog, else a snapshot.
+        """
+        # An idle broadcaster's summary may be stale; recompute before taking the lock
+        summary = None if self._watching() else self._compute()
+        subscriber = Subscriber()
+        with self._lock:
+            if summary is not None and (self._thread is None or self.summary is None):
+                self._publish(summary)
+            missed = self._missed(last_event_id)
+            self._subscribers.add(subscriber)
+            self._start()
+            return subscriber, missed if missed is not None else [self._snapshot()]
+
+    def stream(self, last_event_id=None):
+        """The body of one /analytics/stream response: catch-up messages, then updates and heartbeats."""
+        subscriber, messages = self.subscribe(last_event_id)
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            yield from messages
+            while True:
+                try:
+                    message = subscriber.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    message = ": heartbeat\n\n"  # a comment line keeps proxies from closing an idle stream
+                if subscriber.lagged:
+                    message = self.resync(subscriber)
+                yield message
+        finally:
+            # Runs when the server closes the response, i.e. on the first write after the client left
+            self.unsubscribe(subscriber)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def resync(self, subscriber):
+        """Drop what a lagging subscriber has queued and give it a snapshot instead."""
+        with self._lock:
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            subscriber.lagged = False
+            return self._snapshot()
+
+    def _missed(self, last_event_id):
+        if not last_event_id:
+            return None
+        if last_event_id == self.last_id:
+            return []
+        ids = [event_id for event_id, _ in self._backlog]
+        if last_event_id not in ids:
+            return None
+        return [message for _, message in list(self._backlog)[ids.index(last_event_id) + 1:]]
+
+    def _snapshot(self):
+        return sse("snapshot", dumps(self.summary), self.last_id)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "published": self.published,
+                    "change_stream": bool(self._stream_thread) and self.change_stream}
+
+    ### Watcher
+    def _watching(self):
+        with self._lock:
+            return self._thread is not None and self._thread.is_alive()
+
+    def _start(self):
+        """Start the watcher unless it is running; the caller holds the lock."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if not self._fork_hook:
+            # Threads don't survive fork; a child starts its own watcher on its first subscriber
+            os.register_at_fork(after_in_child=self._reset_in_child)
+            self._fork_hook = True
+        self._dirty.clear()
+        self._thread = threading.Thread(target=self._watch, name="analytics-watcher", daemon=True)
+        self._thread.start()
+        self._stream_stop.clear()  # a follower still winding down keeps going instead
+        if self.change_stream and not (self._stream_thread and self._stream_thread.is_alive()):
+            self._stream_thread = threading.Thread(target=self._follow_change_stream,
+                                                   name="analytics-change-stream", daemon=True)
+            self._stream_thread.start()
+
+    def _reset_in_child(self):
+        # Siblings forked from one parent must not hand out the same event ids for different events
+        self._epoch = uuid.uuid4().hex[:8]
+        self._backlog = deque(maxlen=BACKLOG)
+        self.summary = self.last_id = None
+        self._thread = self._stream_thread = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._stream_stop = threading.Event()
+
+    def _watch(self):
+        while True:
+            if self._dirty.wait(self.heartbeat):
+                time.sleep(COALESCE_SECONDS)
+            with self._lock:
+                if not self._subscribers:
+                    # Nobody is listening: stop until the next subscriber, which recomputes on its way in
+                    self._thread = None
+                    self._stream_stop.set()
+                    return
+            self._dirty.clear()
+            try:
+                summary = self._compute()
+            except Exception:
+                logger.exception("Analytics stream: could not recompute the summary")
+                continue
+            with self._lock:
+                self._publish(summary)
+
+    def _compute(self):
+        with self.app.app_context():
+            key, today = analytics.cache_key()
+            summary = analytics.compute_summary(today)
+            # Polling clients get the fresh numbers too
+            analytics.analytics_cache.set(key, summary, ttl=self.app.config["ANALYTICS_CACHE_TTL"])
+        return summary
+
+    def _publish(self, summary):
+        """Fan out the fields that changed since the last summary; the caller holds the lock."""
+        if self.summary is None:
+            self.summary, self.last_id = summary, self._next_id()
+            return
+        changed = diff(self.summary, summary)
+        if not changed:
+            return
+        self.summary, self.last_id = summary, self._next_id()
+        message = sse("update", dumps(changed), self.last_id)
+        self._backlog.append((self.last_id, message))
+        self.published += 1
+        metrics.STREAM_EVENTS.inc()
+        for subscriber in self._subscribers:
+            try:
+                subscriber.queue.put_nowait(message)
+            except queue.Full:
+                subscriber.lagged = True
+
+    def _stop_following(self):
+        # Decided under the lock, so a subscriber arriving now either sees this follower alive
+        # with the stop withdrawn, or sees no follower and starts a new one
+        with self._lock:
+            if not self._stream_stop.is_set():
+                return False
+            self._stream_thread = None
+            return True
+
+    def _next_id(self):
+        self._sequence += 1
+        return f"{self._epoch}-{self._sequence}"
+
+    def _follow_change_stream(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": list(WATCHED)}}}]
+        resume_token = None
+        while True:
+            try:
+                # try_next() returns every STREAM_POLL_MS, so the follower sees a stop while idle
+                with mongo.db.watch(pipeline, resume_after=resume_token, max_await_time_ms=STREAM_POLL_MS) as stream:
+                    while not (self._stream_stop.is_set() and self._stop_following()):
+                        if stream.try_next() is not None:
+                            resume_token = stream.resume_token
+                            self.notify()
+                    return  # leaving the with block closes the cursor
+            except Exception as e:
+                if resume_token is None or not isinstance(e, PyMongoError):
+                    # Standalone servers have no change streams; the in-process hook keeps working
+                    logger.info("Analytics stream: change streams unavailable (%s), using in-process notifications", e)
+                    self.change_stream = False
+                    return
+                logger.warning("Analytics stream: change stream interrupted (%s), resuming", e)
+                time.sleep(1)
+
+broadcaster = Broadcaster()
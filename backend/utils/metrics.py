@@ -0,0 +1,331 @@
+import cProfile
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from flask import g, request
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Commands whose filter is worth logging when slow, and the field carrying it
+FILTER_FIELDS = {
+    "find": "filter", "count": "query", "distinct": "query", "delete": "deletes",
+    "update": "updates", "findAndModify": "query", "aggregate": "pipeline",
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, labels
+        self._values = {} if labels else {(): 0}  # an unlabelled counter is exported from zero
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names, self.buckets = name, help, labels, buckets
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series):
+                    cumulative += count
+                    label_str = _labels(self.label_names + ("le",), labels + (bound,))
+                    lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+                label_str = _labels(self.label_names, labels)
+                lines.append(f"{self.name}_sum{label_str} {series[-1]:.6f}")
+                lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Request latency until the response is returned",
+                            ("blueprint", "endpoint", "method", "status"))
+RESPONSE_BYTES = Histogram("http_response_size_bytes", "Response body size (streamed responses excluded)",
+                           ("blueprint", "endpoint"), SIZE_BUCKETS)
+STREAMED_RESPONSES = Counter("http_streamed_responses_total", "Responses streamed without a known size",
+                             ("blueprint", "endpoint"))
+REQUEST_DB_COMMANDS = Histogram("http_request_mongo_commands", "Mongo commands issued per request",
+                                ("blueprint", "endpoint"), COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram("http_request_mongo_seconds", "Time spent in Mongo commands per request",
+                               ("blueprint", "endpoint"))
+MONGO_SECONDS = Histogram("mongo_command_duration_seconds", "Mongo command round-trip time",
+                          ("command", "collection"))
+MONGO_FAILURES = Counter("mongo_command_failures_total", "Mongo commands that failed", ("command",))
+SLOW_QUERIES = Counter("mongo_slow_commands_total", "Mongo commands slower than SLOW_QUERY_MS",
+                       ("command", "collection"))
+PROFILES = Counter("http_request_profiles_total", "Slow requests written to PROFILE_DIR", ("endpoint",))
+CACHE_HITS = Counter("cache_hits_total", "Cache hits", ("cache",))
+CACHE_MISSES = Counter("cache_misses_total", "Cache misses", ("cache",))
+HASH_REJECTED = Counter("password_hash_rejected_total", "Hash requests turned away with 503")
+STREAM_EVENTS = Counter("analytics_stream_events_total", "Analytics updates pushed to /analytics/stream")
+
+METRICS = [REQUEST_SECONDS, RESPONSE_BYTES, STREAMED_RESPONSES, REQUEST_DB_COMMANDS, REQUEST_DB_SECONDS,
+           MONGO_SECONDS, MONGO_FAILURES, SLOW_QUERIES, PROFILES, CACHE_HITS, CACHE_MISSES, HASH_REJECTED,
+           STREAM_EVENTS]
+
+
+def shape(value):
+    """Replace the values of a filter with their type names, so logs show the query shape but no data."""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shape(item) for item in value[:3]]
+    return type(value).__name__
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Times every command the client sends. Counts are also attributed to the request
+    running in the same context (a worker thread, or an asyncio task for the native ASGI
+    routes), and commands slower than SLOW_QUERY_MS are logged with the shape of their filter.
+    """
+
+    def __init__(self):
+        self.slow_seconds = 0.1
+        self._request = contextvars.ContextVar("mongo_request_totals", default=None)
+        self._pending = {}
+
+    def begin_request(self):
+        self._request.set([0, 0.0])
+
+    def end_request(self):
+        totals = self._request.get() or [0, 0.0]
+        self._request.set(None)
+        return totals[0], totals[1]
+
+    def started(self, event):
+        field = FILTER_FIELDS.get(event.command_name)
+        if field:
+            collection = event.command.get(event.command_name)
+            self._pending[(event.connection_id, event.request_id)] = (collection, event.command.get(field))
+
+    def _finish(self, event):
+        collection, query = self._pending.pop((event.connection_id, event.request_id), (None, None))
+        seconds = event.duration_micros / 1e6
+        totals = self._request.get()
+        if totals is not None:
+            totals[0] += 1
+            totals[1] += seconds
+        return collection if isinstance(collection, str) else "", query, seconds
+
+    def succeeded(self, event):
+        collection, query, seconds = self._finish(event)
+        MONGO_SECONDS.observe(seconds, event.command_name, collection)
+        if seconds >= self.slow_seconds:
+            SLOW_QUERIES.inc(event.command_name, collection)
+            logger.warning("Slow %s on %s (%.1f ms): %s", event.command_name, collection or event.database_name,
+                           seconds * 1000, shape(query))
+
+    def failed(self, event):
+        self._finish(event)
+        MONGO_FAILURES.inc(event.command_name)
+
+
+command_metrics = CommandMetrics()
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool utilization per server: open, checked out, waiting for a checkout, and failures."""
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, address):
+        pool = self._pools.get(address)
+        if pool is None:
+            pool = self._pools[address] = {"max_size": None, "open": 0, "in_use": 0, "waiting": 0,
+                                           "checkouts": 0, "checkout_failures": 0, "cleared": 0}
+        return pool
+
+    def _update(self, address, **deltas):
+        with self._lock:
+            pool = self._pool(address)
+            for key, delta in deltas.items():
+                pool[key] = max(pool[key] + delta, 0)
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)["max_size"] = event.options.get("maxPoolSize")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(event.address, None)
+
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._update(event.address, waiting=-1, in_use=1, checkouts=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, in_use=-1)
+
+    def stats(self):
+        with self._lock:
+            return {f"{host}:{port}": dict(pool) for (host, port), pool in self._pools.items()}
+
+    def gauges(self):
+        pools = self.stats()
+        described = [
+            ("max_size", "maxPoolSize of the pool"),
+            ("open", "Open connections"),
+            ("in_use", "Connections checked out"),
+            ("waiting", "Operations waiting to check out a connection"),
+            ("checkouts", "Connection checkouts since start"),
+            ("checkout_failures", "Checkouts that failed or timed out since start"),
+            ("cleared", "Times the pool was cleared since start"),
+        ]
+        return [
+            (f"mongo_pool_{key}", help, [(_labels(("address",), (address,)), pool[key]) for address, pool in pools.items()])
+            for key, help in described
+        ]
+
+
+pool_stats = PoolStats()
+
+# Opt-in: profile a random PROFILE_SAMPLE_RATE of requests, keep those slower than PROFILE_SLOW_MS
+profiling = {"sample_rate": 0.0, "slow_ms": 0, "directory": None}
+
+
+def observe_request(elapsed, blueprint, endpoint, method, status, size):
+    """
+    Record a finished request (size None for a streamed body) and return its Mongo command
+    count. Shared by the Flask hooks and the native ASGI routes.
+    """
+    commands, db_seconds = command_metrics.end_request()
+    REQUEST_SECONDS.observe(elapsed, blueprint, endpoint, method, status)
+    REQUEST_DB_COMMANDS.observe(commands, blueprint, endpoint)
+    REQUEST_DB_SECONDS.observe(db_seconds, blueprint, endpoint)
+    if size is None:
+        STREAMED_RESPONSES.inc(blueprint, endpoint)
+    else:
+        RESPONSE_BYTES.observe(size, blueprint, endpoint)
+    return commands
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    command_metrics.begin_request()
+    g.profiler = None
+    if profiling["sample_rate"] and random.random() < profiling["sample_rate"]:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            g.profiler = profiler
+        except ValueError:
+            pass  # Another profiler is active on this thread
+
+
+def _record_request(response):
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or "unmatched"
+    size = None if response.is_streamed else response.calculate_content_length() or 0
+    commands = observe_request(elapsed, request.blueprint or "app", endpoint, request.method,
+                               response.status_code, size)
+
+    profiler = g.pop("profiler", None)
+    if profiler:
+        profiler.disable()
+        if elapsed * 1000 >= profiling["slow_ms"]:
+            path = os.path.join(profiling["directory"], f"{endpoint}-{datetime.utcnow():%Y%m%dT%H%M%S%f}.prof")
+            profiler.dump_stats(path)
+            PROFILES.inc(endpoint)
+            logger.warning("Profiled slow request %s %s (%.1f ms, %s Mongo commands): %s",
+                           request.method, request.path, elapsed * 1000, commands, path)
+    return response
+
+
+def init_app(app):
+    command_metrics.slow_seconds = app.config["SLOW_QUERY_MS"] / 1000
+    profiling.update(
+        sample_rate=app.config["PROFILE_SAMPLE_RATE"],
+        slow_ms=app.config["PROFILE_SLOW_MS"],
+        directory=app.config["PROFILE_DIR"]
+    )
+    if profiling["sample_rate"]:
+        os.makedirs(profiling["directory"], exist_ok=True)
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+
+
+def _gauges(name, help, values):
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels, value in values:
+        if value is not None:
+            lines.append(f"{name}{labels} {value}")
+    return lines
+
+
+def render(extra_gauges=()):
+    """Everything in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for name, help, values in extra_gauges:
+        lines.extend(_gauges(name, help, values))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,180 @@
+import contextlib
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from utils import schema, stats
+from utils.indexes import ensure_indexes, find_collection_scans
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 10  # a running migration refreshes heartbeat_at this often
+STALE_AFTER = timedelta(seconds=60)  # no heartbeat for this long = the process running it died
+WAIT_SECONDS = 600  # how long to wait on a migration another process is running
+
+
+class MigrationInProgress(Exception):
+    """Another process is still running a migration that later ones depend on."""
+
+
+def create_initial_indexes(db):
+    ensure_indexes(db)
+
+
+def build_student_stats(db):
+    stats.reconcile(db)
+
+
+def backfill_canonical_dates(db):
+    schema.backfill_drives(db)
+    schema.backfill_students(db)
+
+
+def add_search_names(db):
+    ensure_indexes(db, ["students"])
+    schema.backfill_search_names(db)
+
+
+def create_job_indexes(db):
+    ensure_indexes(db, ["jobs"])
+
+
+def create_batch_indexes(db):
+    ensure_indexes(db, ["vaccination_batches"])
+
+
+def create_drive_counter_index(db):
+    ensure_indexes(db, ["vaccination_drives"])
+
+
+def create_job_retention_index(db):
+    ensure_indexes(db, ["jobs"])
+
+
+# Ordered (version, description, function) entries; append new ones, never renumber
+MIGRATIONS = [
+    (1, "Create indexes for students, users and vaccination_drives", create_initial_indexes),
+    (2, "Build materialized student counters in stats", build_student_stats),
+    (3, "Store drive dates and vaccination dates as BSON dates, trim drive classes", backfill_canonical_dates),
+    (4, "Add username_lower and search indexes to students", add_search_names),
+    (5, "Create indexes for the jobs queue", create_job_indexes),
+    (6, "Expire vaccination batch keys after a day", create_batch_indexes),
+    (7, "Cover the analytics drive counters with an index", create_drive_counter_index),
+    (8, "Index finished jobs for the retention purge", create_job_retention_index),
+]
+
+
+def applied_versions(db):
+    return {doc["_id"] for doc in db.migrations.find({"status": "applied"}, {"_id": 1})}
+
+
+def apply_migrations(db, stale_after=STALE_AFTER, wait_seconds=WAIT_SECONDS):
+    """
+    Apply every migration newer than the ones recorded in the `migrations` collection.
+    Each version is claimed with an insert so concurrent workers don't run it twice. A
+    version another process is running is waited for, since later ones may depend on it;
+    one that failed, or whose process stopped heartbeating, is claimed and run again.
+    """
+    done = applied_versions(db)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done or not _claim(db, version, description, stale_after, wait_seconds):
+            continue
+        try:
+            with _heartbeat(db, version):
+                migrate(db)
+        except Exception:
+            db.migrations.update_one({"_id": version}, {"$set": {"status": "failed"}})
+            raise
+        db.migrations.update_one(
+            {"_id": version},
+            {"$set": {"status": "applied", "applied_at": datetime.utcnow()}}
+        )
+        logger.info("Applied migration %s: %s", version, description)
+        applied.append(version)
+    return applied
+
+
+def _claim(db, version, description, stale_after, wait_seconds):
+    """True once this process owns `version`, False when another process has applied it."""
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        now = datetime.utcnow()
+        try:
+            db.migrations.insert_one({
+                "_id": version,
+                "description": description,
+                "status": "running",
+                "started_at": now,
+                "heartbeat_at": now
+            })
+            return True
+        except DuplicateKeyError:
+            pass
+        # Another process claimed it; take over if it failed or its process died mid-run
+        cutoff = now - stale_after
+        if db.migrations.find_one_and_update(
+            {"_id": version, "$or": [
+                {"status": "failed"},
+                {"status": "running", "heartbeat_at": {"$lt": cutoff}},
+                {"status": "running", "heartbeat_at": {"$exists": False}, "started_at": {"$lt": cutoff}}
+            ]},
+            {"$set": {"status": "running", "started_at": now, "heartbeat_at": now}}
+        ):
+            return True
+        doc = db.migrations.find_one({"_id": version}, {"status": 1})
+        if doc and doc["status"] == "applied":
+            return False
+        if time.monotonic() >= deadline:
+            raise MigrationInProgress(f"Migration {version} is still running in another process")
+        time.sleep(1)
+
+
+@contextlib.contextmanager
+def _heartbeat(db, version):
+    """Keep heartbeat_at fresh while `version` runs, so others don't mistake a slow migration for a dead one."""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(HEARTBEAT_SECONDS):
+            try:
+                db.migrations.update_one({"_id": version, "status": "running"},
+                                         {"$set": {"heartbeat_at": datetime.utcnow()}})
+            except PyMongoError as e:
+                logger.warning("Migration %s heartbeat: %s", version, e)
+
+    thread = threading.Thread(target=beat, name=f"migration-{version}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def init_app(app, mongo):
+    @app.cli.command("migrate")
+    def migrate_command():
+        """Apply pending database migrations."""
+        applied = apply_migrations(mongo.db)
+        click.echo(f"Applied migrations: {applied}" if applied else "Database is up to date.")
+
+    @app.cli.command("reconcile-stats")
+    def reconcile_stats_command():
+        """Rebuild the student counters from scratch and report any drift."""
+        drift = stats.reconcile(mongo.db)
+        for path, delta in sorted(drift.items()):
+            click.echo(f"{path}: {delta:+d}")
+        click.echo(f"{len(drift)} counters drifted." if drift else "Counters are accurate.")
+
+    @app.cli.command("check-indexes")
+    def check_indexes_command():
+        """Fail if any route query shape still does a collection scan."""
+        offenders = find_collection_scans(mongo.db)
+        for label in offenders:
+            click.echo(f"COLLSCAN: {label}", err=True)
+        if offenders:
+            raise SystemExit(1)
+        click.echo("All route queries use an index.")
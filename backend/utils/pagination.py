@@ -0,0 +1,99 @@
+import re
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class QueryError(ValueError):
+    """Raised when a query-string parameter cannot be turned into a Mongo filter."""
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if value in (None, ""):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise QueryError("limit must be an integer")
+    if limit < 1:
+        raise QueryError("limit must be positive")
+    if maximum is not None:
+        limit = min(limit, maximum)
+    return limit
+
+
+def parse_cursor(value, parse_id=ObjectId):
+    """`parse_id` turns the cursor back into an `_id` (the storage backend's store.parse_id)."""
+    if not value:
+        return None
+    try:
+        return parse_id(value)
+    except (InvalidId, TypeError):
+        raise QueryError("Invalid cursor")
+
+
+def parse_bool(value):
+    if value is None:
+        return None
+    lowered = value.strip().lower()
+    if lowered in ("true", "1", "yes"):
+        return True
+    if lowered in ("false", "0", "no"):
+        return False
+    raise QueryError("Boolean filters must be true or false")
+
+
+def projection_from_args(args, allowed):
+    """
+    Narrow a route's projection to the comma-separated `fields` the client asked for,
+    so only those fields leave Mongo. `_id` is always returned.
+    """
+    if not args.get("fields"):
+        return allowed
+    requested = [field.strip() for field in args["fields"].split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise QueryError(f"Unknown fields: {', '.join(unknown)}")
+    return {"_id": 1, **{field: 1 for field in requested}}
+
+
+def student_filter(args):
+    """Build the students filter from the query-string filters shared by list and report routes."""
+    query = {}
+    if args.get("class_grade"):
+        query["class_grade"] = args["class_grade"]
+    is_vaccinated = parse_bool(args.get("is_vaccinated"))
+    if is_vaccinated is not None:
+        query["is_vaccinated"] = is_vaccinated
+    if args.get("vaccine_name"):
+        query["vaccine_name"] = args["vaccine_name"]
+    if args.get("name"):
+        # Anchored, case-sensitive prefix so an index on username can be used
+        query["username"] = {"$regex": "^" + re.escape(args["name"])}
+    return query
+
+
+def keyset_query(query, after=None):
+    """Restrict `query` to documents strictly after the `after` cursor."""
+    if after is None:
+        return query
+    return {**query, "_id": {"$gt": after}}
+
+
+def split_page(docs, limit):
+    """Trim a `limit + 1` fetch to one page and work out the next cursor (None on the last page)."""
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, str(docs[-1]["_id"])
+    return docs, None
+
+
+def keyset_page(collection, query, projection, limit, after=None):
+    """
+    Fetch one page ordered by `_id`, starting strictly after the `after` cursor.
+    Returns the documents and the cursor for the next page (or None on the last page).
+    """
+    cursor = collection.find(keyset_query(query, after), projection).sort("_id", 1).limit(limit + 1)
+    return split_page(list(cursor), limit)
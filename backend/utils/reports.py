@@ -0,0 +1,160 @@
+import csv
+import io
+from datetime import date, datetime
+from importlib.util import find_spec
+from repositories import store
+
+# openpyxl and reportlab are optional (see requirements-reports.txt) and slow to import,
+# so they are only imported by the writers that need them, never at app startup
+OPTIONAL_LIBRARIES = {"xlsx": "openpyxl", "pdf": "reportlab"}
+
+# (field, column heading, PDF column offset in points)
+COLUMNS = [
+    ("student_id", "Student ID", 0),
+    ("username", "Name", 80),
+    ("class_grade", "Class", 280),
+    ("is_vaccinated", "Vaccinated", 330),
+    ("vaccine_name", "Vaccine", 400),
+    ("date_of_vaccination", "Date of vaccination", 560),
+]
+REPORT_PROJECTION = {"_id": 0, **{field: 1 for field, _, _ in COLUMNS}}
+BATCH_SIZE = 1000
+CSV_FLUSH_ROWS = 500
+# Spreadsheets run a cell starting with one of these as a formula (CSV/formula injection)
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+class ReportError(Exception):
+    """Raised when a report format can't be produced (e.g. its optional library is missing)."""
+
+
+def report_rows(filters):
+    """Students matching the list filters in `_id` order, fetched in batches so only one batch is held at a time."""
+    return store.iter_students(filters, REPORT_PROJECTION, batch_size=BATCH_SIZE)
+
+
+def cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)
+
+
+def rows(students):
+    for student in students:
+        yield [cell(student.get(field)) for field, _, _ in COLUMNS]
+
+
+def spreadsheet_safe(value):
+    """Prefix a cell a spreadsheet would evaluate with ' so it is shown as text."""
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def spreadsheet_rows(students):
+    for row in rows(students):
+        yield [spreadsheet_safe(value) for value in row]
+
+
+def iter_csv(students, progress=None):
+    """Yield the CSV in chunks of CSV_FLUSH_ROWS rows, straight off the cursor."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([heading for _, heading, _ in COLUMNS])
+    count = 0
+    for row in spreadsheet_rows(students):
+        writer.writerow(row)
+        count += 1
+        if count % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            if progress:
+                progress(count)
+    yield buffer.getvalue()
+    if progress:
+        progress(count)
+
+
+def write_csv(students, fileobj, progress=None):
+    for chunk in iter_csv(students, progress):
+        fileobj.write(chunk.encode())
+
+
+def write_xlsx(students, fileobj, progress=None):
+    """Write-only workbooks stream rows to a temp file instead of keeping them in memory."""
+    check_format("xlsx")
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Vaccinations")
+    sheet.append([heading for _, heading, _ in COLUMNS])
+    count = 0
+    for row in spreadsheet_rows(students):
+        sheet.append(row)
+        count += 1
+        if progress and count % BATCH_SIZE == 0:
+            progress(count)
+    workbook.save(fileobj)
+    if progress:
+        progress(count)
+
+
+def write_pdf(students, fileobj, progress=None, rows_per_page=40):
+    """
+    Draw the table one page at a time. reportlab keeps every finished page, compressed, in
+    memory until save() writes the document, so memory grows with the page count; that is
+    why large PDF exports run as background jobs (REPORT_INLINE_ROWS).
+    """
+    check_format("pdf")
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.pdfgen import canvas
+
+    width, height = landscape(A4)
+    pdf = canvas.Canvas(fileobj, pagesize=(width, height), pageCompression=1)
+    pdf.setTitle("Vaccination report")
+    margin, line_height = 36, 12
+
+    def header(page):
+        pdf.setFont("Helvetica-Bold", 9)
+        for _, heading, offset in COLUMNS:
+            pdf.drawString(margin + offset, height - margin, heading)
+        pdf.setFont("Helvetica", 8)
+        pdf.drawRightString(width - margin, margin / 2, f"Page {page}")
+
+    page, on_page, count = 1, 0, 0
+    header(page)
+    for row in rows(students):
+        if on_page == rows_per_page:
+            pdf.showPage()
+            page += 1
+            on_page = 0
+            header(page)
+            if progress:
+                progress(count)
+        y = height - margin - line_height * (on_page + 2)
+        for (_, _, offset), value in zip(COLUMNS, row):
+            pdf.drawString(margin + offset, y, value[:40])
+        on_page += 1
+        count += 1
+    pdf.save()
+    if progress:
+        progress(count)
+
+
+# format -> (writer, mimetype, extension)
+FORMATS = {
+    "csv": (write_csv, "text/csv", "csv"),
+    "xlsx": (write_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "pdf": (write_pdf, "application/pdf", "pdf"),
+}
+
+
+def check_format(fmt):
+    if fmt not in FORMATS:
+        raise ReportError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}")
+    library = OPTIONAL_LIBRARIES.get(fmt)
+    if library and find_spec(library) is None:
+        raise ReportError(f"{fmt.upper()} export requires {library}")
@@ -0,0 +1,120 @@
+import gzip
+import hashlib
+import threading
+import time
+from functools import wraps
+from bson.objectid import ObjectId
+from flask import Response, make_response, request
+from repositories import store
+from utils.cache import TTLCache
+
+DRIVES = "vaccination_drives"
+STUDENTS = "students"
+
+# Serialized GET bodies keyed by (revision, request); entries of old revisions are never hit again and age out
+response_cache = TTLCache("responses", ttl=300, maxsize=128)
+
+# How long a process trusts the revision it last saw before re-reading it from the store (REVISION_CHECK_INTERVAL)
+settings = {"check_interval": 1.0}
+_known = {}  # collection -> (revision, monotonic time it was read or bumped)
+_lock = threading.Lock()
+
+
+def init_app(app):
+    settings["check_interval"] = app.config["REVISION_CHECK_INTERVAL"]
+
+
+def _remember(collection, revision):
+    with _lock:
+        _known[collection] = (revision, time.monotonic())
+
+
+def bump(collection):
+    """
+    Give the collection a new revision after a write. Revisions are fresh ObjectIds rather
+    than a counter, so an ETag can never be reused even if the database is rebuilt.
+    """
+    revision = str(ObjectId())
+    store.write_revision(collection, revision)
+    _remember(collection, revision)
+    return revision
+
+
+def cached_revision(collection):
+    """The revision this process saw within the last check interval, or None; never queries the store."""
+    with _lock:
+        known = _known.get(collection)
+    if known and time.monotonic() - known[1] < settings["check_interval"]:
+        return known[0]
+    return None
+
+
+def current(collection):
+    revision = cached_revision(collection)
+    if revision is None:
+        revision = store.read_revision(collection)
+        if revision is None:
+            return bump(collection)
+        _remember(collection, revision)
+    return revision
+
+
+def request_key(endpoint, view_args, args):
+    """Endpoint, URL parameters and query parameters, independent of their order."""
+    return endpoint, tuple(sorted((view_args or {}).items())), tuple(sorted(args))
+
+
+def etag(revision, key, encoding=None):
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return f"{revision}-{digest}-{encoding}" if encoding else f"{revision}-{digest}"
+
+
+def matches(if_none_match, tag):
+    """If-None-Match uses the weak comparison, so W/"tag" matches too."""
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or f'"{tag}"' in candidates
+
+
+def representation(body, mimetype):
+    """The body in both encodings, so it is compressed once rather than per response."""
+    return {"body": body, "gzip": gzip.compress(body, compresslevel=6, mtime=0), "mimetype": mimetype}
+
+
+def validator_headers(tag):
+    # no-cache: clients may keep the body but must revalidate it, which costs them a 304
+    return {"ETag": f'"{tag}"', "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+
+
+def conditional(*collections):
+    """
+    Serve a GET view with a strong ETag derived from the revisions of the collections it reads. A matching
+    If-None-Match gets a 304 before the view runs, and the view's 200 body is cached per
+    revision and query parameters, already gzipped for clients that accept it.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            revision = ".".join(current(collection) for collection in collections)
+            key = request_key(request.endpoint, request.view_args, request.args.items(multi=True))
+            use_gzip = "gzip" in request.accept_encodings
+            tag = etag(revision, key, "gzip" if use_gzip else None)
+            headers = validator_headers(tag)
+            if matches(request.headers.get("If-None-Match"), tag):
+                return Response(status=304, headers=headers)
+
+            entry = response_cache.get((revision, key))
+            if entry is None:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = representation(response.get_data(), response.mimetype)
+                response_cache.set((revision, key), entry)
+            response = Response(entry["gzip"] if use_gzip else entry["body"], mimetype=entry["mimetype"],
+                                headers=headers)
+            if use_gzip:
+                response.headers["Content-Encoding"] = "gzip"
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,80 @@
+from utils.pagination import split_page
+
+# What a check-in screen shows per student; drive_id becomes the vaccinated_in_drive flag
+ROSTER_PROJECTION = {
+    "_id": 1,
+    "student_id": 1,
+    "username": 1,
+    "class_grade": 1,
+    "is_vaccinated": 1,
+    "vaccine_name": 1,
+    "date_of_vaccination": 1,
+    "drive_id": 1
+}
+ROSTER_DRIVE_PROJECTION = {"vaccine_name": 1, "date": 1, "available_doses": 1, "classes": 1, "is_completed": 1}
+
+
+def roster_pipeline(drive_id, query=None, limit=None):
+    """
+    One aggregation over vaccination_drives: the drive, then $lookup joins on its classes for
+    per-class counts and, when `query` is given, one page of its students in `_id` order.
+    Both joins match students on class_grade, so they use the class_grade_id index.
+    """
+    by_class = [{"$group": {
+        "_id": "$class_grade",
+        "eligible": {"$sum": 1},
+        "vaccinated": {"$sum": {"$cond": [{"$eq": ["$is_vaccinated", True]}, 1, 0]}},
+        "vaccinated_in_drive": {"$sum": {"$cond": [{"$eq": ["$drive_id", drive_id]}, 1, 0]}}
+    }}]
+    pipeline = [
+        {"$match": {"_id": drive_id}},
+        {"$project": ROSTER_DRIVE_PROJECTION},
+        {"$lookup": {"from": "students", "localField": "classes", "foreignField": "class_grade",
+                     "pipeline": by_class, "as": "by_class"}},
+    ]
+    if query is not None:
+        page = [{"$match": query}, {"$sort": {"_id": 1}}, {"$limit": limit + 1}, {"$project": ROSTER_PROJECTION}]
+        pipeline.append({"$lookup": {"from": "students", "localField": "classes", "foreignField": "class_grade",
+                                     "pipeline": page, "as": "students"}})
+    return pipeline
+
+
+def shape_roster(drive, groups, students=None, limit=None):
+    """
+    The roster response from the drive, its per-class counts (`_id` = class_grade) and a
+    `limit + 1` fetch of students. Doses are projected onto classes in the drive's order,
+    so a class's dose_shortfall is how many of its unvaccinated students the doses left
+    after the earlier classes would not cover. A completed drive gives no more doses.
+    """
+    counts = {group["_id"]: group for group in groups}
+    doses_left = 0 if drive.get("is_completed") else max(drive.get("available_doses") or 0, 0)
+    classes = []
+    for class_grade in drive.get("classes", []):
+        group = counts.get(class_grade, {})
+        unvaccinated = group.get("eligible", 0) - group.get("vaccinated", 0)
+        covered = min(unvaccinated, doses_left)
+        doses_left -= covered
+        classes.append({
+            "class_grade": class_grade,
+            "eligible": group.get("eligible", 0),
+            "vaccinated": group.get("vaccinated", 0),
+            "vaccinated_in_drive": group.get("vaccinated_in_drive", 0),
+            "unvaccinated": unvaccinated,
+            "dose_shortfall": unvaccinated - covered
+        })
+    roster = {
+        "drive": drive,
+        "eligible": sum(entry["eligible"] for entry in classes),
+        "vaccinated": sum(entry["vaccinated"] for entry in classes),
+        "vaccinated_in_drive": sum(entry["vaccinated_in_drive"] for entry in classes),
+        "unvaccinated": sum(entry["unvaccinated"] for entry in classes),
+        "dose_shortfall": sum(entry["dose_shortfall"] for entry in classes),
+        "classes": classes
+    }
+    if students is not None:
+        page, next_cursor = split_page(students, limit)
+        for student in page:
+            student["vaccinated_in_drive"] = student.pop("drive_id", None) == drive["_id"]
+        roster["students"] = page
+        roster["next_cursor"] = next_cursor
+    return roster
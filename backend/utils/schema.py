@@ -0,0 +1,156 @@
+from datetime import datetime
+from pymongo import UpdateOne
+
+DATE_FORMAT = "%Y-%m-%d"
+
+# registered_students can grow to a whole school, so listings leave it out
+DRIVE_PROJECTION = {
+    "_id": 1,
+    "vaccine_name": 1,
+    "date": 1,
+    "available_doses": 1,
+    "classes": 1,
+    "is_completed": 1
+}
+
+
+class SchemaError(ValueError):
+    """Raised when a write doesn't fit the canonical document schema."""
+
+
+def parse_date(value):
+    """Canonical dates are BSON dates (naive UTC datetimes) at midnight."""
+    if isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, str) and value.strip():
+        try:
+            # Accept plain dates and the ISO timestamps older documents/clients carry
+            return datetime.strptime(value.strip()[:10], DATE_FORMAT)
+        except ValueError:
+            pass
+    raise SchemaError("Invalid date format. Use YYYY-MM-DD")
+
+
+def parse_classes(value):
+    """Canonical classes are a list of trimmed, unique, non-empty strings."""
+    if isinstance(value, str):
+        value = value.strip().strip("[]").split(",")
+    if not isinstance(value, (list, tuple)):
+        raise SchemaError("classes must be a comma-separated string or a list")
+    classes = []
+    for item in value:
+        item = str(item).strip().strip("'\"").strip()
+        if item and item not in classes:
+            classes.append(item)
+    return classes
+
+
+def search_name(username):
+    """The case-insensitive form of a student's name that prefix search runs against."""
+    return " ".join(str(username).split()).casefold()
+
+
+def normalize_drive(data):
+    """Build the stored form of a drive from request or CSV data."""
+    try:
+        available_doses = int(data["available_doses"])
+    except (TypeError, ValueError):
+        raise SchemaError("available_doses must be an integer")
+    if available_doses < 0:
+        raise SchemaError("available_doses cannot be negative")
+    drive = {
+        "vaccine_name": str(data["vaccine_name"]).strip(),
+        "date": parse_date(data["date"]),
+        "available_doses": available_doses,
+        "classes": parse_classes(data["classes"]),
+    }
+    if "is_completed" in data:
+        value = data["is_completed"]
+        drive["is_completed"] = value.strip().lower() == "true" if isinstance(value, str) else bool(value)
+    return drive
+
+
+def _drive_changes(doc):
+    changes = {}
+    if doc.get("date") is not None:
+        try:
+            date = parse_date(doc["date"])
+        except SchemaError:
+            date = None  # Leave unparseable values for a human to fix
+        if date is not None and date != doc["date"]:
+            changes["date"] = date
+    if "classes" in doc:
+        try:
+            classes = parse_classes(doc["classes"])
+        except SchemaError:
+            classes = None
+        if classes is not None and classes != doc["classes"]:
+            changes["classes"] = classes
+    if "is_completed" not in doc:
+        changes["is_completed"] = False
+    return changes
+
+
+def _student_changes(doc):
+    value = doc.get("date_of_vaccination")
+    if value is None or isinstance(value, datetime):
+        return {}
+    if isinstance(value, str) and not value.strip():
+        return {"date_of_vaccination": None}
+    try:
+        return {"date_of_vaccination": parse_date(value)}
+    except SchemaError:
+        return {}
+
+
+def _search_name_changes(doc):
+    if doc.get("username") is None:
+        return {}
+    name = search_name(doc["username"])
+    return {"username_lower": name} if doc.get("username_lower") != name else {}
+
+
+def backfill(db, collection, changes_for, projection, batch_size=500, name=None):
+    """
+    Rewrite `collection` into canonical form in `_id` order, one unordered bulk_write
+    per batch. Progress is checkpointed after every batch so an interrupted run picks
+    up where it stopped, and each update is conditional on the values it read, so
+    concurrent writes from the API are never clobbered.
+    """
+    checkpoint_id = f"checkpoint:{name or collection}"
+    checkpoint = db.migrations.find_one({"_id": checkpoint_id}) or {}
+    last_id = checkpoint.get("last_id")
+    updated = checkpoint.get("updated", 0)
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(db[collection].find(query, projection).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        operations = []
+        for doc in batch:
+            changes = changes_for(doc)
+            if changes:
+                expected = {field: doc.get(field) for field in changes}
+                operations.append(UpdateOne({"_id": doc["_id"], **expected}, {"$set": changes}))
+        if operations:
+            updated += db[collection].bulk_write(operations, ordered=False).modified_count
+        last_id = batch[-1]["_id"]
+        db.migrations.update_one(
+            {"_id": checkpoint_id},
+            {"$set": {"last_id": last_id, "updated": updated}},
+            upsert=True
+        )
+    return updated
+
+
+def backfill_drives(db, batch_size=500):
+    return backfill(db, "vaccination_drives", _drive_changes, {"date": 1, "classes": 1, "is_completed": 1}, batch_size)
+
+
+def backfill_students(db, batch_size=500):
+    return backfill(db, "students", _student_changes, {"date_of_vaccination": 1}, batch_size)
+
+
+def backfill_search_names(db, batch_size=500):
+    return backfill(db, "students", _search_name_changes, {"username": 1, "username_lower": 1}, batch_size,
+                    name="students.username_lower")
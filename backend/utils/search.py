@@ -0,0 +1,106 @@
+import base64
+import re
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from utils.pagination import QueryError, parse_bool, parse_limit
+from utils.schema import SchemaError, parse_date, search_name
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Results come back in (username_lower, _id) order, which both indexes below serve directly:
+# an exact name match sorts before every longer name sharing the prefix, so it ranks first.
+SEARCH_SORT = [("username_lower", 1), ("_id", 1)]
+
+
+def encode_cursor(doc):
+    """Opaque cursor for the sort position of `doc`."""
+    raw = f"{doc['_id']}:{doc.get('username_lower', '')}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def parse_cursor(value, parse_id=ObjectId):
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+        _id, name = raw.split(":", 1)
+        return name, parse_id(_id)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        raise QueryError("Invalid cursor")
+
+
+def search_filter(args):
+    """
+    Build the students filter for /students/search:
+    `q` is a case-insensitive name prefix, `student_id` an exact lookup, and
+    `class_grade`, `is_vaccinated`, `vaccinated_from`/`vaccinated_to` narrow either.
+    """
+    query = {}
+    if args.get("q"):
+        # Anchored prefix on the normalized field, so the planner gets tight index bounds
+        query["username_lower"] = {"$regex": "^" + re.escape(search_name(args["q"]))}
+    if args.get("student_id"):
+        query["student_id"] = args["student_id"].strip()
+    if args.get("class_grade"):
+        query["class_grade"] = args["class_grade"]
+    is_vaccinated = parse_bool(args.get("is_vaccinated"))
+    if is_vaccinated is not None:
+        query["is_vaccinated"] = is_vaccinated
+    dates = {}
+    try:
+        if args.get("vaccinated_from"):
+            dates["$gte"] = parse_date(args["vaccinated_from"])
+        if args.get("vaccinated_to"):
+            dates["$lte"] = parse_date(args["vaccinated_to"])  # Stored dates are midnight, so this is inclusive
+    except SchemaError as e:
+        raise QueryError(str(e))
+    if dates:
+        query["date_of_vaccination"] = dates
+    if not query:
+        raise QueryError("Provide q, student_id or at least one filter")
+    return query
+
+
+def after_position(query, position):
+    """Restrict `query` to documents sorting strictly after `position` in SEARCH_SORT order."""
+    if position is None:
+        return query
+    name, _id = position
+    return {"$and": [query, {"$or": [
+        {"username_lower": {"$gt": name}},
+        {"username_lower": name, "_id": {"$gt": _id}}
+    ]}]}
+
+
+def search_query(args, parse_id=ObjectId):
+    """The filter (already past the `after` cursor) and page size of one search request."""
+    limit = parse_limit(args.get("limit"), default=DEFAULT_SEARCH_LIMIT, maximum=MAX_SEARCH_LIMIT)
+    return after_position(search_filter(args), parse_cursor(args.get("after"), parse_id)), limit
+
+
+def rank_page(students, args, limit):
+    """
+    Trim a `limit + 1` fetch in SEARCH_SORT order (with username_lower) to one page of
+    ranked students and the cursor for the next page (or None on the last page).
+    """
+    next_cursor = encode_cursor(students[limit - 1]) if len(students) > limit else None
+    students = students[:limit]
+    exact = search_name(args["q"]) if args.get("q") else None
+    for student in students:
+        name = student.pop("username_lower", None)
+        if exact is not None:
+            student["match"] = "exact" if name == exact else "prefix"
+    return students, next_cursor
+
+
+def search_students(collection, args, projection, max_time_ms=None):
+    """
+    Run one page of a student search. Returns the ranked students and the cursor for
+    the next page (or None on the last page).
+    """
+    query, limit = search_query(args)
+    cursor = collection.find(query, {**projection, "username_lower": 1}).sort(SEARCH_SORT).limit(limit + 1)
+    if max_time_ms:
+        cursor = cursor.max_time_ms(max_time_ms)
+    return rank_page(list(cursor), args, limit)
@@ -0,0 +1,58 @@
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional, the stdlib encoder is the fallback
+    orjson = None
+
+
+def default(value):
+    """Encode the BSON values Mongo documents carry, so documents go out straight from the cursor."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson:
+    def dumps_bytes(obj):
+        # orjson encodes datetime/date natively (RFC 3339, same as isoformat)
+        return orjson.dumps(obj, default=default)
+
+    loads = orjson.loads
+else:
+    def dumps_bytes(obj):
+        return json.dumps(obj, default=default, separators=(",", ":")).encode()
+
+    loads = json.loads
+
+
+def dumps(obj):
+    return dumps_bytes(obj).decode()
+
+
+class MongoJSONProvider(JSONProvider):
+    """Flask JSON provider that encodes ObjectId, datetime and other BSON types without a Python pre-pass."""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
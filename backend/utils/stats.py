@@ -0,0 +1,153 @@
+from collections import Counter
+from datetime import datetime
+from urllib.parse import quote, unquote
+from db import mongo
+
+STUDENTS = "students"
+
+
+def _key(value):
+    # Class grades and vaccine names become field names; keep "." and "$" out of the path
+    return quote(str(value), safe=" ").replace(".", "%2E")
+
+
+def student_counts(student):
+    """The counter contributions of a single student document."""
+    if not student:
+        return Counter()
+    vaccinated = 1 if student.get("is_vaccinated") else 0
+    counts = Counter({"total": 1, "vaccinated": vaccinated})
+    if student.get("class_grade"):
+        grade = _key(student["class_grade"])
+        counts[f"by_class.{grade}.total"] += 1
+        counts[f"by_class.{grade}.vaccinated"] += vaccinated
+    if vaccinated and student.get("vaccine_name"):
+        counts[f"by_vaccine.{_key(student['vaccine_name'])}"] += 1
+    return counts
+
+
+def _db(db):
+    # pymongo Database objects don't support truth-value testing
+    return mongo.db if db is None else db
+
+
+def _apply(increments, db=None):
+    increments = {path: value for path, value in increments.items() if value}
+    if increments:
+        _db(db).stats.update_one({"_id": STUDENTS}, {"$inc": increments}, upsert=True)
+
+
+def record_change(before, after, db=None):
+    """Apply the difference between two versions of a student (either may be None)."""
+    increments = Counter(student_counts(after))
+    increments.subtract(student_counts(before))
+    _apply(increments, db)
+
+
+def record_changes(pairs, db=None):
+    """record_change for many (before, after) pairs with a single update."""
+    increments = Counter()
+    for before, after in pairs:
+        increments.update(student_counts(after))
+        increments.subtract(student_counts(before))
+    _apply(increments, db)
+
+
+def record_inserted(students, db=None):
+    increments = Counter()
+    for student in students:
+        increments.update(student_counts(student))
+    _apply(increments, db)
+
+
+def count_groups(groups):
+    """Counters from (fields, count) pairs of students grouped by class, vaccine and status."""
+    counts = Counter()
+    for group, count in groups:
+        group = {key: value for key, value in group.items() if value is not None}
+        for path, value in student_counts(group).items():
+            counts[path] += value * count
+    return counts
+
+
+def compute_counts(db):
+    """Recount every student from scratch with one aggregation."""
+    pipeline = [{"$group": {
+        "_id": {"class_grade": "$class_grade", "vaccine_name": "$vaccine_name", "is_vaccinated": "$is_vaccinated"},
+        "count": {"$sum": 1}
+    }}]
+    return count_groups((row["_id"], row["count"]) for row in db.students.aggregate(pipeline))
+
+
+def nest(counts):
+    """The counters document (as stored in stats) for flat counter paths."""
+    document = {"total": 0, "vaccinated": 0, "by_class": {}, "by_vaccine": {}}
+    for path, value in counts.items():
+        target = document
+        *parents, leaf = path.split(".")
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = value
+    return document
+
+
+def _flatten(doc, prefix=""):
+    for key, value in doc.items():
+        if key in ("_id", "rebuilt_at"):
+            continue
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def reconcile(db=None):
+    """
+    Recount the students and return the drift (stored minus actual) for every counter
+    that was wrong. The drift is taken off with $inc rather than by replacing the
+    document, so increments that land after the stored counters were read are kept;
+    a write in flight between the count and that read may still leave one counter off.
+    """
+    db = _db(db)
+    actual = compute_counts(db)
+    stored = dict(_flatten(db.stats.find_one({"_id": STUDENTS}) or {}))
+    drift = {
+        path: stored.get(path, 0) - actual.get(path, 0)
+        for path in set(stored) | set(actual)
+        if stored.get(path, 0) != actual.get(path, 0)
+    }
+    update = {"$set": {"rebuilt_at": datetime.utcnow()}}
+    if drift:
+        update["$inc"] = {path: -delta for path, delta in drift.items()}
+    db.stats.update_one({"_id": STUDENTS}, update, upsert=True)
+    return drift
+
+
+def shape(doc):
+    """Turn the stored counters document into the totals and breakdown lists."""
+    by_class = [
+        {"class_grade": unquote(grade), "total": counts.get("total", 0), "vaccinated": counts.get("vaccinated", 0)}
+        for grade, counts in sorted(doc.get("by_class", {}).items())
+        if counts.get("total")
+    ]
+    by_vaccine = [
+        {"vaccine_name": unquote(name), "vaccinated": count}
+        for name, count in sorted(doc.get("by_vaccine", {}).items())
+        if count
+    ]
+    return {
+        "total": doc.get("total", 0),
+        "vaccinated": doc.get("vaccinated", 0),
+        "by_class": by_class,
+        "by_vaccine": by_vaccine,
+    }
+
+
+def read(db=None):
+    """O(1) read of the running totals, rebuilding them first if they don't exist yet."""
+    db = _db(db)
+    doc = db.stats.find_one({"_id": STUDENTS})
+    if doc is None:
+        reconcile(db)
+        doc = db.stats.find_one({"_id": STUDENTS})
+    return shape(doc)
@@ -0,0 +1,344 @@
+import hashlib
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from db import mongo
+from utils import analytics, revisions, stats
+from utils.schema import parse_date
+
+
+class VaccinationError(Exception):
+    def __init__(self, msg, status=400, outcome="not_eligible"):
+        super().__init__(msg)
+        self.msg = msg
+        self.status = status
+        self.outcome = outcome
+
+
+def _explain_rejection(drive_id, student):
+    """Work out why the conditional dose reservation matched nothing."""
+    drive = mongo.db.vaccination_drives.find_one(
+        {"_id": drive_id},
+        {"is_completed": 1, "classes": 1, "available_doses": 1, "registered_students": 1}
+    )
+    if not drive:
+        return VaccinationError("Drive not found", 404, "not_found")
+    if drive.get("is_completed"):
+        return VaccinationError("Drive is already completed")
+    if student["class_grade"] not in drive.get("classes", []):
+        return VaccinationError("Student's class is not covered by this drive")
+    if str(student["_id"]) in drive.get("registered_students", []):
+        return VaccinationError("Student is already registered for this drive", outcome="already_vaccinated")
+    return VaccinationError("No doses left for this drive", 409, "no_doses")
+
+
+def reserve_dose(drive_id, student):
+    """
+    Atomically take one dose from the drive and register the student, but only if
+    the drive is open, covers the student's class and still has doses.
+    """
+    drive = mongo.db.vaccination_drives.find_one_and_update(
+        {
+            "_id": drive_id,
+            "is_completed": {"$ne": True},
+            "available_doses": {"$gt": 0},
+            "classes": student["class_grade"],
+            "registered_students": {"$ne": str(student["_id"])}
+        },
+        {
+            "$inc": {"available_doses": -1},
+            "$push": {"registered_students": str(student["_id"])}
+        },
+        projection={"vaccine_name": 1, "available_doses": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not drive:
+        raise _explain_rejection(drive_id, student)
+    return drive
+
+
+def release_dose(drive_id, student):
+    mongo.db.vaccination_drives.update_one(
+        {"_id": drive_id, "registered_students": str(student["_id"])},
+        {"$inc": {"available_doses": 1}, "$pull": {"registered_students": str(student["_id"])}}
+    )
+    revisions.bump(revisions.DRIVES)
+
+
+def vaccinate_with_drive(drive_id, student, date_of_vaccination=None):
+    """
+    Vaccinate one student from a drive's stock. The dose is reserved first and
+    handed back if another request vaccinated the student in the meantime.
+    """
+    if student.get("is_vaccinated"):
+        raise VaccinationError("Already vaccinated", outcome="already_vaccinated")
+    drive = reserve_dose(drive_id, student)
+    changes = {
+        "is_vaccinated": True,
+        "vaccine_name": drive["vaccine_name"],
+        "date_of_vaccination": date_of_vaccination or parse_date(datetime.now()),
+        "drive_id": drive_id
+    }
+    result = mongo.db.students.update_one({"_id": student["_id"], "is_vaccinated": {"$ne": True}}, {"$set": changes})
+    if result.modified_count == 0:
+        release_dose(drive_id, student)
+        raise VaccinationError("Already vaccinated", outcome="already_vaccinated")
+    stats.record_change(student, {**student, **changes})
+    analytics.invalidate()
+    revisions.bump(revisions.DRIVES)
+    return drive
+
+
+def complete_past_drives():
+    """Mark every open drive dated before today as completed, in one update_many."""
+    today = parse_date(datetime.now())
+    result = mongo.db.vaccination_drives.update_many(
+        {"is_completed": False, "date": {"$lt": today}},
+        {"$set": {"is_completed": True}}
+    )
+    if result.modified_count:
+        analytics.invalidate()
+        revisions.bump(revisions.DRIVES)
+    return result.modified_count
+
+
+MAX_BATCH_SIZE = 1000
+# A claimed batch whose request never finished (worker killed) may be retried after this long
+STALE_BATCH_SECONDS = 600
+
+
+def batch_fingerprint(refs, date_of_vaccination):
+    payload = "\n".join(sorted(set(refs))) + f"\n{date_of_vaccination}"
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def claim_batch(drive_id, batch_key, fingerprint):
+    """
+    Claim a client batch key for this drive. Returns None once claimed, or the stored
+    response of a batch that already finished, so a retried request is answered
+    without vaccinating anyone twice.
+    """
+    batch_id = f"{drive_id}:{batch_key}"
+    now = datetime.utcnow()
+    try:
+        mongo.db.vaccination_batches.insert_one(
+            {"_id": batch_id, "fingerprint": fingerprint, "status": "running", "created_at": now}
+        )
+        return None
+    except DuplicateKeyError:
+        pass
+    batch = mongo.db.vaccination_batches.find_one({"_id": batch_id})
+    if batch is None:
+        return claim_batch(drive_id, batch_key, fingerprint)  # Expired in between
+    if batch["fingerprint"] != fingerprint:
+        raise VaccinationError("Batch key was already used for a different list of students", 409, "batch_conflict")
+    if batch["status"] == "done":
+        return batch["response"]
+    taken_over = mongo.db.vaccination_batches.find_one_and_update(
+        {"_id": batch_id, "status": "running", "created_at": {"$lt": now - timedelta(seconds=STALE_BATCH_SECONDS)}},
+        {"$set": {"created_at": now}}
+    )
+    if not taken_over:
+        raise VaccinationError("This batch is still being processed", 409, "batch_in_progress")
+    return None
+
+
+def finish_batch(drive_id, batch_key, response):
+    mongo.db.vaccination_batches.update_one(
+        {"_id": f"{drive_id}:{batch_key}"},
+        {"$set": {"status": "done", "response": response, "finished_at": datetime.utcnow()}}
+    )
+
+
+def abandon_batch(drive_id, batch_key):
+    """Forget a claim whose request failed, so the client can simply retry it."""
+    mongo.db.vaccination_batches.delete_one({"_id": f"{drive_id}:{batch_key}", "status": "running"})
+
+
+def resolve_students(refs):
+    """Map each reference (a student_id code or a student _id) to its student, with one query."""
+    object_ids = [ObjectId(ref) for ref in refs if ObjectId.is_valid(ref)]
+    students = mongo.db.students.find(
+        {"$or": [{"_id": {"$in": object_ids}}, {"student_id": {"$in": list(refs)}}]},
+        {"_id": 1, "student_id": 1, "class_grade": 1, "is_vaccinated": 1, "vaccine_name": 1}
+    )
+    return match_refs(refs, students)
+
+
+def match_refs(refs, students):
+    """
+    {ref: student} for the references that name one of `students`. A ref is a student_id code
+    first; only a ref that is no student's code is taken as an internal _id, so one ref never
+    names two students.
+    """
+    by_code, by_id = {}, {}
+    for student in students:
+        by_id[str(student["_id"])] = student
+        if student.get("student_id") is not None:
+            by_code[student["student_id"]] = student
+    resolved = {}
+    for ref in refs:
+        student = by_code.get(ref) or by_id.get(ref)
+        if student is not None:
+            resolved[ref] = student
+    return resolved
+
+
+def check_eligibility(students, drive):
+    """
+    Sort the resolved students of a batch into those the drive may vaccinate (their
+    str(_id)s, in order) and outcomes for the rest: {str(_id): (outcome, msg) or None}.
+    """
+    outcomes = {}
+    candidates = []
+    for student in students.values():
+        key = str(student["_id"])
+        if key in outcomes:
+            continue
+        if student.get("is_vaccinated"):
+            outcomes[key] = ("already_vaccinated", "Already vaccinated")
+        elif drive.get("is_completed"):
+            outcomes[key] = ("not_eligible", "Drive is already completed")
+        elif student.get("class_grade") not in drive.get("classes", []):
+            outcomes[key] = ("not_eligible", "Student's class is not covered by this drive")
+        else:
+            outcomes[key] = None
+            candidates.append(key)
+    return outcomes, candidates
+
+
+def batch_results(refs, students, outcomes):
+    """A result per reference, in request order."""
+    results = []
+    for ref in refs:
+        student = students.get(ref)
+        if student is None:
+            results.append({"ref": ref, "outcome": "not_found", "msg": "Student not found"})
+            continue
+        outcome, msg = outcomes[str(student["_id"])]
+        result = {"ref": ref, "_id": student["_id"], "student_id": student.get("student_id"), "outcome": outcome}
+        if msg:
+            result["msg"] = msg
+        results.append(result)
+    return results
+
+
+def reserve_doses(drive, student_ids, attempts=5):
+    """
+    Take one dose per student from the drive in a single atomic update, for as many of
+    them as the stock allows. Returns (ids that got a dose, ids already registered, drive
+    after the update or None); a concurrent change to the drive means re-reading it and retrying.
+    """
+    wanted, registered = list(student_ids), []
+    for _ in range(attempts):
+        count = min(len(wanted), drive.get("available_doses", 0))
+        if count <= 0 or drive.get("is_completed"):
+            return [], registered, None
+        taken = wanted[:count]
+        updated = mongo.db.vaccination_drives.find_one_and_update(
+            {
+                "_id": drive["_id"],
+                "is_completed": {"$ne": True},
+                "available_doses": {"$gte": count},
+                "registered_students": {"$nin": taken}
+            },
+            {"$inc": {"available_doses": -count}, "$push": {"registered_students": {"$each": taken}}},
+            projection={"vaccine_name": 1, "available_doses": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated:
+            return taken, registered, updated
+        drive = mongo.db.vaccination_drives.find_one(
+            {"_id": drive["_id"]}, {"is_completed": 1, "available_doses": 1, "registered_students": 1}
+        )
+        if not drive:
+            raise VaccinationError("Drive not found", 404, "not_found")
+        already = set(drive.pop("registered_students", [])) & set(wanted)
+        registered += [student_id for student_id in wanted if student_id in already]
+        wanted = [student_id for student_id in wanted if student_id not in already]
+    raise VaccinationError("The drive is changing too fast, please retry", 409, "conflict")
+
+
+def vaccinated_by(drive_id, keys):
+    """The str(_id)s among `keys` of students recorded as vaccinated by the drive."""
+    return {str(doc["_id"]) for doc in mongo.db.students.find(
+        {"_id": {"$in": [ObjectId(key) for key in keys]}, "drive_id": drive_id}, {"_id": 1}
+    )}
+
+
+def release_doses(drive_id, keys):
+    """Give back the doses reserve_doses took for the students `keys`."""
+    if keys:
+        mongo.db.vaccination_drives.update_one(
+            {"_id": drive_id},
+            {"$inc": {"available_doses": len(keys)}, "$pullAll": {"registered_students": keys}}
+        )
+
+
+def vaccinate_batch(drive_id, refs, date_of_vaccination=None):
+    """
+    Vaccinate a list of students from one drive: one query resolves and checks them all,
+    one update reserves their doses and one update_many records the vaccinations.
+    Returns a result per reference, in request order.
+    """
+    drive = mongo.db.vaccination_drives.find_one(
+        {"_id": drive_id}, {"vaccine_name": 1, "classes": 1, "is_completed": 1, "available_doses": 1}
+    )
+    if not drive:
+        raise VaccinationError("Drive not found", 404, "not_found")
+    students = resolve_students(refs)
+
+    outcomes, candidates = check_eligibility(students, drive)
+
+    taken, registered, updated = reserve_doses(drive, candidates) if candidates else ([], [], None)
+    for key in registered:
+        outcomes[key] = ("already_vaccinated", "Student is already registered for this drive")
+    for key in candidates:
+        if outcomes[key] is None and key not in taken:
+            outcomes[key] = ("no_doses", "No doses left for this drive")
+
+    vaccinated = []
+    if taken:
+        changes = {
+            "is_vaccinated": True,
+            "vaccine_name": updated["vaccine_name"],
+            "date_of_vaccination": date_of_vaccination or parse_date(datetime.now()),
+            "drive_id": drive_id
+        }
+        try:
+            # Every student gets the same $set, so one update_many records the whole batch
+            mongo.db.students.update_many(
+                {"_id": {"$in": [ObjectId(key) for key in taken]}, "is_vaccinated": {"$ne": True}},
+                {"$set": changes}
+            )
+        except Exception:
+            # The doses are already reserved; hand back those of students the write didn't reach,
+            # or a retry of the batch would find them registered and the stock short
+            try:
+                applied = vaccinated_by(drive_id, taken)
+            except PyMongoError:
+                applied = set()
+            release_doses(drive_id, [key for key in taken if key not in applied])
+            if applied:
+                by_id = {str(student["_id"]): student for student in students.values()}
+                stats.record_changes((by_id[key], {**by_id[key], **changes}) for key in applied)
+                analytics.invalidate()
+            revisions.bump(revisions.DRIVES)
+            raise
+        # Students vaccinated by another request in the meantime hand their dose back
+        raced = set(taken) - vaccinated_by(drive_id, taken)
+        if raced:
+            release_doses(drive_id, list(raced))
+        by_id = {str(student["_id"]): student for student in students.values()}
+        for key in taken:
+            if key in raced:
+                outcomes[key] = ("already_vaccinated", "Already vaccinated")
+            else:
+                outcomes[key] = ("vaccinated", None)
+                vaccinated.append((by_id[key], {**by_id[key], **changes}))
+        stats.record_changes(vaccinated)
+        analytics.invalidate()
+        revisions.bump(revisions.DRIVES)
+
+    return batch_results(refs, students, outcomes), len(vaccinated)